@@ -1,23 +1,38 @@
 from flask_api import FlaskAPI
 from flask_cors import CORS
-from flask_sqlalchemy import SQLAlchemy
 from flask import request, jsonify, abort, make_response
 
 
 # local import
 from instance.config import app_config
+from .database import SQLAlchemy
+from .instrumentation import instrumentation
+from .mailer import mailer
+from .passwords import password_hasher
+from .query_audit import query_audit
+from .response_cache import response_cache
+from .revocation import revocation_cache
+from .token_cache import token_cache
 
 # initialize sql-alchemy
 db = SQLAlchemy()
 
 def create_app(config_name):
     from .models import Category, User, Recipe
+    from . import counters
     app = FlaskAPI(__name__, instance_relative_config=True)
     CORS(app)
     app.config.from_object(app_config[config_name])
     app.config.from_pyfile('config.py')
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
     db.init_app(app)
+    password_hasher.init_app(app)
+    revocation_cache.init_app(app)
+    token_cache.init_app(app)
+    response_cache.init_app(app)
+    mailer.init_app(app)
+    instrumentation.init_app(app)
+    query_audit.init_app(app)
 
     from .auth import auth_blueprint
     app.register_blueprint(auth_blueprint)
@@ -25,5 +40,7 @@ def create_app(config_name):
     app.register_blueprint(category)
     from .recipes import recipe
     app.register_blueprint(recipe)
+    from .cookbook import cookbook
+    app.register_blueprint(cookbook)
 
     return app
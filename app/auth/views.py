@@ -4,70 +4,56 @@ import datetime
 import re
 import jwt
 from flask.views import MethodView
-from flask import Flask, make_response, request, jsonify, json, abort
+from flask import make_response, request, jsonify, json, abort
+from app import repository
+from app.mailer import mailer
 from app.models import User, RevokedToken
-from flask_bcrypt import Bcrypt
-from flask_mail import Mail, Message
+from app.revocation import revocation_cache
+from flask_mail import Message
 from flasgger import swag_from
 
-app = Flask(__name__)
 
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.secret_key = os.environ.get('SECRET')
-app.config['MAIL_SERVER'] = 'smtp.gmail.com'
-app.config['MAIL_PORT'] = 465
-app.config['MAIL_USERNAME'] = os.environ.get('MAIL_USERNAME')
-app.config['MAIL_PASSWORD'] = os.environ.get('MAIL_PASSWORD')
-app.config['MAIL_USE_TLS'] = False
-app.config['MAIL_USE_SSL'] = True
-mail = Mail(app)
-
-recipients = []
 class RegistrationView(MethodView):
     """This class registers a new user."""
     @swag_from('/app/docs/register.yml')
     def post(self):
         """This route is for registering a user """
         try:
-            user = User.query.filter_by(email=request.data['email']).first()
-            if not user:
-                post_data = request.data
-                # Register the user
-                username = post_data['username'].strip()
-                email = post_data['email'].strip()
-                password = post_data['password'].strip()
-                if not username:
-                    return jsonify({"message": "username"
-                                    " required please"}), 401
-                
-                if not email:
-                    return jsonify({"message": "email"
-                                    " required please"}), 401
-                if not password:
-                    return jsonify({"message": "password"
-                                    " required please"}), 401
-                if not re.match("^[a-zA-Z0-9_.-]+$", username):
-                    return jsonify({'message':
-                                'Username should not have space, better user -'}), 400
-                if not re.match("[^@]+@[^@]+\.[^@]+", email):
-                    return jsonify({'message':
-                                'Invalid email format'}), 400
-                if not len(password) > 6:
-                    return jsonify({'message':' Ensure password is morethan 6 characters'}), 400
-                    
-                user = User(username=username, email=email, password=password)
-                user.save()
-                response = User.query.filter_by(email=email).first()
-                user_response ={}
-                user_response["id"] = response.id
-                user_response["username"] = response.username
-                return jsonify({'message': 'You registered'
-                                ' successfully. Please login.',
-                                'user': user_response }), 201
-                    
+            post_data = request.data
+            # Register the user
+            username = post_data['username'].strip()
+            email = post_data['email'].strip()
+            password = post_data['password'].strip()
+            if not username:
+                return jsonify({"message": "username"
+                                " required please"}), 401
+            
+            if not email:
+                return jsonify({"message": "email"
+                                " required please"}), 401
+            if not password:
+                return jsonify({"message": "password"
+                                " required please"}), 401
+            if not re.match("^[a-zA-Z0-9_.-]+$", username):
+                return jsonify({'message':
+                            'Username should not have space, better user -'}), 400
+            if not re.match("[^@]+@[^@]+\.[^@]+", email):
+                return jsonify({'message':
+                            'Invalid email format'}), 400
+            if not len(password) > 6:
+                return jsonify({'message':' Ensure password is morethan 6 characters'}), 400
                 
-            return jsonify({'message': 'User already exists.'
-                            ' Please login.'}), 409
+            # the unique email index decides whether the user exists
+            user_id = repository.create_user(username, email, password)
+            if user_id is None:
+                return jsonify({'message': 'User already exists.'
+                                ' Please login.'}), 409
+            user_response ={}
+            user_response["id"] = user_id
+            user_response["username"] = username
+            return jsonify({'message': 'You registered'
+                            ' successfully. Please login.',
+                            'user': user_response }), 201
         except Exception as e:  # pragma: no cover
             # An error occured, then return a message containing the error
             return jsonify({'message': 'Invalid data,'
@@ -89,6 +75,10 @@ class LoginView(MethodView):
             user = User.query.filter_by(email=request.data['email']).first()
             # Try to authenticate the found user using their password
             if user and user.password_is_valid(request.data['password']):
+                if user.password_needs_rehash():
+                    # the work factor changed since this hash was made
+                    user.set_password(request.data['password'])
+                    user.save()
                 # Generate the access token to be used as the header
                 access_token = user.generate_token(user.id)
                 if access_token:
@@ -136,7 +126,7 @@ class ResetPasswordView(MethodView):
                 return make_response(jsonify({'message': 'Password mismatch'})), 400
             user = User.query.filter_by(email=request.data['email']).first()
             if user:
-                user.password = Bcrypt().generate_password_hash(retyped_password).decode()
+                user.set_password(retyped_password)
                 user.save()
                 return make_response(jsonify({'message': 'Password resetting is successful'})), 200
             return make_response(jsonify({'message': 'User does not exist!'})), 404
@@ -163,12 +153,11 @@ class Send_reset_password_emailView(MethodView):
             datetime.timedelta(minutes=30))},
             os.getenv('SECRET', '$#%^%$^%@@@@@56634@@@'))
             subject = "Yummy Recipes Reset Password"
-            recipients.append(email)
-            msg = Message(subject, sender="Admin", recipients=recipients)
+            msg = Message(subject, recipients=[email])
             styles = "background-color:green; color:white; padding: 5px 10px; border-radius:3px; text-decoration: none;"
             msg.html = f"Click the link to reset password:\n \n<h3><a href='https://hadijahz-recipes-react.herokuapp.com/reset?tk={access_token.decode()}' style='{styles}'>Reset Password</a></h3>"
-            with app.app_context():
-                mail.send(msg)
+            # the worker delivers it, the request doesn't wait for smtp
+            mailer.send(msg)
             return make_response(jsonify({'message': 'Password Reset link sent successfully to '+email+''})), 201
         except Exception:
             return make_response(jsonify({'message': 'Invalid request sent.'})), 400
@@ -188,6 +177,7 @@ class Logout_view(MethodView):
             if isinstance(user_id, int):
                 revoked_token = RevokedToken(token=access_token)
                 revoked_token.save()
+                revocation_cache.maybe_prune()
                 return jsonify({'message': 'Your have been logged out.'}), 201
             else:
                 message = user_id
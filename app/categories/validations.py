@@ -1,5 +1,6 @@
-from flask import request, jsonify, make_response
+from flask import g, request, jsonify, make_response
 from functools import wraps
+from app.instrumentation import stage
 from app.models import User
 
 
@@ -38,8 +39,11 @@ def authentication(func):
             return jsonify({"message": "No token, please provide a token"}), 401
         access_token = auth_header.split(" ")[1]
         if access_token:
-            user_id = User.decode_token(access_token)
+            with stage('auth'):
+                user_id = User.decode_token(access_token)
             if not isinstance(user_id, str):
+                # lets database routing tell whose request wrote
+                g.user_id = user_id
                 return func(user_id,*args,**kwargs)
             return jsonify({'message': user_id}),401
     return auth
@@ -1,11 +1,39 @@
 import re
-from flask import request, jsonify, make_response, url_for
+from flask import request, jsonify, make_response
+from app import db, repository
 from app.models import Category, User
 from .import category
 from flasgger import swag_from
+from app.conditional import (collection_etag, is_not_modified, make_etag,
+                             not_modified, validator_headers)
+from app.links import link_builder
+from app.pagination import InvalidCursor, keyset_page, paginate, wants_count
+from app.response_cache import response_cache
+from app.search import search_categories
+from app.serializers import CATEGORY_PLAN, json_response
 from .validations import valid_category, is_valid, has_numbers, authentication
 
 
+def with_recipes_link(response, category_id):
+    """Adds the link to a category's recipes unless ?links=none"""
+    recipes_link = link_builder('recipe.get_recipes')
+    if recipes_link:
+        response['Recipes'] = recipes_link(id=category_id)
+    return response
+
+
+def category_rows(categories):
+    """Builds listing rows, resolving the recipes link once per page"""
+    recipes_link = link_builder('recipe.get_recipes')
+    results = []
+    for cat in categories:
+        row = {'cat': cat.category_json()}
+        if recipes_link:
+            row['Recipes'] = recipes_link(id=cat.id)
+        results.append(row)
+    return results
+
+
 @category.route('/api/v1/categories/', methods=['POST'])
 @authentication
 @swag_from('/app/docs/addcategories.yml')
@@ -19,25 +47,24 @@ def add_categories(user_id):
         if resultn:
             return jsonify(resultn), 400
         name = name.title()
-        result = Category.find_by_name(name, user_id)
-        if result:
+        try:
+            category_ = repository.create_category(user_id, name)
+        except repository.Conflict:
             return jsonify({"message": "Category already exists"}), 400
-        category_ = Category(name=name, created_by=user_id)
-        category_.save()
-        response1 = category_.category_json()
-        response = jsonify({
+        response_cache.bump(user_id)
+        response1 = CATEGORY_PLAN.dump(category_)
+        response = jsonify(with_recipes_link({
             'message': 'Category' + category_.name +
             'has been created',
-            'Recipes': url_for('recipe.get_recipes',
-                               id=category_.id,
-                               _external=True),
             'category': response1
-        })
+        }, category_.id))
         return make_response(response), 201
 
 
 @category.route('/api/v1/categories/', methods=['GET'])
 @authentication
+@response_cache.cached
+@db.read_only
 @swag_from('/app/docs/getcategories.yml')
 def get_categories(user_id):
     """This route handles getting categories"""
@@ -49,18 +76,30 @@ def get_categories(user_id):
     categories = Category.query.filter(
         Category.created_by == user_id)
 
+    total = None
     if search_query:
-        categories = categories.filter(Category.name.ilike(
-            '%' + search_query.strip().title() + '%'))
-    categories = categories.order_by(Category.date_created.desc()).paginate(
-        page=page, per_page=limit, error_out=False)
-    results = []
-    for cat in categories.items:
-        results.append({
-            'cat': cat.category_json(),
-            'Recipes': url_for('recipe.get_recipes',
-                                id=cat.id, _external=True)
-        })
+        # cursor pages seek on (date_created, id), so they keep that order
+        categories = search_categories(
+            categories, search_query,
+            by_similarity='cursor' not in request.args)
+    else:
+        # the user's counter stands in for a COUNT over their categories
+        total = db.session.query(User.category_count).filter(
+            User.id == user_id).scalar()
+    # the recipe counts are shown in the listing, so they are in the tag
+    etag, last_modified = collection_etag(
+        categories, Category.date_modified, user_id, total=total,
+        counters=(Category.recipe_count,))
+    # a deletion leaves max(date_modified) alone, so only the tag,
+    # which also covers the row count, can prove a listing is unchanged
+    if etag and is_not_modified(etag):
+        return not_modified(etag, last_modified)
+    headers = validator_headers(etag, last_modified) if etag else {}
+    if 'cursor' in request.args:
+        return get_categories_by_cursor(categories, limit, headers, total)
+    categories = paginate(categories.order_by(Category.date_created.desc()),
+                          page, limit, total)
+    results = category_rows(categories.items)
 
     
     pagination_details = {
@@ -71,7 +110,27 @@ def get_categories(user_id):
             'total_pages':categories.pages,}
 
     if results:
-        return jsonify({'categories': results, **pagination_details}), 200
+        return json_response({'categories': results, **pagination_details},
+                             headers=headers)
+    return jsonify({"message": "No category found"}), 404
+
+
+def get_categories_by_cursor(categories, limit, headers, total=None):
+    """Returns a page of categories seeking on (date_created, id)"""
+    try:
+        items, next_cursor = keyset_page(
+            categories, [Category.date_created, Category.id],
+            request.args.get('cursor'), limit, descending=True)
+    except InvalidCursor:
+        return jsonify({"message": "Invalid cursor"}), 400
+    results = category_rows(items)
+    pagination_details = {'next_cursor': next_cursor}
+    if wants_count():
+        pagination_details['total_Items'] = (
+            categories.count() if total is None else total)
+    if results:
+        return json_response({'categories': results, **pagination_details},
+                             headers=headers)
     return jsonify({"message": "No category found"}), 404
 
 
@@ -81,12 +140,12 @@ def get_categories(user_id):
 def delete_category(user_id, id, **kwargs):
     """This route handles deleting categories by id"""
 
-    category = Category.find_user_by_id(id, user_id)
-    if not category:
+    try:
+        name = repository.delete_category(user_id, id)
+    except repository.NotFound:
         return jsonify({"message": "No category to delete"}), 404
-    if request.method == "DELETE":
-        category.delete()
-        return {"message": "category {} deleted".format(category.name)}, 200
+    response_cache.bump(user_id)
+    return {"message": "category {} deleted".format(name)}, 200
 
 
 @category.route('/api/v1/categories/<int:id>', methods=['PUT'])
@@ -99,29 +158,26 @@ def edit_category(user_id, id, **kwargs):
     result2 = valid_category(name)
     if result2:
         return jsonify(result2), 400
-    name = name.title()
-    result = Category.find_by_name(name, user_id)
-    if result:
+    try:
+        # the name is checked in title case but stored as it was sent
+        category = repository.rename_category(
+            user_id, id, str(request.data.get('name', '')), name.title())
+    except repository.Conflict:
         return jsonify({"message": "name already exists"}), 400
-    category = Category.find_user_by_id(id, user_id)
-    if not category:
+    except repository.NotFound:
         return jsonify({"message": "No category found to edit"}), 404
-
-    name = str(request.data.get('name', ''))
-    category.name = name
-    category.save()
-    response2 = category.category_json()
-    response = {
+    response_cache.bump(user_id)
+    response2 = CATEGORY_PLAN.dump(category)
+    response = with_recipes_link({
         'message': 'Category has been updated',
         'newcategory': response2,
-        'Recipes': url_for('recipe.get_recipes',
-                            id=category.id, _external=True)
-    }
+    }, category.id)
     return make_response(jsonify(response)), 200
 
 
 @category.route('/api/v1/categories/<int:id>', methods=['GET'])
 @authentication
+@db.read_only
 @swag_from('/app/docs/getcategory.yml')
 def get_category_by_id(user_id, id, **kwargs):
     """This route handles getting categories by id"""
@@ -130,12 +186,15 @@ def get_category_by_id(user_id, id, **kwargs):
     if not category:
         return jsonify({"message": "No category found by id"}), 404
     else:
+        etag = make_etag(request.host_url, category.id, category.name,
+                         category.date_modified, category.recipe_count)
+        if is_not_modified(etag, category.date_modified):
+            return not_modified(etag, category.date_modified)
         response3 = category.category_json()
-        response = {
+        response = with_recipes_link({
             "message": "category {} found".format(category.id),
             'category': response3,
-            'Recipes': url_for('recipe.get_recipes',
-                                id=category.id, _external=True)
-        }
-        return make_response(jsonify(response)), 200
+        }, category.id)
+        return json_response(response, headers=validator_headers(
+            etag, category.date_modified))
 
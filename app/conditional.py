@@ -0,0 +1,68 @@
+import hashlib
+from flask import Response, request
+from sqlalchemy import func
+from werkzeug.http import http_date, quote_etag
+
+
+def make_etag(*parts):
+    """Builds an entity tag from the values that identify a representation."""
+    return hashlib.sha1(
+        '|'.join(str(part) for part in parts).encode()).hexdigest()
+
+
+def collection_etag(query, modified_column, *parts, total=None,
+                    counters=()):
+    """Builds the validators of a listing from one aggregate query over
+    its filter: the newest modification time and the number of rows. The
+    url is part of the tag so each page, limit and search gets its own.
+    A total the caller already knows saves the count, and the sums of
+    the counters columns go into the tag. Returns (None, None) for an
+    empty listing.
+    """
+    if total == 0:
+        return None, None
+    columns = [func.max(modified_column)]
+    if total is None:
+        columns.append(func.count())
+    columns.extend(func.sum(counter) for counter in counters)
+    row = query.with_entities(*columns).order_by(None).first()
+    last_modified, row = row[0], list(row[1:])
+    if total is None:
+        total = row.pop(0)
+    if not total:
+        return None, None
+    return make_etag(request.host_url, request.full_path, last_modified,
+                     total, *(list(parts) + row)), last_modified
+
+
+def _to_second(value):
+    """HTTP dates have no fraction and may carry a timezone, compare both
+    sides as naive UTC datetimes truncated to the second.
+    """
+    if value.tzinfo is not None:
+        value = value.replace(tzinfo=None) - value.utcoffset()
+    return value.replace(microsecond=0)
+
+
+def is_not_modified(etag, last_modified=None):
+    """Checks the request's If-None-Match and If-Modified-Since headers.
+    If-None-Match wins when both are sent.
+    """
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if last_modified is not None and request.if_modified_since is not None:
+        return _to_second(last_modified) <= _to_second(request.if_modified_since)
+    return False
+
+
+def validator_headers(etag, last_modified=None):
+    """The ETag and Last-Modified headers to send with a full response."""
+    headers = {'ETag': quote_etag(etag)}
+    if last_modified is not None:
+        headers['Last-Modified'] = http_date(last_modified)
+    return headers
+
+
+def not_modified(etag, last_modified=None):
+    """An empty 304 response carrying the validators."""
+    return Response(status=304, headers=validator_headers(etag, last_modified))
@@ -0,0 +1,6 @@
+from flask import Blueprint
+
+# This blueprint moves whole cookbooks in and out of the api
+cookbook = Blueprint('cookbook', __name__)
+
+from . import views
@@ -0,0 +1,72 @@
+import csv
+import io
+import json
+from app import db
+from app.models import Category, Recipe
+
+CSV_FIELDS = ['category_id', 'category_name', 'recipe_id', 'title',
+              'description', 'date_created', 'date_modified']
+
+COLUMNS = (Category.id, Category.name, Category.date_created,
+           Category.date_modified, Recipe.id, Recipe.title,
+           Recipe.description, Recipe.date_created, Recipe.date_modified)
+
+
+def cookbook_rows(user_id, batch_size=1000):
+    """Yields one tuple of COLUMNS per recipe of a user, in category order.
+    A category without recipes yields a single row with empty recipe
+    columns. yield_per streams the rows through a server side cursor, so
+    only one batch is held in memory at a time.
+    """
+    return db.session.query(*COLUMNS).outerjoin(
+        Recipe, Recipe.category_identity == Category.id).filter(
+            Category.created_by == user_id).order_by(
+                Category.id, Recipe.id).yield_per(batch_size)
+
+
+def _isoformat(value):
+    return value.isoformat() if value is not None else None
+
+
+def export_ndjson(rows):
+    """Yields a category line followed by a line for each of its recipes."""
+    current = None
+    for (cat_id, name, cat_created, cat_modified, recipe_id, title,
+         description, created, modified) in rows:
+        if cat_id != current:
+            current = cat_id
+            yield json.dumps({
+                'type': 'category', 'id': cat_id, 'name': name,
+                'date_created': _isoformat(cat_created),
+                'date_modified': _isoformat(cat_modified)}) + '\n'
+        if recipe_id is not None:
+            yield json.dumps({
+                'type': 'recipe', 'id': recipe_id, 'title': title,
+                'description': description, 'category_identity': cat_id,
+                'date_created': _isoformat(created),
+                'date_modified': _isoformat(modified)}) + '\n'
+
+
+def export_csv(rows):
+    """Yields a header and one line per recipe, categories repeated."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def line(values):
+        writer.writerow(values)
+        value = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return value
+
+    yield line(CSV_FIELDS)
+    for (cat_id, name, _, _, recipe_id, title, description,
+         created, modified) in rows:
+        yield line([cat_id, name, recipe_id, title, description,
+                    _isoformat(created), _isoformat(modified)])
+
+
+EXPORT_FORMATS = {
+    'ndjson': (export_ndjson, 'application/x-ndjson'),
+    'csv': (export_csv, 'text/csv'),
+}
@@ -0,0 +1,200 @@
+import csv
+import json
+import re
+from sqlalchemy.exc import DBAPIError
+from app import db
+from app.models import Category, Recipe
+from app.repository import insert_new
+from app.response_cache import response_cache
+from app.categories.validations import valid_category
+from app.recipes.validations import valid_recipe_title
+
+# the most line errors kept in an import report
+MAX_REPORTED_ERRORS = 100
+
+
+def _decode(lines):
+    for line in lines:
+        yield line.decode('utf-8') if isinstance(line, bytes) else line
+
+
+def parse_ndjson(lines):
+    """Yields (record number, category, title, description) per line.
+
+    Accepts the export format, where a category line is followed by its
+    recipe lines, as well as recipe lines carrying their own category.
+    A category line has a title of None.
+    """
+    category = None
+    number = 0
+    for line in _decode(lines):
+        if not line.strip():
+            continue
+        number += 1
+        try:
+            item = json.loads(line)
+        except ValueError:
+            yield number, None, None, {'message': 'Invalid json line'}
+            continue
+        if not isinstance(item, dict):
+            yield number, None, None, {'message': 'Invalid json line'}
+            continue
+        if item.get('type') == 'category':
+            category = item.get('name')
+            yield number, category, None, None
+            continue
+        description = item.get('description')
+        yield (number, item.get('category', category), item.get('title'),
+               '' if description is None else description)
+
+
+def parse_csv(lines):
+    """Yields the same records as parse_ndjson from csv with a header of
+    category_name, title and description, as written by the export.
+    A row without a title only creates its category.
+    """
+    for number, row in enumerate(csv.DictReader(_decode(lines)), 1):
+        category = row.get('category_name', row.get('category'))
+        yield number, category, row.get('title') or None, \
+            row.get('description') or ''
+
+
+def _too_long(label, value, column):
+    if len(value) > column.type.length:
+        return {'message': '{} should not be longer than {} '
+                           'characters'.format(label, column.type.length)}
+
+
+IMPORT_FORMATS = {
+    'ndjson': parse_ndjson,
+    'csv': parse_csv,
+}
+
+
+class CookbookImporter(object):
+    """Loads parsed cookbook records for one user in fixed size chunks.
+
+    Categories are upserted by (created_by, name) and recipes already in
+    their category are skipped, so an import can be repeated safely and
+    runs alongside the user's own requests.
+    Every chunk is committed on its own, and the report's resume_from is
+    the number of records that are safely stored. Passing it back as
+    resume_from continues an interrupted import. A chunk the database
+    rejects stops the import there, with the error in the report.
+    """
+
+    def __init__(self, user_id, chunk_size=1000, progress=None):
+        self.user_id = user_id
+        self.chunk_size = chunk_size
+        self.progress = progress
+        self.categories = dict(
+            (name, cat_id) for cat_id, name in Category.query.with_entities(
+                Category.id, Category.name).filter(
+                    Category.created_by == user_id))
+        self.pending = []
+        # categories created since the last commit
+        self.new_categories = []
+        self.report = {'processed': 0, 'created_categories': 0,
+                       'created_recipes': 0, 'skipped': 0, 'failed': 0,
+                       'errors': [], 'resume_from': 0}
+
+    def run(self, records, resume_from=0):
+        number = resume_from
+        try:
+            for number, category, title, description in records:
+                if number <= resume_from:
+                    continue
+                self.report['processed'] += 1
+                self._record(number, category, title, description)
+            self._flush(number)
+        except DBAPIError as error:
+            # e.g. a value longer than its column on PostgreSQL
+            db.session.rollback()
+            self._abort(number, error)
+        return self.report
+
+    def _record(self, number, category, title, description):
+        if isinstance(description, dict):
+            self._fail(number, description)
+            return
+        if title is not None:
+            title = re.sub(' +', ' ', str(title).strip().lower())
+            error = valid_recipe_title(title) or _too_long(
+                'Recipe title', title, Recipe.title)
+            if error:
+                self._fail(number, error)
+                return
+        category_id = self._category(number, category)
+        if category_id is None or title is None:
+            return
+        self.pending.append((category_id, title, str(description)))
+        if len(self.pending) >= self.chunk_size:
+            self._flush(number)
+
+    def _abort(self, number, error):
+        """Reports the chunk the database rejected, none of it is kept."""
+        for name in self.new_categories:
+            self.categories.pop(name, None)
+        self.report['created_categories'] -= len(self.new_categories)
+        self.report['failed'] += len(self.pending)
+        self.new_categories, self.pending = [], []
+        self._fail(number, {'message': 'Records after {} could not be '
+                                       'stored: {}'.format(
+                                           self.report['resume_from'],
+                                           str(error.orig).splitlines()[0])})
+
+    def _fail(self, number, error):
+        self.report['failed'] += 1
+        if len(self.report['errors']) < MAX_REPORTED_ERRORS:
+            self.report['errors'].append(dict(error, line=number))
+
+    def _category(self, number, name):
+        """Returns the id of a category, creating it when it is new."""
+        if name is None:
+            self._fail(number, {'message': 'Recipe has no category'})
+            return None
+        name = re.sub(' +', ' ', str(name).strip())
+        error = valid_category(name) or _too_long(
+            'Category name', name, Category.name)
+        if error:
+            self._fail(number, error)
+            return None
+        name = name.title()
+        if name not in self.categories:
+            result = db.session.execute(insert_new(
+                Category.__table__, 'uq_categories_created_by_name').values(
+                    name=name, created_by=self.user_id))
+            if result.rowcount:
+                self.categories[name] = result.inserted_primary_key[0]
+                self.new_categories.append(name)
+                self.report['created_categories'] += 1
+            else:
+                # another request created it since the import started
+                self.categories[name] = db.session.query(Category.id).filter(
+                    Category.created_by == self.user_id,
+                    Category.name == name).scalar()
+        return self.categories[name]
+
+    def _flush(self, number):
+        """Inserts the pending recipes and commits the chunk."""
+        pending, self.pending = self.pending, []
+        rows = {}
+        for category_id, title, description in pending:
+            rows.setdefault((category_id, title), {
+                'category_identity': category_id, 'title': title,
+                'description': description})
+        created = 0
+        if rows:
+            # titles already in their category, however they got there,
+            # are left alone
+            created = db.session.execute(insert_new(
+                Recipe.__table__, 'uq_recipes_category_identity_title').values(
+                    list(rows.values()))).rowcount
+        db.session.commit()
+        self.new_categories = []
+        response_cache.bump(self.user_id)
+        self.report['skipped'] += len(pending) - created
+        self.report['created_recipes'] += created
+        self.report['resume_from'] = number
+        if self.progress:
+            self.progress(self.report)
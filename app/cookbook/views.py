@@ -0,0 +1,50 @@
+from flask import Response, current_app, request, jsonify, stream_with_context
+from flasgger import swag_from
+from app.categories.validations import authentication
+from .import cookbook
+from .export import EXPORT_FORMATS, cookbook_rows
+from .importer import IMPORT_FORMATS, CookbookImporter
+
+
+@cookbook.route('/api/v1/export', methods=['GET'])
+@authentication
+@swag_from('/app/docs/export.yml')
+def export_cookbook(user_id, **kwargs):
+    """This route streams all of a user's categories and recipes"""
+
+    export_format = str(request.args.get('format', 'ndjson')).lower()
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({"message": "format should be one of "
+                        + ', '.join(sorted(EXPORT_FORMATS))}), 400
+    serialize, mimetype = EXPORT_FORMATS[export_format]
+    rows = cookbook_rows(user_id)
+    response = Response(stream_with_context(serialize(rows)),
+                        mimetype=mimetype)
+    response.headers['Content-Disposition'] = \
+        'attachment; filename=cookbook.{}'.format(export_format)
+    return response
+
+
+@cookbook.route('/api/v1/import', methods=['POST'])
+@authentication
+@swag_from('/app/docs/import.yml')
+def import_cookbook(user_id, **kwargs):
+    """This route loads categories and recipes from an ndjson or csv upload"""
+
+    import_format = str(request.args.get('format', 'ndjson')).lower()
+    if import_format not in IMPORT_FORMATS:
+        return jsonify({"message": "format should be one of "
+                        + ', '.join(sorted(IMPORT_FORMATS))}), 400
+    resume_from = request.args.get('resume_from', 0, type=int)
+    if request.mimetype == 'multipart/form-data':
+        if not request.files.get('file'):
+            return jsonify({"message": "Please upload a file"}), 400
+        stream = request.files['file'].stream
+    else:
+        # read the raw body line by line instead of parsing it whole
+        stream = request.stream
+    importer = CookbookImporter(
+        user_id, chunk_size=current_app.config.get('IMPORT_CHUNK_SIZE', 1000))
+    report = importer.run(IMPORT_FORMATS[import_format](stream),
+                          resume_from=resume_from)
+    return jsonify(report), 200
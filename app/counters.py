@@ -0,0 +1,134 @@
+from sqlalchemy import event, func, select, text
+from app import db
+from app.models import Category, Recipe, User
+
+# categories.recipe_count and users.category_count are kept by triggers,
+# so every way rows come and go counts: the API, batches, imports and
+# ON DELETE CASCADE. A change of a category's recipe count also moves
+# its date_modified, it is part of the category's representation.
+# PostgreSQL counts once per statement over the transition tables, so a
+# batch of a thousand recipes updates its category once. SQLite only has
+# row triggers. Databases that predate the counters get the columns and
+# triggers from migration 8c0f2a6e4d79, which then reconciles them.
+POSTGRES_FUNCTION = """
+CREATE OR REPLACE FUNCTION {name}() RETURNS trigger AS $$
+BEGIN
+    UPDATE {parent} SET {counter} = {counter} + delta.n{touch}
+    FROM (SELECT {key}, sum(n) AS n FROM ({changes}) AS changes
+          GROUP BY {key}) AS delta
+    WHERE {parent}.id = delta.{key} AND delta.n <> 0;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql
+"""
+
+POSTGRES_ADDED = "SELECT {key}, 1 AS n FROM new_rows"
+POSTGRES_REMOVED = "SELECT {key}, -1 AS n FROM old_rows"
+
+# (operation, transition tables, rows counted) of each trigger, a
+# transition table exists only in the trigger that declares it
+POSTGRES_TRIGGERS = [
+    ('insert', 'NEW TABLE AS new_rows', [POSTGRES_ADDED]),
+    ('delete', 'OLD TABLE AS old_rows', [POSTGRES_REMOVED]),
+    ('update', 'OLD TABLE AS old_rows NEW TABLE AS new_rows',
+     [POSTGRES_ADDED, POSTGRES_REMOVED]),
+]
+
+SQLITE_TRIGGERS = [
+    "CREATE TRIGGER {table}_count_insert AFTER INSERT ON {table} BEGIN "
+    "UPDATE {parent} SET {counter} = {counter} + 1{touch} "
+    "WHERE id = new.{key}; END",
+    "CREATE TRIGGER {table}_count_delete AFTER DELETE ON {table} BEGIN "
+    "UPDATE {parent} SET {counter} = {counter} - 1{touch} "
+    "WHERE id = old.{key}; END",
+    "CREATE TRIGGER {table}_count_update AFTER UPDATE OF {key} ON {table} "
+    "WHEN new.{key} IS NOT old.{key} BEGIN "
+    "UPDATE {parent} SET {counter} = {counter} - 1{touch} "
+    "WHERE id = old.{key}; "
+    "UPDATE {parent} SET {counter} = {counter} + 1{touch} "
+    "WHERE id = new.{key}; END",
+]
+
+COUNTERS = [
+    # (child table, foreign key, parent table, counter, parent has
+    # date_modified)
+    ('recipes', 'category_identity', 'categories', 'recipe_count', True),
+    ('categories', 'created_by', 'users', 'category_count', False),
+]
+
+
+def _postgres_ddl(table, key, parent, counter, touch):
+    touch = ', date_modified = CURRENT_TIMESTAMP' if touch else ''
+    statements = []
+    for operation, transitions, changes in POSTGRES_TRIGGERS:
+        name = 'count_{}_{}'.format(table, operation)
+        statements.append(POSTGRES_FUNCTION.format(
+            name=name, parent=parent, counter=counter, key=key, touch=touch,
+            changes=' UNION ALL '.join(changes).format(key=key)))
+        statements.append(
+            "CREATE TRIGGER {name} AFTER {operation} ON {table} "
+            "REFERENCING {transitions} FOR EACH STATEMENT "
+            "EXECUTE PROCEDURE {name}()".format(
+                name=name, operation=operation.upper(), table=table,
+                transitions=transitions))
+    return statements
+
+
+def _sqlite_ddl(table, key, parent, counter, touch):
+    touch = ', date_modified = CURRENT_TIMESTAMP' if touch else ''
+    return [statement.format(table=table, key=key, parent=parent,
+                             counter=counter, touch=touch)
+            for statement in SQLITE_TRIGGERS]
+
+
+def trigger_ddl(dialect_name, table_name=None):
+    """Returns the statements creating the counter triggers of a table,
+    or of every table, on this dialect; none where it has no triggers.
+    """
+    ddl = {'postgresql': _postgres_ddl,
+           'sqlite': _sqlite_ddl}.get(dialect_name)
+    if ddl is None:
+        return []
+    return [statement for counter in COUNTERS
+            if table_name in (None, counter[0])
+            for statement in ddl(*counter)]
+
+
+def _create_counter(table_name):
+    def create(target, connection, **kwargs):
+        for statement in trigger_ddl(connection.dialect.name, table_name):
+            connection.execute(text(statement))
+    return create
+
+
+event.listen(Recipe.__table__, 'after_create', _create_counter('recipes'))
+event.listen(Category.__table__, 'after_create',
+             _create_counter('categories'))
+
+
+def reconcile_statements():
+    """Returns the updates recounting the recipe count of categories and
+    the category count of users, each touching only the rows that drifted.
+    """
+    recipes = select([func.count()]).where(
+        Recipe.category_identity == Category.id).as_scalar()
+    categories = select([func.count()]).where(
+        Category.created_by == User.id).as_scalar()
+    return [
+        Category.__table__.update().values(recipe_count=recipes).where(
+            Category.recipe_count != recipes),
+        User.__table__.update().values(category_count=categories).where(
+            User.category_count != categories),
+    ]
+
+
+def reconcile():
+    """Recounts every counter from the rows and fixes the ones that
+    drifted, e.g. after the triggers were dropped for a bulk load.
+    Returns the number of categories and users that were fixed.
+    """
+    fixed_categories, fixed_users = [
+        db.session.execute(statement).rowcount
+        for statement in reconcile_statements()]
+    db.session.commit()
+    return fixed_categories, fixed_users
@@ -0,0 +1,282 @@
+import itertools
+import threading
+import time
+from functools import wraps
+from flask import g, has_request_context
+from flask_sqlalchemy import SQLAlchemy as BaseSQLAlchemy, SignallingSession
+from sqlalchemy import event, orm
+from sqlalchemy.exc import DisconnectionError
+from sqlalchemy.pool import NullPool, QueuePool
+from sqlalchemy.sql.dml import UpdateBase
+from app.instrumentation import current_timer
+from app.response_cache import BACKENDS, PROCESS_BACKENDS
+
+
+class _TimedPool(object):
+    """Adds the time spent waiting for a pooled connection to the
+    'pool' stage of the current request, see app.instrumentation.
+    """
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super(_TimedPool, self)._do_get()
+        finally:
+            timer = current_timer()
+            if timer is not None:
+                timer.add('pool', time.perf_counter() - started)
+
+
+class TimedQueuePool(_TimedPool, QueuePool):
+    pass
+
+
+class TimedNullPool(_TimedPool, NullPool):
+    pass
+
+
+def ping_on_checkout(dbapi_connection, connection_record, connection_proxy):
+    """Pessimistic disconnect handling: a connection the server dropped
+    fails this ping and the pool replaces it before anyone uses it.
+    """
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute('SELECT 1')
+    except Exception:
+        raise DisconnectionError()
+    finally:
+        try:
+            cursor.close()
+        except Exception:
+            pass
+
+
+def foreign_keys_on_connect(dbapi_connection, connection_record):
+    """SQLite only enforces foreign keys, and their ON DELETE CASCADE,
+    on connections that ask for it.
+    """
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA foreign_keys = ON')
+    cursor.close()
+
+
+def statement_timeout_on_connect(milliseconds):
+    """Sets statement_timeout once for each new server connection."""
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('SET statement_timeout = %s', (milliseconds,))
+        cursor.close()
+        # a rollback would undo the SET, so keep it
+        dbapi_connection.commit()
+    return on_connect
+
+
+def statement_timeout_on_checkout(milliseconds):
+    """Sets statement_timeout for the transaction a checkout starts.
+
+    Behind PgBouncer in transaction mode consecutive transactions can run
+    on different server connections, so session settings can't be
+    trusted and SET LOCAL is used instead.
+    """
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('SET LOCAL statement_timeout = %s', (milliseconds,))
+        cursor.close()
+    return on_checkout
+
+
+class RoutingSession(SignallingSession):
+    """Sends the statements of read only views to the replica picked for
+    the request, see SQLAlchemy.read_only. Models with a __bind_key__
+    keep their own bind.
+    """
+
+    def get_bind(self, mapper=None, clause=None):
+        replica = g.get('db_replica') if has_request_context() else None
+        if replica is not None:
+            table = None
+            if mapper is not None:
+                table = getattr(mapper, 'persist_selectable',
+                                getattr(mapper, 'mapped_table', None))
+            if getattr(table, 'info', {}).get('bind_key') is None:
+                return self.app.extensions['sqlalchemy'].db.get_engine(
+                    self.app, bind=replica)
+        return super(RoutingSession, self).get_bind(mapper, clause)
+
+    def execute(self, clause, *args, **kwargs):
+        # core inserts, updates and deletes write without a flush
+        if isinstance(clause, UpdateBase):
+            self.info['wrote'] = True
+        return super(RoutingSession, self).execute(clause, *args, **kwargs)
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _flushed(session, flush_context):
+    session.info['wrote'] = True
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _committed(session):
+    # the user whose request wrote reads from the primary for a while
+    if session.info.pop('wrote', False) and has_request_context():
+        user_id = g.get('user_id')
+        if user_id is not None:
+            session.app.extensions['db_routing'].wrote(user_id)
+
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def _rolled_back(session):
+    session.info.pop('wrote', None)
+
+
+class _RoutingState(object):
+
+    def __init__(self, app, backend):
+        self.app = app
+        self.backend = backend
+        self.counter = itertools.count()
+        self.lock = threading.Lock()
+        # bind name -> (healthy, time of the last check)
+        self.health = {}
+
+    def wrote(self, user_id):
+        window = self.app.config['DATABASE_READ_YOUR_WRITES']
+        if window:
+            self.backend.set('wrote:{}'.format(user_id), True, ttl=window)
+
+    def recently_wrote(self, user_id):
+        return bool(self.app.config['DATABASE_READ_YOUR_WRITES'] and
+                    self.backend.get('wrote:{}'.format(user_id)))
+
+    def healthy(self, replica):
+        interval = self.app.config['DATABASE_REPLICA_CHECK_INTERVAL']
+        with self.lock:
+            state = self.health.get(replica)
+        if state is not None and time.time() - state[1] < interval:
+            return state[0]
+        engine = self.app.extensions['sqlalchemy'].db.get_engine(
+            self.app, bind=replica)
+        try:
+            # a raw connection, so the check stays out of the query audit
+            connection = engine.raw_connection()
+            try:
+                cursor = connection.cursor()
+                cursor.execute('SELECT 1')
+                cursor.close()
+            finally:
+                connection.close()
+            ok = True
+        except Exception:
+            self.app.logger.warning('Replica %s failed its health check',
+                                    replica)
+            ok = False
+        with self.lock:
+            self.health[replica] = (ok, time.time())
+        return ok
+
+    def choose(self):
+        """The next healthy replica in turn, None when all are down."""
+        replicas = self.app.config['DATABASE_REPLICAS']
+        for _ in range(len(replicas)):
+            replica = replicas[next(self.counter) % len(replicas)]
+            if self.healthy(replica):
+                return replica
+        return None
+
+
+class SQLAlchemy(BaseSQLAlchemy):
+    """Flask-SQLAlchemy with the pool configured from DATABASE_* settings.
+
+    For PostgreSQL the pool holds DATABASE_POOL_SIZE connections plus
+    DATABASE_MAX_OVERFLOW extra ones, recycled after DATABASE_POOL_RECYCLE
+    seconds, and a checkout waits at most DATABASE_POOL_TIMEOUT seconds.
+    DATABASE_PRE_PING tests connections on checkout, and
+    DATABASE_STATEMENT_TIMEOUT (milliseconds) bounds every statement.
+    With DATABASE_PGBOUNCER the app keeps no pool of its own, leaving that
+    to PgBouncer, and sets the timeout per transaction. psycopg2 never
+    uses server side prepared statements, so transaction pooling is safe.
+    SQLite keeps Flask-SQLAlchemy's pool and turns on foreign keys.
+
+    Views decorated with read_only query one of the DATABASE_REPLICAS,
+    names of SQLALCHEMY_BINDS entries, in turn. Replicas are health
+    checked every DATABASE_REPLICA_CHECK_INTERVAL seconds and skipped
+    while down. For DATABASE_READ_YOUR_WRITES seconds after a user's
+    request commits a write, that user reads from the primary again, so
+    replication lag never hides their own changes. The write times are
+    kept in a DATABASE_ROUTING_BACKEND store, one of the response cache
+    backends, shared between workers through DATABASE_ROUTING_URL. With
+    replicas and more than one of WEB_CONCURRENCY workers the store must
+    be shared, or a user's next read may land on a worker that never saw
+    the write, so a per process one fails at startup.
+    """
+
+    def init_app(self, app):
+        app.config.setdefault('DATABASE_REPLICAS', [])
+        app.config.setdefault('DATABASE_REPLICA_CHECK_INTERVAL', 5)
+        app.config.setdefault('DATABASE_READ_YOUR_WRITES', 5)
+        app.config.setdefault('DATABASE_ROUTING_BACKEND', 'lru')
+        app.config.setdefault('DATABASE_ROUTING_URL', None)
+        app.config.setdefault('WEB_CONCURRENCY', 1)
+        if (app.config['DATABASE_REPLICAS'] and
+                app.config['WEB_CONCURRENCY'] > 1 and
+                app.config['DATABASE_ROUTING_BACKEND'] in PROCESS_BACKENDS):
+            raise ValueError(
+                'DATABASE_ROUTING_BACKEND {} is per process, {} workers need '
+                'a shared one such as redis for read-your-writes'.format(
+                    app.config['DATABASE_ROUTING_BACKEND'],
+                    app.config['WEB_CONCURRENCY']))
+        super(SQLAlchemy, self).init_app(app)
+        backend = BACKENDS[app.config['DATABASE_ROUTING_BACKEND']](
+            url=app.config['DATABASE_ROUTING_URL'])
+        app.extensions['db_routing'] = _RoutingState(app, backend)
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+    def read_only(self, func):
+        """Decorates a view that takes user_id first and never writes."""
+        @wraps(func)
+        def wrapper(user_id, *args, **kwargs):
+            routing = self.get_app().extensions['db_routing']
+            if not routing.app.config['DATABASE_REPLICAS'] or \
+                    routing.recently_wrote(user_id):
+                return func(user_id, *args, **kwargs)
+            g.db_replica = routing.choose()
+            try:
+                return func(user_id, *args, **kwargs)
+            finally:
+                g.pop('db_replica', None)
+        return wrapper
+
+    def apply_driver_hacks(self, app, sa_url, options):
+        rv = super(SQLAlchemy, self).apply_driver_hacks(app, sa_url, options)
+        if sa_url.drivername.startswith('postgresql'):
+            config = app.config
+            events = []
+            if config.get('DATABASE_PGBOUNCER'):
+                options['poolclass'] = TimedNullPool
+                for key in ('pool_size', 'max_overflow', 'pool_timeout'):
+                    options.pop(key, None)
+            else:
+                options['poolclass'] = TimedQueuePool
+                for key, name in (('pool_size', 'DATABASE_POOL_SIZE'),
+                                  ('max_overflow', 'DATABASE_MAX_OVERFLOW'),
+                                  ('pool_timeout', 'DATABASE_POOL_TIMEOUT'),
+                                  ('pool_recycle', 'DATABASE_POOL_RECYCLE')):
+                    if config.get(name) is not None:
+                        options[key] = config[name]
+            if config.get('DATABASE_PRE_PING'):
+                events.append((ping_on_checkout, 'checkout'))
+            timeout = config.get('DATABASE_STATEMENT_TIMEOUT')
+            if timeout:
+                if config.get('DATABASE_PGBOUNCER'):
+                    events.append(
+                        (statement_timeout_on_checkout(timeout), 'checkout'))
+                else:
+                    events.append(
+                        (statement_timeout_on_connect(timeout), 'connect'))
+            if events:
+                options['pool_events'] = events
+        elif sa_url.drivername.startswith('sqlite'):
+            options['pool_events'] = [(foreign_keys_on_connect, 'connect')]
+        return rv
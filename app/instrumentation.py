@@ -0,0 +1,174 @@
+import time
+from contextlib import contextmanager
+from flask import Response, current_app, g, has_app_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from app.metrics import COUNT_BUCKETS, MetricsRegistry
+from app.response_cache import response_cache
+from app.token_cache import token_cache
+
+
+class RequestTimer(object):
+    """The timings gathered while one request is handled."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.queries = 0
+        self.db_time = 0.0
+
+    def add(self, stage, seconds):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+
+def current_timer():
+    """The RequestTimer of the request being handled, if it is timed."""
+    if has_app_context():
+        return g.get('request_timer')
+    return None
+
+
+@contextmanager
+def stage(name):
+    """Times a block as a named stage of the current request. Does
+    nothing unless instrumentation is enabled.
+    """
+    timer = current_timer()
+    if timer is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timer.add(name, time.perf_counter() - started)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context,
+                           executemany):
+    # kept on the statement's own context, which a failed statement takes
+    # with it, rather than on the pooled connection
+    if current_timer() is not None and context is not None:
+        context.query_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany):
+    timer = current_timer()
+    started = getattr(context, 'query_started', None)
+    if timer is not None and started is not None:
+        timer.queries += 1
+        timer.db_time += time.perf_counter() - started
+
+
+def cache_metrics():
+    """The token and response cache statistics, read at scrape time."""
+    tokens = token_cache.stats()
+    responses = response_cache.stats()
+    return [
+        ('token_cache_hits_total', 'counter', 'Token cache hits',
+         tokens['hits']),
+        ('token_cache_misses_total', 'counter', 'Token cache misses',
+         tokens['misses']),
+        ('token_cache_entries', 'gauge', 'Tokens in the cache',
+         tokens['size']),
+        ('response_cache_hits_total', 'counter', 'Response cache hits',
+         responses['hits']),
+        ('response_cache_misses_total', 'counter', 'Response cache misses',
+         responses['misses']),
+        ('response_cache_hit_ratio', 'gauge', 'Response cache hit rate',
+         responses['hit_rate']),
+    ]
+
+
+class Instrumentation(object):
+    """Opt in request timing, enabled with INSTRUMENTATION_ENABLED.
+
+    Every request gets its wall time, the time of named stages (auth and
+    serialize are timed by the views' helpers, see stage()) and the
+    number and total time of its SQL queries, taken from engine events.
+    They are sent back in a Server-Timing header and recorded in
+    histograms served at METRICS_PATH in prometheus text format.
+    """
+
+    def __init__(self, app=None):
+        self.app = app
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('INSTRUMENTATION_ENABLED', False)
+        app.config.setdefault('SERVER_TIMING', True)
+        app.config.setdefault('METRICS_PATH', '/metrics')
+        if not app.config['INSTRUMENTATION_ENABLED']:
+            return
+        if not event.contains(Engine, 'before_cursor_execute',
+                              _before_cursor_execute):
+            # one listener serves every engine, it only records while a
+            # timed request is running on the thread
+            event.listen(Engine, 'before_cursor_execute',
+                         _before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute',
+                         _after_cursor_execute)
+        registry = MetricsRegistry()
+        registry.add_collector(cache_metrics)
+        app.extensions['instrumentation'] = _InstrumentationState(registry)
+        app.before_request(self._start)
+        app.after_request(self._finish)
+        app.add_url_rule(app.config['METRICS_PATH'], 'metrics',
+                         self.metrics_view)
+
+    @property
+    def registry(self):
+        return current_app.extensions['instrumentation'].registry
+
+    def _start(self):
+        g.request_timer = RequestTimer()
+
+    def _finish(self, response):
+        timer = g.pop('request_timer', None)
+        if timer is None:
+            return response
+        total = time.perf_counter() - timer.started
+        state = current_app.extensions['instrumentation']
+        endpoint = request.endpoint or 'unmatched'
+        state.duration.observe(total, endpoint, request.method,
+                               response.status_code)
+        state.queries.observe(timer.queries, endpoint)
+        state.db_time.observe(timer.db_time, endpoint)
+        for name, seconds in timer.stages.items():
+            state.stages.observe(seconds, endpoint, name)
+        if current_app.config['SERVER_TIMING']:
+            entries = ['{};dur={:.2f}'.format(name, seconds * 1000)
+                       for name, seconds in sorted(timer.stages.items())]
+            entries.append('db;dur={:.2f};desc="{} queries"'.format(
+                timer.db_time * 1000, timer.queries))
+            entries.append('total;dur={:.2f}'.format(total * 1000))
+            response.headers['Server-Timing'] = ', '.join(entries)
+        return response
+
+    def metrics_view(self):
+        return Response(self.registry.render(),
+                        mimetype='text/plain; version=0.0.4')
+
+
+class _InstrumentationState(object):
+    """The metrics belonging to one application."""
+
+    def __init__(self, registry):
+        self.registry = registry
+        self.duration = registry.histogram(
+            'http_request_duration_seconds', 'Request wall time',
+            ('endpoint', 'method', 'status'))
+        self.queries = registry.histogram(
+            'http_request_db_queries', 'SQL queries per request',
+            ('endpoint',), COUNT_BUCKETS)
+        self.db_time = registry.histogram(
+            'http_request_db_seconds', 'Time spent in SQL per request',
+            ('endpoint',))
+        self.stages = registry.histogram(
+            'http_request_stage_seconds', 'Time spent per request stage',
+            ('endpoint', 'stage'))
+
+
+instrumentation = Instrumentation()
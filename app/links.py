@@ -0,0 +1,45 @@
+import re
+from flask import current_app, request
+
+LINK_MODES = ('absolute', 'relative', 'none')
+
+# <int:id> or <id> in a werkzeug rule
+_RULE_ARGUMENT = re.compile(r'<(?:[^:<>]+:)?([^<>]+)>')
+
+
+def _route_template(endpoint):
+    """Turns the endpoint's route into a str.format template, once per
+    application, e.g. '/api/v1/categories/{id}/recipes'.
+    """
+    templates = current_app.extensions.setdefault('link_templates', {})
+    if endpoint not in templates:
+        rule = next(current_app.url_map.iter_rules(endpoint))
+        templates[endpoint] = _RULE_ARGUMENT.sub(r'{\1}', rule.rule)
+    return templates[endpoint]
+
+
+def link_mode():
+    """The request's ?links=absolute|relative|none, else LINKS_MODE."""
+    mode = str(request.args.get('links', '')).lower()
+    if mode in LINK_MODES:
+        return mode
+    return current_app.config.get('LINKS_MODE', 'absolute')
+
+
+def link_builder(endpoint):
+    """Returns a function building links to endpoint by plain string
+    formatting, or None when the request asked for no links.
+
+    The route is resolved once per application and the host and the
+    prefix the app is mounted under once per call, instead of a url_for
+    per row. Values are substituted as they are, so this is meant for
+    routes taking integer ids.
+    """
+    mode = link_mode()
+    if mode == 'none':
+        return None
+    if mode == 'absolute':
+        root = request.url_root.rstrip('/')
+    else:
+        root = request.script_root
+    return (root + _route_template(endpoint)).format
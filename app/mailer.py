@@ -0,0 +1,222 @@
+import logging
+import queue
+import smtplib
+import threading
+import time
+from flask import current_app
+from flask_mail import Mail, sanitize_address, sanitize_addresses
+
+logger = logging.getLogger(__name__)
+
+
+class SMTPBackend(object):
+    """Delivers over one SMTP connection that is kept open between
+    batches and reopened after an error or MAIL_IDLE_TIMEOUT seconds
+    without mail.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.connection = None
+
+    def open(self):
+        if self.connection is not None:
+            return
+        config = self.config
+        smtp = smtplib.SMTP_SSL if config['MAIL_USE_SSL'] else smtplib.SMTP
+        connection = smtp(config['MAIL_SERVER'], config['MAIL_PORT'],
+                          timeout=config['MAIL_TIMEOUT'])
+        if config['MAIL_USE_TLS']:
+            connection.starttls()
+        if config['MAIL_USERNAME'] and config['MAIL_PASSWORD']:
+            connection.login(config['MAIL_USERNAME'], config['MAIL_PASSWORD'])
+        self.connection = connection
+
+    def send(self, message):
+        self.open()
+        self.connection.sendmail(
+            sanitize_address(message.sender),
+            list(sanitize_addresses(message.send_to)),
+            message.as_bytes())
+
+    def close(self):
+        connection, self.connection = self.connection, None
+        if connection is not None:
+            try:
+                connection.quit()
+            except (smtplib.SMTPException, OSError):
+                connection.close()
+
+
+class LocmemBackend(object):
+    """Keeps sent messages in outbox, for tests and local development.
+    Setting failures makes that many sends raise, to exercise retries.
+    """
+
+    def __init__(self, config):
+        self.outbox = []
+        self.failures = 0
+        self.connections = 0
+        self.connected = False
+
+    def send(self, message):
+        if self.failures:
+            self.failures -= 1
+            raise smtplib.SMTPServerDisconnected(
+                'Connection unexpectedly closed')
+        if not self.connected:
+            self.connected = True
+            self.connections += 1
+        self.outbox.append(message)
+
+    def close(self):
+        self.connected = False
+
+
+BACKENDS = {
+    'smtp': SMTPBackend,
+    'locmem': LocmemBackend,
+}
+
+
+class Mailer(object):
+    """Sends email from a background worker instead of the request.
+
+    send() only puts a message on the queue. A worker thread, started
+    with the first message, drains the queue in batches of up to
+    MAIL_BATCH_SIZE over one reused connection and retries a failed
+    batch MAIL_MAX_RETRIES times, waiting MAIL_RETRY_BACKOFF seconds
+    and doubling that after each attempt.
+    """
+
+    def __init__(self, app=None):
+        self.app = app
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('MAIL_BACKEND', 'smtp')
+        app.config.setdefault('MAIL_SERVER', 'localhost')
+        app.config.setdefault('MAIL_PORT', 25)
+        app.config.setdefault('MAIL_USE_SSL', False)
+        app.config.setdefault('MAIL_USE_TLS', False)
+        app.config.setdefault('MAIL_USERNAME', None)
+        app.config.setdefault('MAIL_PASSWORD', None)
+        app.config.setdefault('MAIL_TIMEOUT', 30)
+        app.config.setdefault('MAIL_BATCH_SIZE', 50)
+        app.config.setdefault('MAIL_MAX_RETRIES', 3)
+        app.config.setdefault('MAIL_RETRY_BACKOFF', 1.0)
+        app.config.setdefault('MAIL_IDLE_TIMEOUT', 30)
+        # flask_mail builds the messages
+        Mail(app)
+        app.extensions['mailer'] = _MailerState(app)
+
+    @property
+    def state(self):
+        return current_app.extensions['mailer']
+
+    @property
+    def backend(self):
+        return self.state.backend
+
+    def send(self, message):
+        """Queues a flask_mail Message and returns straight away."""
+        state = self.state
+        state.queue.put(message)
+        state.start()
+
+    def flush(self, timeout=None):
+        """Waits until every queued message was sent or given up on.
+        Returns False if the timeout ran out first.
+        """
+        state = self.state
+        with state.queue.all_tasks_done:
+            deadline = time.time() + timeout if timeout is not None else None
+            while state.queue.unfinished_tasks:
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return False
+                state.queue.all_tasks_done.wait(remaining)
+        return True
+
+    def stats(self):
+        state = self.state
+        return {'queued': state.queue.qsize(), 'sent': state.sent,
+                'failed': state.failed, 'retries': state.retries}
+
+
+class _MailerState(object):
+    """The queue, backend and worker belonging to one application."""
+
+    def __init__(self, app):
+        self.app = app
+        self.config = app.config
+        self.backend = BACKENDS[app.config['MAIL_BACKEND']](app.config)
+        self.queue = queue.Queue()
+        self.worker = None
+        self.lock = threading.Lock()
+        self.sent = self.failed = self.retries = 0
+
+    def start(self):
+        with self.lock:
+            if self.worker is None or not self.worker.is_alive():
+                self.worker = threading.Thread(
+                    target=self.run, name='mailer', daemon=True)
+                self.worker.start()
+
+    def run(self):
+        while True:
+            try:
+                message = self.queue.get(
+                    timeout=self.config['MAIL_IDLE_TIMEOUT'])
+            except queue.Empty:
+                # nothing to send for a while, let the server go
+                self.backend.close()
+                continue
+            batch = [message]
+            while len(batch) < self.config['MAIL_BATCH_SIZE']:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                with self.app.app_context():
+                    self.deliver(list(batch))
+            except Exception:
+                # keep the worker alive for the next batch
+                logger.exception('Could not deliver a batch of email')
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    def deliver(self, batch):
+        backoff = self.config['MAIL_RETRY_BACKOFF']
+        attempt = 0
+        while batch:
+            try:
+                self.backend.send(batch[0])
+            except (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused,
+                    smtplib.SMTPDataError) as error:
+                # the server turned this message down, retrying won't help
+                logger.error('Could not send to %s: %s',
+                             batch[0].send_to, error)
+                self.failed += 1
+                batch.pop(0)
+                continue
+            except (smtplib.SMTPException, OSError) as error:
+                self.backend.close()
+                if attempt >= self.config['MAIL_MAX_RETRIES']:
+                    logger.error('Giving up on %d message(s): %s',
+                                 len(batch), error)
+                    self.failed += len(batch)
+                    return
+                time.sleep(backoff * 2 ** attempt)
+                attempt += 1
+                self.retries += 1
+                continue
+            batch.pop(0)
+            self.sent += 1
+            attempt = 0
+
+
+mailer = Mailer()
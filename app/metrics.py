@@ -0,0 +1,118 @@
+import threading
+from bisect import bisect_left
+
+# seconds, the prometheus client defaults
+TIME_BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100)
+
+
+def _labels(names, values):
+    if not names:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(
+        name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+        for name, value in zip(names, values)) + '}'
+
+
+def _number(value):
+    return repr(float(value)) if value != float('inf') else '+Inf'
+
+
+class Histogram(object):
+    """A labelled histogram with fixed upper bounds, like prometheus's."""
+
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=TIME_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        with self.lock:
+            counts = self.series.get(labels)
+            if counts is None:
+                # a count per bucket, +Inf, then the sum
+                counts = [0] * (len(self.buckets) + 1) + [0.0]
+                self.series[labels] = counts
+            counts[bisect_left(self.buckets, value)] += 1
+            counts[-1] += value
+
+    def samples(self):
+        with self.lock:
+            series = dict((labels, list(counts))
+                          for labels, counts in self.series.items())
+        for labels, counts in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                yield ('_bucket', self.labels + ('le',),
+                       labels + (_number(bound),), cumulative)
+            yield '_sum', self.labels, labels, counts[-1]
+            yield '_count', self.labels, labels, cumulative
+
+
+class Counter(object):
+    """A labelled counter."""
+
+    kind = 'counter'
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self.lock:
+            self.series[labels] = self.series.get(labels, 0) + amount
+
+    def samples(self):
+        with self.lock:
+            series = dict(self.series)
+        for labels, value in sorted(series.items()):
+            yield '', self.labels, labels, value
+
+
+class MetricsRegistry(object):
+    """Holds an application's metrics and renders them as prometheus
+    text. Collectors are callables returning (name, kind, help, value)
+    for figures read at scrape time, such as cache statistics.
+    """
+
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+
+    def histogram(self, name, help, labels=(), buckets=TIME_BUCKETS):
+        metric = Histogram(name, help, labels, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labels=()):
+        metric = Counter(name, help, labels)
+        self.metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector):
+        self.collectors.append(collector)
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.append('# HELP {} {}'.format(metric.name, metric.help))
+            lines.append('# TYPE {} {}'.format(metric.name, metric.kind))
+            for suffix, names, values, value in metric.samples():
+                lines.append('{}{}{} {}'.format(
+                    metric.name, suffix, _labels(names, values),
+                    _number(value)))
+        for collector in self.collectors:
+            for name, kind, help, value in collector():
+                lines.append('# HELP {} {}'.format(name, help))
+                lines.append('# TYPE {} {}'.format(name, kind))
+                lines.append('{} {}'.format(name, _number(value)))
+        return '\n'.join(lines) + '\n'
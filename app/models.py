@@ -1,9 +1,12 @@
 
 import jwt
 from app import db
+from app.passwords import password_hasher
+from app.revocation import revocation_cache, token_digest
+from app.serializers import CATEGORY_PLAN, RECIPE_PLAN
+from app.token_cache import token_cache
 from datetime import datetime, timedelta
 from flask import current_app
-from flask_bcrypt import Bcrypt
 
 
 class User(db.Model):
@@ -16,20 +19,33 @@ class User(db.Model):
     username = db.Column(db.String(120), nullable=False)
     email = db.Column(db.String(256), nullable=False, unique=True)
     password = db.Column(db.String(256), nullable=False)
+    # kept current by triggers, see app/counters.py
+    category_count = db.Column(db.Integer, nullable=False, default=0,
+                               server_default='0')
+    # ON DELETE CASCADE removes the rows, so the ORM never loads them
     categories = db.relationship(
-        'Category', order_by='Category.id', cascade="all, delete-orphan", lazy='dynamic')
+        'Category', order_by='Category.id', cascade="all, delete-orphan",
+        lazy='dynamic', passive_deletes=True)
 
     def __init__(self, email, password, username):
         """Initialize the user with an email and a password."""
         self.email = email
         self.username = username
-        self.password = Bcrypt().generate_password_hash(password).decode()
+        self.set_password(password)
+
+    def set_password(self, password):
+        """Hashes the password with the configured work factor."""
+        self.password = password_hasher.generate_password_hash(password)
 
     def password_is_valid(self, password):
         """
         Checks the password against it's hash to validates the user's password
         """
-        return Bcrypt().check_password_hash(self.password, password)
+        return password_hasher.check_password_hash(self.password, password)
+
+    def password_needs_rehash(self):
+        """Checks whether the stored hash uses an outdated work factor."""
+        return password_hasher.needs_rehash(self.password)
 
     def save(self):
         """Save a user to the database.
@@ -64,13 +80,18 @@ class User(db.Model):
     def decode_token(token):
         """Decodes the access token from the Authorization header."""
         try:
-            # try to decode the token using our SECRET variable
-            payload = jwt.decode(token, current_app.config.get('SECRET'))
-            token_is_revoked = RevokedToken.check_revoked_token(auth_token=token)
+            digest = token_digest(token)
+            user_id = token_cache.get(digest)
+            if user_id is None:
+                # try to decode the token using our SECRET variable
+                payload = jwt.decode(token, current_app.config.get('SECRET'))
+                user_id = payload['sub']
+                token_cache.set(digest, user_id, payload['exp'])
+            token_is_revoked = revocation_cache.is_digest_revoked(digest)
             if token_is_revoked:
                 return 'Revoked token. please login to get a new token'
             else:
-                return payload['sub']
+                return user_id
         except jwt.ExpiredSignatureError:
             # the token is expired, return an error string
             return "Expired token. Please login to get a new token"
@@ -86,30 +107,63 @@ class RevokedToken(db.Model):
     __tablename__ = 'revoked_tokens'
 
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
-    token = db.Column(db.String(500), unique=True, nullable=False)
-    revoked_on = db.Column(db.DateTime, default=db.func.current_timestamp(), nullable=False)
-
-    def __init__(self, token):
-        self.token = token
+    # a fixed width digest of the token keeps the unique index small
+    token_hash = db.Column(db.String(64), unique=True, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    # revocation_cache syncs the rows revoked since its last look
+    revoked_on = db.Column(db.DateTime, default=db.func.current_timestamp(),
+                           nullable=False, index=True)
+
+    def __init__(self, token, expires_at=None):
+        self.token_hash = token_digest(token)
+        if expires_at is None:
+            expires_at = RevokedToken.token_expiry(token)
+        self.expires_at = expires_at
 
     def save(self):
         """Save to database table"""
         db.session.add(self)
         db.session.commit()
+        revocation_cache.add_digest(self.token_hash)
+        token_cache.evict(self.token_hash)
+
+    @staticmethod
+    def token_expiry(token):
+        """Reads the expiry time of a token that has already been verified"""
+        payload = jwt.decode(token, verify=False)
+        return datetime.utcfromtimestamp(payload['exp'])
 
     @staticmethod
     def check_revoked_token(auth_token):
         """function to check if token is revoked
         """
-        # check whether token has been revoked
-        res = RevokedToken.query.filter_by(token=str(auth_token)).first()
-        if res:
-            return True
-        else:
-            return False
+        # the revocation cache only queries the table on a filter hit
+        return revocation_cache.is_revoked(auth_token)
+
+    @staticmethod
+    def prune_expired(batch_size=1000, max_batches=None):
+        """Deletes revoked tokens whose expiry has passed, in batches.
+        An expired token is already rejected by jwt.decode, so its row
+        is no longer needed. Returns the number of deleted rows.
+        """
+        deleted = 0
+        batches = 0
+        while max_batches is None or batches < max_batches:
+            ids = [row.id for row in RevokedToken.query.with_entities(
+                RevokedToken.id).filter(
+                    RevokedToken.expires_at < datetime.utcnow()).limit(
+                        batch_size)]
+            if not ids:
+                break
+            RevokedToken.query.filter(RevokedToken.id.in_(ids)).delete(
+                synchronize_session=False)
+            db.session.commit()
+            deleted += len(ids)
+            batches += 1
+        return deleted
 
     def __repr__(self):
-        return '<id: token: {}'.format(self.token)
+        return '<id: token: {}'.format(self.token_hash)
 
 
 class Category(db.Model):
@@ -120,17 +174,28 @@ class Category(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(255))
     recipes = db.relationship(
-        'Recipe', order_by='Recipe.id', cascade="all, delete-orphan", lazy='dynamic')
+        'Recipe', order_by='Recipe.id', cascade="all, delete-orphan",
+        lazy='dynamic', passive_deletes=True)
     date_created = db.Column(db.DateTime, default=db.func.current_timestamp())
     date_modified = db.Column(
         db.DateTime, default=db.func.current_timestamp(),
         onupdate=db.func.current_timestamp())
-    created_by = db.Column(db.Integer, db.ForeignKey(User.id))
+    created_by = db.Column(db.Integer,
+                           db.ForeignKey(User.id, ondelete='CASCADE'))
+    # kept current by triggers, see app/counters.py
+    recipe_count = db.Column(db.Integer, nullable=False, default=0,
+                             server_default='0')
+    # match find_by_name, find_user_by_id and the listing order
+    __table_args__ = (
+        db.UniqueConstraint('created_by', 'name',
+                            name='uq_categories_created_by_name'),
+        db.Index('ix_categories_created_by_date_created',
+                 'created_by', date_created.desc(), id.desc()),
+    )
 
     def category_json(self):
         """This method jsonifies the recipe model"""
-        return {'id':self.id, 'name': self.name, 'date_created':self.date_created,
-                'date_modified':self.date_modified, 'created_by':self.created_by}
+        return CATEGORY_PLAN.dump(self)
 
     def save(self):
         db.session.add(self)
@@ -167,12 +232,19 @@ class Recipe(db.Model):
     date_created = db.Column(db.DateTime, default=db.func.current_timestamp())
     date_modified = db.Column(db.DateTime, default=db.func.current_timestamp(),
                               onupdate=db.func.current_timestamp())
-    category_identity = db.Column(db.Integer, db.ForeignKey(Category.id))
+    category_identity = db.Column(
+        db.Integer, db.ForeignKey(Category.id, ondelete='CASCADE'))
+    # match find_by_title, find_recipe_by_id and the listing filter
+    __table_args__ = (
+        db.UniqueConstraint('category_identity', 'title',
+                            name='uq_recipes_category_identity_title'),
+        db.Index('ix_recipes_category_identity_id',
+                 'category_identity', 'id'),
+    )
 
     def json(self):
         """This method jsonifies the recipe model"""
-        return {'id':self.id,'title': self.title, 'description': self.description, 'date_created':self.date_created,
-                'date_modified':self.date_modified, 'category_identity':self.category_identity}
+        return RECIPE_PLAN.dump(self)
 
     def save(self):
         db.session.add(self)
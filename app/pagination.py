@@ -0,0 +1,104 @@
+import base64
+import json
+from datetime import datetime
+from flask import request
+from flask_sqlalchemy import Pagination
+from sqlalchemy import and_, func, or_
+
+DATETIME_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+SQLITE_DATETIME_FORMAT = '%Y-%m-%d %H:%M:%f'
+
+
+class InvalidCursor(ValueError):
+    """Raised when a client sends a cursor this server did not issue."""
+
+
+def encode_cursor(values):
+    """Packs the sort key of the last row into an opaque string."""
+    packed = [{'dt': value.strftime(DATETIME_FORMAT)}
+              if isinstance(value, datetime) else value for value in values]
+    return base64.urlsafe_b64encode(
+        json.dumps(packed, separators=(',', ':')).encode()).decode()
+
+
+def decode_cursor(cursor, size):
+    try:
+        packed = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+        values = [datetime.strptime(value['dt'], DATETIME_FORMAT)
+                  if isinstance(value, dict) else value for value in packed]
+    except (ValueError, TypeError, KeyError):
+        raise InvalidCursor(cursor)
+    if not isinstance(values, list) or len(values) != size:
+        raise InvalidCursor(cursor)
+    return values
+
+
+def wants_count():
+    """Cursor pages skip the total count unless ?count=true is passed."""
+    return request.args.get('count', '').lower() in ('1', 'true', 'yes')
+
+
+def paginate(query, page, per_page, total=None):
+    """Paginates like Query.paginate(error_out=False), but takes the total
+    when the caller already knows it, e.g. from a counter column, so no
+    COUNT is issued. A page past the end skips the items query too.
+    """
+    page = max(page, 1)
+    if per_page < 0:
+        per_page = 20
+    if total is None:
+        total = query.order_by(None).count()
+    items = []
+    if (page - 1) * per_page < total:
+        items = query.limit(per_page).offset((page - 1) * per_page).all()
+    return Pagination(query, page, per_page, total, items)
+
+
+def keyset_page(query, columns, cursor, limit, descending=False):
+    """Returns one page of query seeking past cursor on the given columns.
+
+    columns must form a unique sort key, the last one is normally the
+    primary key. An empty cursor starts at the first page. The result is
+    the rows of the page and the cursor of the next one, or None when this
+    is the last page. No COUNT or OFFSET is issued.
+    """
+    limit = max(limit, 1)
+    if cursor:
+        values = decode_cursor(cursor, len(columns))
+        dialect = query.session.get_bind().dialect.name
+        query = query.filter(_seek(columns, values, descending, dialect))
+    order = [column.desc() if descending else column.asc()
+             for column in columns]
+    items = query.order_by(*order).limit(limit + 1).all()
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        next_cursor = encode_cursor(
+            [getattr(items[-1], column.key) for column in columns])
+    return items, next_cursor
+
+
+def _seek(columns, values, descending, dialect):
+    """Builds (a, b) > (x, y) as a < x OR (a = x AND b < y) for any width."""
+    if dialect == 'sqlite':
+        columns, values = _sqlite_comparable(columns, values)
+    clauses = []
+    for i, column in enumerate(columns):
+        equal = [columns[j] == values[j] for j in range(i)]
+        past = column < values[i] if descending else column > values[i]
+        clauses.append(and_(*(equal + [past])))
+    return or_(*clauses)
+
+
+def _sqlite_comparable(columns, values):
+    """SQLite keeps datetimes as text and CURRENT_TIMESTAMP drops the
+    fraction, so compare both sides in one fixed width format.
+    """
+    compared_columns, compared_values = [], []
+    for column, value in zip(columns, values):
+        if isinstance(value, datetime):
+            column = func.strftime(SQLITE_DATETIME_FORMAT, column)
+            value = value.strftime(DATETIME_FORMAT)[:-3].replace('T', ' ')
+        compared_columns.append(column)
+        compared_values.append(value)
+    return compared_columns, compared_values
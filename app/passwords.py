@@ -0,0 +1,66 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+from flask_bcrypt import Bcrypt
+
+
+class PasswordHasher(object):
+    """Runs bcrypt hashing and verification in a bounded thread pool.
+
+    The request thread still waits for its hash, so a sync worker, one
+    request at a time, gains nothing. bcrypt releases the GIL, which
+    lets the request threads of a threaded worker hash on several cores
+    at once, and the pool caps how many do: BCRYPT_POOL_SIZE, by default
+    the number of cores, since more hashes at once only slow each other
+    down. The work factor is read from BCRYPT_LOG_ROUNDS.
+    """
+
+    def __init__(self, app=None):
+        self.app = app
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('BCRYPT_LOG_ROUNDS', 12)
+        app.config.setdefault('BCRYPT_POOL_SIZE', os.cpu_count() or 1)
+        app.extensions['password_hasher'] = _HasherState(app)
+
+    @property
+    def state(self):
+        return current_app.extensions['password_hasher']
+
+    def generate_password_hash(self, password):
+        """Hashes a password with the configured work factor."""
+        state = self.state
+        return state.pool.submit(
+            state.bcrypt.generate_password_hash, password).result().decode()
+
+    def check_password_hash(self, pw_hash, password):
+        state = self.state
+        return state.pool.submit(
+            state.bcrypt.check_password_hash, pw_hash, password).result()
+
+    def needs_rehash(self, pw_hash):
+        """Checks whether a hash was made with a different work factor."""
+        return hash_rounds(pw_hash) != self.state.rounds
+
+
+class _HasherState(object):
+    """The configured hasher and worker pool belonging to one application."""
+
+    def __init__(self, app):
+        self.bcrypt = Bcrypt(app)
+        self.rounds = app.config['BCRYPT_LOG_ROUNDS']
+        self.pool = ThreadPoolExecutor(
+            max_workers=app.config['BCRYPT_POOL_SIZE'])
+
+
+def hash_rounds(pw_hash):
+    """Reads the work factor out of a '$2b$12$...' bcrypt hash."""
+    try:
+        return int(pw_hash.split('$')[2])
+    except (IndexError, ValueError):
+        return None
+
+
+password_hasher = PasswordHasher()
@@ -0,0 +1,146 @@
+import re
+from collections import Counter, deque
+from contextlib import contextmanager
+from flask import current_app, g, has_app_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# IN lists of any length audit as one statement
+_PARAMETER_LIST = re.compile(
+    r'\((?:\s*(?:%\(\w+\)s|\?|:\w+)\s*,)*\s*(?:%\(\w+\)s|\?|:\w+)\s*\)')
+_SPACE = re.compile(r'\s+')
+
+
+class QueryBudgetExceeded(AssertionError):
+    """An endpoint ran more queries than its QUERY_BUDGETS entry."""
+
+
+def normalize(statement):
+    """Reduces a statement to its shape, so executions that only differ
+    in their parameters compare equal.
+    """
+    return _PARAMETER_LIST.sub('(?)', _SPACE.sub(' ', statement).strip())
+
+
+def _hashable(parameters):
+    if isinstance(parameters, dict):
+        return tuple(sorted((key, repr(value))
+                            for key, value in parameters.items()))
+    return repr(parameters)
+
+
+def _record(conn, cursor, statement, parameters, context, executemany):
+    if has_app_context():
+        log = g.get('query_log')
+        if log is not None:
+            log.append((statement, _hashable(parameters)))
+
+
+@contextmanager
+def unaudited():
+    """Leaves the statements run inside out of the request's log, for
+    upkeep any request may happen to trigger, like a cache refresh.
+    """
+    log = g.pop('query_log', None) if has_app_context() else None
+    try:
+        yield
+    finally:
+        if log is not None:
+            g.query_log = log
+
+
+class QueryReport(object):
+    """What one request ran: every statement, the statements run more
+    than once with the same parameters (duplicates) and the statement
+    shapes run at least QUERY_AUDIT_N_PLUS_ONE times with different
+    parameters, the mark of a query per row (n_plus_one).
+    """
+
+    def __init__(self, endpoint, method, log, n_plus_one_threshold):
+        self.endpoint = endpoint
+        self.method = method
+        self.statements = [statement for statement, _ in log]
+        self.duplicates = [statement for (statement, _), count
+                           in Counter(log).items() if count > 1]
+        shapes = Counter(normalize(statement) for statement, _ in set(log))
+        self.n_plus_one = [shape for shape, count in shapes.items()
+                           if count >= n_plus_one_threshold]
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def __repr__(self):
+        return '<QueryReport {} {}: {} queries>'.format(
+            self.method, self.endpoint, self.count)
+
+
+class QueryAudit(object):
+    """Captures the SQL of each request when QUERY_AUDIT_ENABLED is set.
+
+    Duplicate and N+1 statements are logged as warnings, and so is an
+    endpoint going over its QUERY_BUDGETS entry, e.g.
+    {'recipe.get_recipe_by_id': 2}. With QUERY_AUDIT_STRICT an exceeded
+    budget raises QueryBudgetExceeded instead, which is how the test
+    suite turns query count regressions into failures. The latest
+    reports are kept for inspection, see reports().
+    """
+
+    def __init__(self, app=None):
+        self.app = app
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('QUERY_AUDIT_ENABLED', False)
+        app.config.setdefault('QUERY_AUDIT_STRICT', False)
+        app.config.setdefault('QUERY_AUDIT_N_PLUS_ONE', 3)
+        app.config.setdefault('QUERY_AUDIT_HISTORY', 100)
+        app.config.setdefault('QUERY_BUDGETS', {})
+        if not app.config['QUERY_AUDIT_ENABLED']:
+            return
+        if not event.contains(Engine, 'before_cursor_execute', _record):
+            event.listen(Engine, 'before_cursor_execute', _record)
+        app.extensions['query_audit'] = deque(
+            maxlen=app.config['QUERY_AUDIT_HISTORY'])
+        app.before_request(self._start)
+        app.after_request(self._finish)
+
+    def reports(self):
+        """The reports of recent requests, oldest first."""
+        return list(current_app.extensions['query_audit'])
+
+    def last_report(self):
+        reports = current_app.extensions['query_audit']
+        return reports[-1] if reports else None
+
+    def _start(self):
+        g.query_log = []
+
+    def _finish(self, response):
+        log = g.pop('query_log', None)
+        if log is None:
+            return response
+        config = current_app.config
+        report = QueryReport(request.endpoint, request.method, log,
+                             config['QUERY_AUDIT_N_PLUS_ONE'])
+        current_app.extensions['query_audit'].append(report)
+        logger = current_app.logger
+        for statement in report.duplicates:
+            logger.warning('Duplicate query in %s: %s',
+                           report.endpoint, statement)
+        for shape in report.n_plus_one:
+            logger.warning('Possible N+1 query in %s: %s',
+                           report.endpoint, shape)
+        budget = config['QUERY_BUDGETS'].get(report.endpoint)
+        if budget is not None and report.count > budget:
+            message = '{} {} ran {} queries, its budget is {}'.format(
+                report.method, report.endpoint, report.count, budget)
+            if config['QUERY_AUDIT_STRICT']:
+                raise QueryBudgetExceeded(
+                    message + ':\n' + '\n'.join(report.statements))
+            logger.warning(message)
+        return response
+
+
+query_audit = QueryAudit()
@@ -1,10 +1,17 @@
 import re
 from .import recipe
-from flask import request, jsonify, abort, make_response
-from sqlalchemy import or_
+from flask import current_app, request, jsonify, abort, make_response
+from sqlalchemy import func
+from app import db, repository
 from app.models import Category, User, Recipe
 from app.categories.views import is_valid, has_numbers
 from flasgger import swag_from
+from app.conditional import (collection_etag, is_not_modified, make_etag,
+                             not_modified, validator_headers)
+from app.pagination import InvalidCursor, keyset_page, paginate, wants_count
+from app.response_cache import response_cache
+from app.search import search_recipes
+from app.serializers import RECIPE_PLAN, json_response
 from .validations import valid_recipe_title, authentication
 
 
@@ -21,21 +28,101 @@ def add_recipes(user_id, id, **kwargs):
         result1 = valid_recipe_title(title)
         if result1:
             return jsonify(result1), 400
-        identity = Category.find_user_by_id(id, user_id)
-        if not identity:
-            return jsonify({"message": "Category doesn't exist"}), 400
-        result = Recipe.find_by_id(title, id)
-        if result:
-            return jsonify({"message": "Recipe already exists"}), 400
         if title:
-            recipe = Recipe(title=title, description=description,
-                            category_identity=id)
-            recipe.save()
-            return recipe.json(), 201
+            try:
+                recipe = repository.create_recipe(
+                    user_id, id, title, description)
+            except repository.CategoryNotFound:
+                return jsonify({"message": "Category doesn't exist"}), 400
+            except repository.Conflict:
+                return jsonify({"message": "Recipe already exists"}), 400
+            response_cache.bump(user_id)
+            return RECIPE_PLAN.dump(recipe), 201
+
+
+@recipe.route('/api/v1/categories/<int:id>/recipes/batch', methods=['POST'])
+@authentication
+@swag_from('/app/docs/addrecipesbatch.yml')
+def add_recipes_batch(user_id, id, **kwargs):
+    """This route handles posting many recipes in one transaction"""
+
+    data = request.data
+    items = data.get('recipes') if isinstance(data, dict) else data
+    if not isinstance(items, list) or not items:
+        return jsonify({"message": "Provide a list of recipes"}), 400
+    batch_limit = current_app.config.get('RECIPE_BATCH_LIMIT', 1000)
+    if len(items) > batch_limit:
+        return jsonify({"message": "A batch can have at most {}"
+                        " recipes".format(batch_limit)}), 413
+    atomic = str(request.args.get('mode', 'partial')).lower() == 'atomic'
+
+    results = []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            item = {}
+        title = str(item.get('title', '')).strip().lower()
+        title = re.sub(' +', ' ', title)
+        result = {'index': index, 'title': title}
+        error = valid_recipe_title(title)
+        if error:
+            result.update(status=400, **error)
+        result['description'] = str(item.get('description', ''))
+        results.append(result)
+
+    titles = set()
+    for result in results:
+        if 'status' in result:
+            continue
+        if result['title'] in titles:
+            # later copies of a title in the same batch are duplicates
+            result.update(status=400, message="Recipe already exists")
+        else:
+            titles.add(result['title'])
+            result['status'] = 201
+    to_create = [r for r in results if r['status'] == 201]
+    if atomic and len(to_create) < len(results):
+        to_create = []
+    try:
+        created, existing = repository.create_recipes(
+            user_id, id, [{'title': r['title'], 'description': r['description']}
+                          for r in to_create], atomic=atomic)
+    except repository.CategoryNotFound:
+        return jsonify({"message": "Category doesn't exist"}), 400
+    except repository.Conflict:
+        # another request created one of the titles first
+        return jsonify({"message": "Recipe already exists"}), 400
+    for result in to_create:
+        if result['title'] in existing:
+            result.update(status=400, message="Recipe already exists")
+    failed = sum(r['status'] != 201 for r in results)
+    if created:
+        response_cache.bump(user_id)
+    for result in results:
+        if result['status'] != 201:
+            continue
+        if result['title'] in created:
+            result['recipe'] = RECIPE_PLAN.dump(created[result['title']])
+        else:
+            result.update(status=424, message="Not created, another"
+                          " recipe in the batch failed")
+    to_create = [r for r in results if r['status'] == 201]
+    for result in results:
+        del result['description']
+
+    if not failed:
+        status = 201
+    elif to_create:
+        status = 207
+    else:
+        status = 400
+    return jsonify({'results': results, 'created': len(to_create),
+                    'failed': failed}), status
 
 
 @recipe.route('/api/v1/categories/<int:id>/recipes', methods=['GET'])
 @authentication
+@response_cache.cached
+@db.read_only
 @swag_from('/app/docs/getrecipes.yml')
 def get_recipes(user_id, id, **kwargs):
     """This route handles getting recipes"""
@@ -49,17 +136,27 @@ def get_recipes(user_id, id, **kwargs):
                         " the recipes in that category"}), 400
     recipes = Recipe.query.filter(
         Recipe.category_identity == id)
+    # the category's counter stands in for a COUNT over its recipes
+    total = identity.recipe_count
     if search_query:
-        recipes = recipes.filter(
-            or_(Recipe.title.like('%' + search_query.strip().lower() + '%'),
-                Recipe.description.like('%' + search_query.strip().lower() + '%')))
-    recipes = recipes.paginate(
-        page=page, per_page=limit, error_out=False)
-    results = []
-    for recipe in recipes.items:
-        results.append({
-            'recipe': recipe.json(),
-        })
+        total = None
+        recipes = search_recipes(
+            recipes, search_query, db.engine.dialect.name,
+            # cursor pages seek on id, so they keep id order
+            by_relevance=(request.args.get('order') == 'relevance' and
+                          'cursor' not in request.args))
+    etag, last_modified = collection_etag(
+        recipes, Recipe.date_modified, user_id, total=total)
+    # a deletion leaves max(date_modified) alone, so only the tag,
+    # which also covers the row count, can prove a listing is unchanged
+    if etag and is_not_modified(etag):
+        return not_modified(etag, last_modified)
+    headers = validator_headers(etag, last_modified) if etag else {}
+    if 'cursor' in request.args:
+        return get_recipes_by_cursor(recipes, limit, headers, total)
+    recipes = paginate(recipes, page, limit, total)
+    results = [{'recipe': row}
+               for row in RECIPE_PLAN.dump_many(recipes.items)]
     pagination_details = {
             'Next_page': recipes.next_num,
             'current_page': recipes.page,
@@ -67,7 +164,65 @@ def get_recipes(user_id, id, **kwargs):
             'total_Items': recipes.total,
             'total_pages':recipes.pages,}
     if results:
-        return jsonify({'recipes': results, **pagination_details}), 200
+        return json_response({'recipes': results, **pagination_details},
+                             headers=headers)
+    return jsonify({"message": "No recipes found"}), 404
+
+
+def get_recipes_by_cursor(recipes, limit, headers, total=None):
+    """Returns a page of recipes seeking on id"""
+    try:
+        items, next_cursor = keyset_page(
+            recipes, [Recipe.id], request.args.get('cursor'), limit)
+    except InvalidCursor:
+        return jsonify({"message": "Invalid cursor"}), 400
+    results = [{'recipe': row} for row in RECIPE_PLAN.dump_many(items)]
+    pagination_details = {'next_cursor': next_cursor}
+    if wants_count():
+        pagination_details['total_Items'] = (
+            recipes.count() if total is None else total)
+    if results:
+        return json_response({'recipes': results, **pagination_details},
+                             headers=headers)
+    return jsonify({"message": "No recipes found"}), 404
+
+
+@recipe.route('/api/v1/recipes', methods=['GET'])
+@authentication
+@response_cache.cached
+@db.read_only
+@swag_from('/app/docs/searchrecipes.yml')
+def search_all_recipes(user_id, **kwargs):
+    """This route handles searching recipes across all of a user's categories"""
+
+    limit = request.args.get('limit', 6, type=int)
+    search_query = str(request.args.get('q', '')).lower()
+    category_id = request.args.get('category', type=int)
+    # one joined query replaces an ownership check per category
+    recipes = Recipe.query.join(
+        Category, Recipe.category_identity == Category.id).filter(
+            Category.created_by == user_id)
+    if category_id is not None:
+        recipes = recipes.filter(Recipe.category_identity == category_id)
+    if search_query:
+        recipes = search_recipes(recipes, search_query, db.engine.dialect.name)
+    try:
+        items, next_cursor = keyset_page(
+            recipes, [Recipe.id], request.args.get('cursor'), limit)
+    except InvalidCursor:
+        return jsonify({"message": "Invalid cursor"}), 400
+    results = [{'recipe': row} for row in RECIPE_PLAN.dump_many(items)]
+    response = {'recipes': results, 'next_cursor': next_cursor}
+    if wants_count():
+        response['total_Items'] = recipes.count()
+    if request.args.get('facets', '').lower() in ('1', 'true', 'yes'):
+        facets = recipes.with_entities(
+            Category.id, Category.name, func.count(Recipe.id)).group_by(
+                Category.id, Category.name).order_by(Category.name)
+        response['facets'] = [{'id': cat_id, 'name': name, 'count': count}
+                              for cat_id, name, count in facets]
+    if results:
+        return json_response(response)
     return jsonify({"message": "No recipes found"}), 404
 
 
@@ -78,17 +233,17 @@ def get_recipes(user_id, id, **kwargs):
 def delete_recipe(user_id, id, recipe_id, **kwargs):
     """This route handles deleting a recipe by id"""
 
-    identity = Category.find_user_by_id(id, user_id)
-    if not identity:
+    try:
+        title = repository.delete_recipe(user_id, id, recipe_id)
+    except repository.CategoryNotFound:
         return jsonify({"message": "You don't have"
                         " that recipe in that category"}), 400
-    recipe = Recipe.find_recipe_by_id(recipe_id, id)
-    if not recipe:
+    except repository.NotFound:
         return jsonify({"message": "No recipes with"
                         " that id to delete "}), 404
-    recipe.delete()
+    response_cache.bump(user_id)
     return {"message": "recipe {} deleted"
-            " successfully".format(recipe.title)}, 200
+            " successfully".format(title)}, 200
 
 
 @recipe.route('/api/v1/categories/<int:id>/recipes/<int:recipe_id>',
@@ -100,32 +255,33 @@ def edit_recipe(user_id, id, recipe_id, **kwargs):
 
     title = str(request.data.get('title', '')).strip()
     description = str(request.data.get('description', '')).strip()
-    identity = Category.find_user_by_id(id, user_id)
-    if not identity:
-        return jsonify({"message": "You don't have"
-                        " that recipe in that category"}), 400
     result2 = valid_recipe_title(title)
     if result2:
         return jsonify(result2), 400
-    title = title.lower()
-    result = Recipe.find_by_id(title, id)
-    if result and result.description == description:
-        return jsonify({"message": "Recipe already exists"}), 400
-    recipe = Recipe.find_recipe_by_id(recipe_id, id)
-    if not recipe:
+    try:
+        # an identical recipe is checked with the stripped values, the
+        # update stores them as they were sent
+        recipe = repository.update_recipe(
+            user_id, id, recipe_id,
+            str(request.data.get('title', '')).lower(),
+            str(request.data.get('description', '')),
+            title.lower(), description)
+    except repository.CategoryNotFound:
+        return jsonify({"message": "You don't have"
+                        " that recipe in that category"}), 400
+    except repository.NotFound:
         return jsonify({"message": "No recipes"
                         " with that id to edit "}), 404
-    title = str(request.data.get('title', '')).lower()
-    description = str(request.data.get('description', ''))
-    recipe.title = title
-    recipe.description = description
-    recipe.save()
-    return recipe.json(), 200
+    except repository.Conflict:
+        return jsonify({"message": "Recipe already exists"}), 400
+    response_cache.bump(user_id)
+    return RECIPE_PLAN.dump(recipe), 200
 
 
 @recipe.route('/api/v1/categories/<int:id>/recipes/<int:recipe_id>',
               methods=['GET'])
 @authentication
+@db.read_only
 @swag_from('/app/docs/getrecipe.yml')
 def get_recipe_by_id(user_id, id, recipe_id, **kwargs):
     """This route handles getting a recipe by id"""
@@ -137,4 +293,10 @@ def get_recipe_by_id(user_id, id, recipe_id, **kwargs):
     if not recipe:
         return jsonify({"message": "No recipes with"
                         " that id to get"}), 400
-    return recipe.json(), 200
+    # the row is loaded anyway, so tag its content as well as its time
+    etag = make_etag(recipe.id, recipe.title, recipe.description,
+                     recipe.date_modified)
+    if is_not_modified(etag, recipe.date_modified):
+        return not_modified(etag, recipe.date_modified)
+    return json_response(recipe.json(), headers=validator_headers(
+        etag, recipe.date_modified))
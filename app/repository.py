@@ -0,0 +1,290 @@
+from sqlalchemy import and_, exists, literal, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import IntegrityError
+from app import db
+from app.models import Category, Recipe, User
+from app.passwords import password_hasher
+
+# Each write runs as one statement where the database allows it. On
+# PostgreSQL inserts, updates and deletes hand back the row they touched
+# with RETURNING and ON CONFLICT DO NOTHING turns a duplicate into no row
+# instead of an error. SQLite has no RETURNING in this SQLAlchemy, so
+# there the row is read back with a second statement. Ownership is part
+# of every WHERE clause, so a row of another user is never touched, and
+# only a failed write pays for finding out why it failed.
+users = User.__table__
+categories = Category.__table__
+recipes = Recipe.__table__
+
+
+class RepositoryError(Exception):
+    """Base class of the errors a write can end with."""
+
+
+class Conflict(RepositoryError):
+    """A row with the same unique key already exists."""
+
+
+class NotFound(RepositoryError):
+    """The row is missing or belongs to another user."""
+
+
+class CategoryNotFound(NotFound):
+    """The category is missing or belongs to another user."""
+
+
+def has_returning():
+    return db.engine.dialect.name == 'postgresql'
+
+
+def insert_new(table, constraint):
+    """An INSERT that skips rows clashing with the unique constraint
+    instead of failing, its rowcount is the number of rows it added.
+    """
+    dialect = db.engine.dialect.name
+    if dialect == 'postgresql':
+        return pg_insert(table).on_conflict_do_nothing(constraint=constraint)
+    if dialect == 'sqlite':
+        return table.insert().prefix_with('OR IGNORE')
+    return table.insert()
+
+
+def _owned_category_ids(user_id, category_id):
+    # aliased, so the subquery never correlates with a write to categories
+    owned = categories.alias('owned')
+    return select([owned.c.id]).where(and_(
+        owned.c.id == category_id, owned.c.created_by == user_id))
+
+
+def _owns_category(user_id, category_id):
+    return db.session.execute(
+        _owned_category_ids(user_id, category_id)).first() is not None
+
+
+def _by_id(table, row_id):
+    return db.session.execute(
+        table.select().where(table.c.id == row_id)).first()
+
+
+def _is_unique_violation(error):
+    code = getattr(error.orig, 'pgcode', None)
+    if code is not None:
+        return code == '23505'
+    return 'UNIQUE constraint failed' in str(error.orig)
+
+
+def _execute(statement, rows=None):
+    """Runs a write and commits it, a unique violation raises Conflict.
+    Returns the RETURNING row, if any, else the result.
+    """
+    try:
+        result = db.session.execute(statement, rows)
+        row = result.first() if result.returns_rows else result
+        db.session.commit()
+    except IntegrityError as error:
+        db.session.rollback()
+        if not _is_unique_violation(error):
+            raise
+        raise Conflict()
+    return row
+
+
+def create_user(username, email, password):
+    """Registers a user, returns the new id or None if the email is taken."""
+    values = dict(username=username, email=email,
+                  password=password_hasher.generate_password_hash(password))
+    if has_returning():
+        row = _execute(pg_insert(users).values(**values).on_conflict_do_nothing(
+            index_elements=['email']).returning(users.c.id))
+        return row.id if row is not None else None
+    try:
+        return _execute(users.insert().values(**values)).inserted_primary_key[0]
+    except Conflict:
+        return None
+
+
+def create_category(user_id, name):
+    """Adds a category, raises Conflict when the user already has the name."""
+    values = dict(name=name, created_by=user_id)
+    if has_returning():
+        row = _execute(pg_insert(categories).values(**values)
+                       .on_conflict_do_nothing(
+                           constraint='uq_categories_created_by_name')
+                       .returning(*categories.c))
+        if row is None:
+            raise Conflict()
+        return row
+    result = _execute(categories.insert().values(**values))
+    return _by_id(categories, result.inserted_primary_key[0])
+
+
+def rename_category(user_id, category_id, name, taken_name):
+    """Renames a category of the user unless taken_name, the normalized
+    form of name, is already used by one of their categories.
+    """
+    other = categories.alias('other')
+    statement = categories.update().values(name=name).where(and_(
+        categories.c.id == category_id,
+        categories.c.created_by == user_id,
+        ~exists().where(and_(other.c.created_by == user_id,
+                             other.c.name == taken_name))))
+    if has_returning():
+        row = _execute(statement.returning(*categories.c))
+    else:
+        result = _execute(statement)
+        row = _by_id(categories, category_id) if result.rowcount else None
+    if row is None:
+        if _owns_category(user_id, category_id):
+            raise Conflict()
+        raise NotFound()
+    return row
+
+
+def delete_category(user_id, category_id):
+    """Deletes a category of the user, returns its name. Its recipes go
+    with it through ON DELETE CASCADE, however many there are.
+    """
+    owned = and_(categories.c.id == category_id,
+                 categories.c.created_by == user_id)
+    if has_returning():
+        row = _execute(categories.delete().where(owned)
+                       .returning(categories.c.name))
+    else:
+        row = db.session.execute(
+            select([categories.c.name]).where(owned)).first()
+        if row is not None:
+            _execute(categories.delete().where(owned))
+    if row is None:
+        raise NotFound()
+    return row.name
+
+
+def create_recipe(user_id, category_id, title, description):
+    """Adds a recipe to a category of the user.
+
+    Raises CategoryNotFound when the category isn't theirs and Conflict
+    when the title is taken in it.
+    """
+    source = select([literal(title), literal(description),
+                     categories.c.id]).where(and_(
+        categories.c.id == category_id, categories.c.created_by == user_id))
+    columns = ['title', 'description', 'category_identity']
+    if has_returning():
+        row = _execute(pg_insert(recipes).from_select(columns, source)
+                       .on_conflict_do_nothing(
+                           constraint='uq_recipes_category_identity_title')
+                       .returning(*recipes.c))
+        if row is None:
+            if _owns_category(user_id, category_id):
+                raise Conflict()
+            raise CategoryNotFound()
+        return row
+    result = _execute(recipes.insert().from_select(columns, source))
+    if not result.rowcount:
+        raise CategoryNotFound()
+    return _by_id(recipes, result.lastrowid)
+
+
+def create_recipes(user_id, category_id, rows, atomic=False):
+    """Adds many recipes to a category of the user.
+
+    Returns the created rows by title and the set of titles the category
+    already had, which are skipped. In atomic mode nothing is created if
+    any title is taken. Raises CategoryNotFound when the category isn't
+    theirs.
+    """
+    if not _owns_category(user_id, category_id):
+        raise CategoryNotFound()
+    if not rows:
+        return {}, set()
+    rows = [dict(row, category_identity=category_id) for row in rows]
+    titles = set(row['title'] for row in rows)
+    if has_returning():
+        created = db.session.execute(
+            pg_insert(recipes).values(rows).on_conflict_do_nothing(
+                constraint='uq_recipes_category_identity_title')
+            .returning(*recipes.c)).fetchall()
+        existing = titles - set(row.title for row in created)
+        if atomic and existing:
+            db.session.rollback()
+            return {}, existing
+        db.session.commit()
+    else:
+        existing = set(title for title, in db.session.execute(
+            select([recipes.c.title]).where(and_(
+                recipes.c.category_identity == category_id,
+                recipes.c.title.in_(titles)))))
+        rows = [row for row in rows if row['title'] not in existing]
+        if not rows or (atomic and existing):
+            return {}, existing
+        _execute(recipes.insert(), rows)
+        created = db.session.execute(recipes.select().where(and_(
+            recipes.c.category_identity == category_id,
+            recipes.c.title.in_([row['title'] for row in rows])))).fetchall()
+    return dict((row.title, row) for row in created), existing
+
+
+def _recipe_statement_failed(user_id, category_id, recipe_id):
+    """Works out why a write to a recipe matched no row."""
+    row = db.session.execute(
+        select([categories.c.id, recipes.c.id.label('recipe_id')])
+        .select_from(categories.outerjoin(recipes, and_(
+            recipes.c.category_identity == categories.c.id,
+            recipes.c.id == recipe_id)))
+        .where(and_(categories.c.id == category_id,
+                    categories.c.created_by == user_id))).first()
+    if row is None:
+        return CategoryNotFound()
+    if row.recipe_id is None:
+        return NotFound()
+    return Conflict()
+
+
+def _owned_recipe(user_id, category_id, recipe_id):
+    return and_(recipes.c.id == recipe_id,
+                recipes.c.category_identity == category_id,
+                recipes.c.category_identity.in_(
+                    _owned_category_ids(user_id, category_id)))
+
+
+def update_recipe(user_id, category_id, recipe_id, title, description,
+                  same_title, same_description):
+    """Updates a recipe in a category of the user.
+
+    Refused with Conflict when a recipe of the category already has
+    same_title and same_description, the normalized title and
+    description, or another recipe has the new title. CategoryNotFound
+    and NotFound tell which of the two is missing.
+    """
+    other = recipes.alias('other')
+    statement = recipes.update().values(
+        title=title, description=description).where(and_(
+            _owned_recipe(user_id, category_id, recipe_id),
+            ~exists().where(and_(
+                other.c.category_identity == category_id,
+                other.c.title == same_title,
+                other.c.description == same_description))))
+    if has_returning():
+        row = _execute(statement.returning(*recipes.c))
+    else:
+        result = _execute(statement)
+        row = _by_id(recipes, recipe_id) if result.rowcount else None
+    if row is None:
+        raise _recipe_statement_failed(user_id, category_id, recipe_id)
+    return row
+
+
+def delete_recipe(user_id, category_id, recipe_id):
+    """Deletes a recipe in a category of the user, returns its title."""
+    owned = _owned_recipe(user_id, category_id, recipe_id)
+    if has_returning():
+        row = _execute(recipes.delete().where(owned)
+                       .returning(recipes.c.title))
+    else:
+        row = db.session.execute(
+            select([recipes.c.title]).where(owned)).first()
+        if row is not None:
+            _execute(recipes.delete().where(recipes.c.id == recipe_id))
+    if row is None:
+        raise _recipe_statement_failed(user_id, category_id, recipe_id)
+    return row.title
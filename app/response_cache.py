@@ -0,0 +1,192 @@
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from flask import Response, current_app, request
+from app.conditional import is_not_modified
+
+
+class LRUBackend(object):
+    """In process store, the default. Entries live in this process only,
+    so use a shared backend when several workers serve the same users.
+    """
+
+    def __init__(self, size=2048, **kwargs):
+        self.size = size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires is not None and expires <= time.time():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires = time.time() + ttl if ttl else None
+        with self.lock:
+            self.entries[key] = (value, expires)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def incr(self, key):
+        with self.lock:
+            value = (self.entries.get(key, (0, None))[0] or 0) + 1
+            self.entries[key] = (value, None)
+            self.entries.move_to_end(key)
+            return value
+
+
+class LocalSharedBackend(LRUBackend):
+    """Stand-in for a shared cache server: every application in this
+    process that names the same RESPONSE_CACHE_URL shares one store.
+    """
+
+    stores = {}
+
+    def __init__(self, size=2048, url=None, **kwargs):
+        super(LocalSharedBackend, self).__init__(size)
+        shared = self.stores.setdefault(url, (OrderedDict(), threading.Lock()))
+        self.entries, self.lock = shared
+
+
+class RedisBackend(object):
+    """Shared store on redis, needs the optional redis package."""
+
+    def __init__(self, url=None, **kwargs):
+        import redis
+        self.client = redis.StrictRedis.from_url(url)
+
+    def get(self, key):
+        value = self.client.get(key)
+        return pickle.loads(value) if value is not None else None
+
+    def set(self, key, value, ttl=None):
+        self.client.set(key, pickle.dumps(value), ex=ttl)
+
+    def incr(self, key):
+        return self.client.incr(key)
+
+
+BACKENDS = {
+    'lru': LRUBackend,
+    'local-shared': LocalSharedBackend,
+    'redis': RedisBackend,
+}
+
+# backends whose entries and generations stay within one process
+PROCESS_BACKENDS = ('lru', 'local-shared')
+
+
+class ResponseCache(object):
+    """Caches successful listing responses per user.
+
+    Every key carries the user's generation number, so bumping it after a
+    write invalidates everything cached for that user in one step, the
+    old entries simply age out of the backend. A bump only reaches the
+    workers sharing the backend, so with more than one of WEB_CONCURRENCY
+    workers a per process backend fails at startup, the others would
+    serve stale listings until RESPONSE_CACHE_TTL runs out.
+    """
+
+    def __init__(self, app=None):
+        self.app = app
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('RESPONSE_CACHE_ENABLED', True)
+        app.config.setdefault('RESPONSE_CACHE_BACKEND', 'lru')
+        app.config.setdefault('RESPONSE_CACHE_URL', None)
+        app.config.setdefault('RESPONSE_CACHE_SIZE', 2048)
+        app.config.setdefault('RESPONSE_CACHE_TTL', 300)
+        app.config.setdefault('WEB_CONCURRENCY', 1)
+        if (app.config['RESPONSE_CACHE_ENABLED'] and
+                app.config['WEB_CONCURRENCY'] > 1 and
+                app.config['RESPONSE_CACHE_BACKEND'] in PROCESS_BACKENDS):
+            raise ValueError(
+                'RESPONSE_CACHE_BACKEND {} is per process, {} workers need '
+                'a shared one such as redis, or RESPONSE_CACHE_ENABLED '
+                'off'.format(app.config['RESPONSE_CACHE_BACKEND'],
+                             app.config['WEB_CONCURRENCY']))
+        backend = BACKENDS[app.config['RESPONSE_CACHE_BACKEND']](
+            size=app.config['RESPONSE_CACHE_SIZE'],
+            url=app.config['RESPONSE_CACHE_URL'])
+        app.extensions['response_cache'] = _CacheState(backend)
+
+    @property
+    def state(self):
+        return current_app.extensions['response_cache']
+
+    def _generation(self, user_id):
+        return self.state.backend.get('generation:{}'.format(user_id)) or 0
+
+    def _key(self, user_id):
+        return 'listing:{}:{}:{}:{}:{}'.format(
+            user_id, self._generation(user_id), request.endpoint,
+            request.url_root, request.full_path)
+
+    def bump(self, user_id):
+        """Invalidates every cached response of a user after a write."""
+        if current_app.config['RESPONSE_CACHE_ENABLED']:
+            self.state.backend.incr('generation:{}'.format(user_id))
+            self.state.bumps += 1
+
+    def cached(self, func):
+        """Decorates a listing view that takes user_id first."""
+        @wraps(func)
+        def wrapper(user_id, *args, **kwargs):
+            if not current_app.config['RESPONSE_CACHE_ENABLED']:
+                return func(user_id, *args, **kwargs)
+            state = self.state
+            key = self._key(user_id)
+            entry = state.backend.get(key)
+            if entry is not None:
+                state.hits += 1
+                body, status, headers = entry
+                etag = dict(headers).get('ETag', '').strip('"')
+                if etag and is_not_modified(etag):
+                    return Response(status=304, headers=headers)
+                response = Response(body, status=status, headers=headers)
+                response.headers['X-Cache'] = 'HIT'
+                return response
+            state.misses += 1
+            response = current_app.make_response(
+                func(user_id, *args, **kwargs))
+            if response.status_code == 200:
+                headers = [(name, value) for name, value in response.headers
+                           if name != 'Content-Length']
+                state.backend.set(
+                    key, (response.get_data(), response.status_code, headers),
+                    current_app.config['RESPONSE_CACHE_TTL'])
+            response.headers['X-Cache'] = 'MISS'
+            return response
+        return wrapper
+
+    def stats(self):
+        state = self.state
+        lookups = state.hits + state.misses
+        return {'hits': state.hits, 'misses': state.misses,
+                'bumps': state.bumps,
+                'hit_rate': state.hits / lookups if lookups else 0.0}
+
+
+class _CacheState(object):
+    """The backend and counters belonging to a single application."""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self.bumps = 0
+
+
+response_cache = ResponseCache()
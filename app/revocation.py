@@ -0,0 +1,228 @@
+import hashlib
+import math
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from flask import current_app
+from app.query_audit import unaudited
+
+
+def token_digest(token):
+    """Returns the fixed width key a token is revoked under."""
+    if isinstance(token, bytes):
+        token = token.decode()
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+class BloomFilter(object):
+    """A fixed size Bloom filter over string keys.
+
+    A miss is definitive, a hit only means the key may have been added.
+    """
+
+    def __init__(self, capacity, error_rate=0.001):
+        self.capacity = max(int(capacity), 1)
+        self.error_rate = error_rate
+        # size the bit array and number of hashes for the wanted error rate
+        self.num_bits = max(int(-self.capacity * math.log(error_rate) /
+                                (math.log(2) ** 2)), 8)
+        self.num_hashes = max(int(round(self.num_bits / self.capacity *
+                                        math.log(2))), 1)
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key):
+        """Derive the bit positions of a key using double hashing."""
+        digest = hashlib.sha256(key.encode()).digest()
+        first = int.from_bytes(digest[:8], 'big')
+        second = int.from_bytes(digest[8:16], 'big') | 1
+        for i in range(self.num_hashes):
+            yield (first + i * second) % self.num_bits
+
+    def add(self, key):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        return all(self.bits[position >> 3] & (1 << (position & 7))
+                   for position in self._positions(key))
+
+
+class RevocationCache(object):
+    """Per process lookup layer in front of the revoked_tokens table.
+
+    A Bloom filter holds every revoked token, so a token that is not
+    revoked is answered without touching the database. Filter hits are
+    confirmed against a bounded LRU of known revoked tokens and only then
+    against the table itself.
+
+    A revocation made by this process is seen at once. One made by
+    another process is seen by the next sync. With more than one of
+    WEB_CONCURRENCY workers the sync runs before every check by default,
+    exact across processes for one indexed query per request; a single
+    worker never needs to sync. A REVOCATION_SYNC_INTERVAL above 0 syncs
+    at most that often instead, and until then the other processes still
+    accept a token logged out elsewhere, so it is an explicit opt in;
+    0 always syncs and None never does. A sync reads the rows revoked
+    since REVOCATION_SYNC_OVERLAP seconds before the newest one it has
+    seen, so rows whose transaction committed late are not skipped.
+    """
+
+    def __init__(self, app=None):
+        self.app = app
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('REVOCATION_BLOOM_CAPACITY', 10000)
+        app.config.setdefault('REVOCATION_BLOOM_ERROR_RATE', 0.001)
+        app.config.setdefault('REVOCATION_HIT_CACHE_SIZE', 1024)
+        app.config.setdefault('WEB_CONCURRENCY', 1)
+        app.config.setdefault(
+            'REVOCATION_SYNC_INTERVAL',
+            0 if app.config['WEB_CONCURRENCY'] > 1 else None)
+        app.config.setdefault('REVOCATION_SYNC_OVERLAP', 60)
+        app.config.setdefault('REVOKED_TOKEN_PRUNE_INTERVAL', 3600)
+        app.config.setdefault('REVOKED_TOKEN_PRUNE_BATCH', 500)
+        app.extensions['revocation_cache'] = _RevocationState(app.config)
+        app.before_first_request(self.warm)
+
+    @property
+    def state(self):
+        return current_app.extensions['revocation_cache']
+
+    def warm(self):
+        """Load every revoked token into the filter."""
+        self.state.warm()
+
+    def add(self, token):
+        """Record a token that has just been revoked by this process."""
+        self.add_digest(token_digest(token))
+
+    def add_digest(self, digest):
+        self.state.add(digest)
+
+    def is_revoked(self, token):
+        return self.is_digest_revoked(token_digest(token))
+
+    def is_digest_revoked(self, digest):
+        return self.state.is_revoked(digest)
+
+    def maybe_prune(self):
+        """Delete one batch of expired rows if the prune interval passed.
+
+        This is the opportunistic sweep run from requests, the manage.py
+        prune_tokens command clears a whole backlog.
+        """
+        return self.state.maybe_prune()
+
+
+class _RevocationState(object):
+    """The filter and hit cache belonging to a single application."""
+
+    def __init__(self, config):
+        self.capacity = config['REVOCATION_BLOOM_CAPACITY']
+        self.error_rate = config['REVOCATION_BLOOM_ERROR_RATE']
+        self.hit_cache_size = config['REVOCATION_HIT_CACHE_SIZE']
+        self.sync_interval = config['REVOCATION_SYNC_INTERVAL']
+        self.sync_overlap = timedelta(seconds=config['REVOCATION_SYNC_OVERLAP'])
+        self.prune_interval = config['REVOKED_TOKEN_PRUNE_INTERVAL']
+        self.prune_batch = config['REVOKED_TOKEN_PRUNE_BATCH']
+        self.last_prune = time.time()
+        self.bloom = BloomFilter(self.capacity, self.error_rate)
+        self.hits = OrderedDict()
+        self.last_revoked_on = None
+        self.last_sync = 0
+        self.warmed = False
+        self.lock = threading.Lock()
+
+    def warm(self):
+        from app.models import RevokedToken
+        with self.lock:
+            self.bloom = BloomFilter(self.capacity, self.error_rate)
+            self.last_revoked_on = None
+            # expired tokens fail verification before reaching the filter
+            self._load(RevokedToken.query.filter(
+                RevokedToken.expires_at >= datetime.utcnow()))
+            self.warmed = True
+
+    def _load(self, query):
+        """Add the rows of a revoked_tokens query to the filter."""
+        from app.models import RevokedToken
+        rows = query.with_entities(RevokedToken.revoked_on,
+                                   RevokedToken.token_hash)
+        for revoked_on, digest in rows:
+            # overlapping syncs read some rows again
+            if digest not in self.bloom:
+                self.bloom.add(digest)
+            if (self.last_revoked_on is None or
+                    revoked_on > self.last_revoked_on):
+                self.last_revoked_on = revoked_on
+        self.last_sync = time.time()
+        if self.bloom.count > self.capacity:
+            # keep the false positive rate near the configured one
+            self.capacity *= 2
+            self.warmed = False
+
+    def sync(self):
+        """Pick up tokens revoked by other processes since the last sync.
+
+        A sync falls due in whichever request comes along, so it is kept
+        out of that request's query budget.
+        """
+        from app.models import RevokedToken
+        if not self.warmed:
+            with unaudited():
+                return self.warm()
+        if (self.sync_interval is None or
+                time.time() - self.last_sync < self.sync_interval):
+            return
+        with self.lock, unaudited():
+            query = RevokedToken.query
+            if self.last_revoked_on is not None:
+                # revoked_on is taken when the transaction starts, so a
+                # row can commit after newer ones have been read
+                query = query.filter(
+                    RevokedToken.revoked_on >=
+                    self.last_revoked_on - self.sync_overlap)
+            self._load(query)
+
+    def add(self, digest):
+        with self.lock:
+            self.bloom.add(digest)
+            self._remember(digest)
+
+    def _remember(self, digest):
+        self.hits[digest] = True
+        self.hits.move_to_end(digest)
+        while len(self.hits) > self.hit_cache_size:
+            self.hits.popitem(last=False)
+
+    def is_revoked(self, digest):
+        from app.models import RevokedToken
+        self.sync()
+        if digest not in self.bloom:
+            return False
+        with self.lock:
+            if digest in self.hits:
+                self.hits.move_to_end(digest)
+                return True
+        # the filter may give false positives, so confirm with the table
+        if RevokedToken.query.filter_by(token_hash=digest).first() is None:
+            return False
+        with self.lock:
+            self._remember(digest)
+        return True
+
+    def maybe_prune(self):
+        from app.models import RevokedToken
+        if time.time() - self.last_prune < self.prune_interval:
+            return 0
+        self.last_prune = time.time()
+        return RevokedToken.prune_expired(batch_size=self.prune_batch,
+                                          max_batches=1)
+
+
+revocation_cache = RevocationCache()
@@ -0,0 +1,223 @@
+import re
+from flask import current_app
+from sqlalchemy import case, event, false, func, or_, text
+from app import db
+from app.models import Category, Recipe
+
+# PostgreSQL keeps a tsvector column current with a trigger and serves
+# it from a GIN index. SQLite mirrors title and description into an
+# external content FTS5 table. Other databases fall back to LIKE.
+POSTGRES_DDL = [
+    "ALTER TABLE recipes ADD COLUMN search_vector tsvector",
+    "CREATE INDEX ix_recipes_search_vector ON recipes USING gin (search_vector)",
+    "CREATE TRIGGER recipes_search_vector_update BEFORE INSERT OR UPDATE "
+    "ON recipes FOR EACH ROW EXECUTE PROCEDURE tsvector_update_trigger("
+    "search_vector, 'pg_catalog.english', title, description)",
+]
+
+SQLITE_DDL = [
+    "CREATE VIRTUAL TABLE recipes_fts USING fts5(title, description, "
+    "content='recipes', content_rowid='id', tokenize='porter')",
+    "CREATE TRIGGER recipes_fts_insert AFTER INSERT ON recipes BEGIN "
+    "INSERT INTO recipes_fts(rowid, title, description) "
+    "VALUES (new.id, new.title, new.description); END",
+    "CREATE TRIGGER recipes_fts_delete AFTER DELETE ON recipes BEGIN "
+    "INSERT INTO recipes_fts(recipes_fts, rowid, title, description) "
+    "VALUES ('delete', old.id, old.title, old.description); END",
+    "CREATE TRIGGER recipes_fts_update AFTER UPDATE ON recipes BEGIN "
+    "INSERT INTO recipes_fts(recipes_fts, rowid, title, description) "
+    "VALUES ('delete', old.id, old.title, old.description); "
+    "INSERT INTO recipes_fts(rowid, title, description) "
+    "VALUES (new.id, new.title, new.description); END",
+]
+
+# fill the search structures for recipes that existed before them, the
+# triggers only cover rows written afterwards
+POSTGRES_BACKFILL = (
+    "UPDATE recipes SET search_vector = to_tsvector('pg_catalog.english', "
+    "coalesce(title, '') || ' ' || coalesce(description, ''))")
+SQLITE_BACKFILL = "INSERT INTO recipes_fts(recipes_fts) VALUES ('rebuild')"
+
+
+# pg_trgm is a contrib extension and creating it takes privileges the
+# app may not have, so the migrations install it and the index is only
+# created along with the table where it is already there
+TRIGRAM_EXTENSION = "CREATE EXTENSION IF NOT EXISTS pg_trgm"
+TRIGRAM_DDL = [
+    "CREATE INDEX ix_categories_name_trgm ON categories "
+    "USING gin (name gin_trgm_ops)",
+]
+
+# pg_trgm's default similarity threshold for the % operator
+SIMILARITY_THRESHOLD = 0.3
+
+# what the statements above create outside the models' metadata, the
+# FTS5 table comes with shadow tables named after it
+RAW_TABLE_PREFIX = 'recipes_fts'
+RAW_COLUMNS = {('recipes', 'search_vector')}
+RAW_INDEXES = {'ix_recipes_search_vector', 'ix_categories_name_trgm'}
+
+
+def include_object(obj, name, type_, reflected, compare_to):
+    """Alembic autogenerate filter leaving out the search structures,
+    which the models do not declare and a revision must not drop.
+    """
+    if type_ == 'table':
+        return not name.startswith(RAW_TABLE_PREFIX)
+    if type_ == 'column':
+        return (obj.table.name, name) not in RAW_COLUMNS
+    if type_ == 'index':
+        return name not in RAW_INDEXES
+    return True
+
+
+@event.listens_for(Recipe.__table__, 'after_create')
+def create_search_index(target, connection, **kwargs):
+    """Adds the full text search structures once the table exists."""
+    statements = {'postgresql': POSTGRES_DDL,
+                  'sqlite': SQLITE_DDL}.get(connection.dialect.name, [])
+    for statement in statements:
+        connection.execute(text(statement))
+
+
+@event.listens_for(Category.__table__, 'after_create')
+def create_trigram_index(target, connection, **kwargs):
+    if connection.dialect.name != 'postgresql':
+        return
+    installed = connection.execute(text(
+        "SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")).first()
+    if installed:
+        for statement in TRIGRAM_DDL:
+            connection.execute(text(statement))
+
+
+@event.listens_for(Recipe.__table__, 'before_drop')
+def drop_search_index(target, connection, **kwargs):
+    """The FTS5 table is not part of the metadata, so drop it ourselves."""
+    if connection.dialect.name == 'sqlite':
+        connection.execute(text("DROP TABLE IF EXISTS recipes_fts"))
+
+
+def search_terms(search_query):
+    return re.findall(r'\w+', search_query.lower())
+
+
+def search_recipes(recipes, search_query, dialect, by_relevance=False):
+    """Filters a recipe query to a full text search over title and
+    description. Every word must match, the last letters of a word may be
+    missing so partly typed queries still match. With by_relevance the
+    best matches come first.
+    """
+    terms = search_terms(search_query)
+    if not terms or dialect not in ('postgresql', 'sqlite'):
+        pattern = '%' + search_query.strip().lower() + '%'
+        return recipes.filter(or_(Recipe.title.like(pattern),
+                                  Recipe.description.like(pattern)))
+    if dialect == 'postgresql':
+        tsquery = ' & '.join(term + ':*' for term in terms)
+        recipes = recipes.filter(text(
+            "recipes.search_vector @@ to_tsquery('english', :tsquery)")
+        ).params(tsquery=tsquery)
+        if by_relevance:
+            recipes = recipes.order_by(text(
+                "ts_rank(recipes.search_vector, "
+                "to_tsquery('english', :tsquery)) DESC"))
+        return recipes
+    match = ' '.join('"{}"*'.format(term) for term in terms)
+    recipes = recipes.filter(text(
+        "recipes.id IN (SELECT rowid FROM recipes_fts "
+        "WHERE recipes_fts MATCH :match)")).params(match=match)
+    if by_relevance:
+        # bm25 scores better matches lower
+        recipes = recipes.order_by(text(
+            "(SELECT bm25(recipes_fts) FROM recipes_fts "
+            "WHERE recipes_fts MATCH :match AND rowid = recipes.id)"))
+    return recipes
+
+
+def trigram_supported():
+    """Checks once per application whether pg_trgm is installed."""
+    state = current_app.extensions.setdefault('search', {})
+    if 'pg_trgm' not in state:
+        state['pg_trgm'] = db.engine.dialect.name == 'postgresql' and \
+            db.session.execute(text("SELECT 1 FROM pg_extension "
+                                    "WHERE extname = 'pg_trgm'")).first() is not None
+    return state['pg_trgm']
+
+
+def search_categories(categories, search_query, by_similarity=True):
+    """Filters a category query to names containing or resembling the
+    search query, most similar first unless by_similarity is off. pg_trgm
+    serves this from its GIN index and SQLite from an in-memory n-gram
+    index over the user's names. Elsewhere names must contain the query.
+    """
+    search_query = search_query.strip()
+    if trigram_supported():
+        categories = categories.filter(text(
+            "(categories.name % :name OR categories.name ILIKE :pattern)")
+        ).params(name=search_query, pattern='%' + search_query + '%')
+        if by_similarity:
+            categories = categories.order_by(
+                func.similarity(Category.name, search_query).desc())
+        return categories
+    if db.engine.dialect.name != 'sqlite':
+        # loading every name would cost more than the scan it replaces
+        return categories.filter(
+            Category.name.ilike('%' + search_query + '%'))
+    names = categories.with_entities(Category.id, Category.name)
+    ranked = NgramIndex(names).search(search_query)
+    if not ranked:
+        return categories.filter(false())
+    categories = categories.filter(Category.id.in_(ranked))
+    if by_similarity:
+        categories = categories.order_by(case(
+            [(Category.id == cat_id, rank)
+             for rank, cat_id in enumerate(ranked)]))
+    return categories
+
+
+def trigrams(value):
+    """Splits a string into trigrams the way pg_trgm does: per word,
+    lower cased and padded with two spaces in front and one behind.
+    """
+    grams = set()
+    for word in re.findall(r'[^\W_]+', value.lower()):
+        padded = '  ' + word + ' '
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def similarity(first, second):
+    return len(first & second) / len(first | second) if first or second else 0
+
+
+class NgramIndex(object):
+    """An inverted index from trigram to names, for SQLite. Only names
+    sharing a trigram with the query are compared.
+    """
+
+    def __init__(self, entries):
+        self.names = {}
+        self.grams = {}
+        self.postings = {}
+        for entry_id, name in entries:
+            self.names[entry_id] = name or ''
+            self.grams[entry_id] = trigrams(name or '')
+            for gram in self.grams[entry_id]:
+                self.postings.setdefault(gram, set()).add(entry_id)
+
+    def search(self, query, threshold=SIMILARITY_THRESHOLD):
+        """Returns the ids of matching names ranked by similarity."""
+        query_grams = trigrams(query)
+        candidates = set()
+        for gram in query_grams:
+            candidates.update(self.postings.get(gram, ()))
+        needle = query.lower()
+        candidates.update(entry_id for entry_id, name in self.names.items()
+                          if needle in name.lower())
+        scored = []
+        for entry_id in candidates:
+            score = similarity(query_grams, self.grams[entry_id])
+            if score >= threshold or needle in self.names[entry_id].lower():
+                scored.append((-score, entry_id))
+        return [entry_id for _, entry_id in sorted(scored)]
@@ -0,0 +1,83 @@
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app
+
+
+class TokenCache(object):
+    """Per process LRU of verified tokens, keyed by the token digest.
+
+    A hit skips the signature check and claim parsing of jwt.decode. An
+    entry lives at most TOKEN_CACHE_TTL seconds and never past the token's
+    own exp claim, and it is evicted as soon as the token is revoked.
+    """
+
+    def __init__(self, app=None):
+        self.app = app
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('TOKEN_CACHE_SIZE', 4096)
+        app.config.setdefault('TOKEN_CACHE_TTL', 300)
+        app.extensions['token_cache'] = _TokenCacheState(
+            app.config['TOKEN_CACHE_SIZE'], app.config['TOKEN_CACHE_TTL'])
+
+    @property
+    def state(self):
+        return current_app.extensions['token_cache']
+
+    def get(self, digest):
+        """Returns the cached user id of a token, or None on a miss."""
+        return self.state.get(digest)
+
+    def set(self, digest, user_id, exp):
+        self.state.set(digest, user_id, exp)
+
+    def evict(self, digest):
+        self.state.evict(digest)
+
+    def stats(self):
+        state = self.state
+        return {'hits': state.hits, 'misses': state.misses,
+                'size': len(state.entries)}
+
+
+class _TokenCacheState(object):
+    """The cached entries and counters belonging to a single application."""
+
+    def __init__(self, size, ttl):
+        self.size = size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, digest):
+        with self.lock:
+            entry = self.entries.get(digest)
+            if entry is not None:
+                user_id, expires = entry
+                if expires > time.time():
+                    self.entries.move_to_end(digest)
+                    self.hits += 1
+                    return user_id
+                del self.entries[digest]
+            self.misses += 1
+            return None
+
+    def set(self, digest, user_id, exp):
+        expires = min(time.time() + self.ttl, exp)
+        with self.lock:
+            self.entries[digest] = (user_id, expires)
+            self.entries.move_to_end(digest)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def evict(self, digest):
+        with self.lock:
+            self.entries.pop(digest, None)
+
+
+token_cache = TokenCache()
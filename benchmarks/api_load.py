@@ -0,0 +1,343 @@
+"""Measures latency and throughput of the main API endpoints.
+
+Usage: python benchmarks/api_load.py [--database-url URL] [--users 5]
+       [--categories 10] [--recipes 20] [--requests 200]
+       [--drivers client,gunicorn] [--workers 2] [--concurrency 4]
+       [--output results.json] [--compare previous.json]
+
+Seeds users x categories x recipes per category into the database
+(SQLite or PostgreSQL, the benchmark config's database by default).
+Each endpoint is then driven through the Flask test client, and
+through a real gunicorn process hit over HTTP by --concurrency client
+threads. The script prints p50/p95/p99 latency and requests/sec per
+endpoint and saves them, with the commit and dataset, as JSON, by
+default under benchmarks/results/, which git ignores. Passing an
+earlier file as --compare prints the change in each figure.
+"""
+import argparse
+import http.client
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from urllib.parse import urlencode
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+PASSWORD = 'benchmark-password'
+
+
+def user(number):
+    return {'username': 'bench{}'.format(number),
+            'email': 'bench{}@example.com'.format(number),
+            'password': PASSWORD}
+
+
+def seed(app, users, categories, recipes, chunk=5000):
+    """Recreates the tables and fills them, returns the ids per user."""
+    from app import db
+    from app.models import Category, Recipe, User
+    dataset = []
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+        db.create_all()
+        for number in range(users):
+            owner = User(**user(number))
+            owner.save()
+            db.session.execute(Category.__table__.insert(), [
+                {'name': 'Category {}'.format(i), 'created_by': owner.id}
+                for i in range(categories)])
+            category_ids = [c.id for c in Category.query.with_entities(
+                Category.id).filter(Category.created_by == owner.id)]
+            rows = [{'title': 'recipe {} {}'.format(c, i),
+                     'description': 'mix the ingredients and cook slowly',
+                     'category_identity': category_id}
+                    for c, category_id in enumerate(category_ids)
+                    for i in range(recipes)]
+            for start in range(0, len(rows), chunk):
+                db.session.execute(Recipe.__table__.insert(),
+                                   rows[start:start + chunk])
+            db.session.commit()
+            recipe_ids = dict(
+                (category_id, [r.id for r in Recipe.query.with_entities(
+                    Recipe.id).filter(Recipe.category_identity == category_id)
+                    .order_by(Recipe.id)])
+                for category_id in category_ids)
+            dataset.append({'number': number, 'categories': category_ids,
+                            'recipes': recipe_ids})
+    return dataset
+
+
+def scenarios(dataset):
+    """(name, method, path builder, form builder) per endpoint. Builders
+    get the request number and the seeded data of the user sending it.
+    """
+    def pick(seq, i):
+        return seq[i % len(seq)]
+
+    def category(i, data):
+        return pick(data['categories'], i)
+
+    def recipe(i, data):
+        category_id = category(i, data)
+        return category_id, pick(data['recipes'][category_id] or [0], i)
+
+    def page(i, items, per_page):
+        # only pages that exist, the listings answer 404 past the end
+        return i % max(1, -(-items // per_page)) + 1
+
+    first = dataset[0]
+    categories = len(first['categories'])
+    recipes = len(first['recipes'][first['categories'][0]]) \
+        if categories else 0
+
+    return [
+        ('login', 'POST', lambda i, d: '/api/v1/auth/login',
+         lambda i, d: {'email': user(d['number'])['email'],
+                       'password': PASSWORD}),
+        ('list_categories', 'GET',
+         lambda i, d: '/api/v1/categories/?page={}'.format(
+             page(i, categories, 8)), None),
+        ('get_category', 'GET',
+         lambda i, d: '/api/v1/categories/{}'.format(category(i, d)), None),
+        ('list_recipes', 'GET',
+         lambda i, d: '/api/v1/categories/{}/recipes?page={}'.format(
+             category(i, d), page(i, recipes, 6)), None),
+        ('get_recipe', 'GET',
+         lambda i, d: '/api/v1/categories/{}/recipes/{}'.format(
+             *recipe(i, d)), None),
+        ('search_recipes', 'GET',
+         lambda i, d: '/api/v1/recipes?q=recipe&limit=20', None),
+        ('create_recipe', 'POST',
+         lambda i, d: '/api/v1/categories/{}/recipes'.format(category(i, d)),
+         lambda i, d: {'title': 'new recipe {}'.format(_letters(i)),
+                       'description': 'bake'}),
+    ]
+
+
+def _letters(number):
+    # recipe titles may not hold digits
+    word = ''
+    while True:
+        word = chr(ord('a') + number % 26) + word
+        number //= 26
+        if not number:
+            return word
+
+
+def percentile(values, fraction):
+    """Nearest rank percentile of sorted values."""
+    if not values:
+        return None
+    index = max(0, min(len(values) - 1,
+                       int(round(fraction * len(values) + 0.5)) - 1))
+    return values[index]
+
+
+def summarize(latencies, errors, elapsed):
+    latencies = sorted(latencies)
+    return {'requests': len(latencies), 'errors': errors,
+            'p50_ms': percentile(latencies, .50) * 1000,
+            'p95_ms': percentile(latencies, .95) * 1000,
+            'p99_ms': percentile(latencies, .99) * 1000,
+            'rps': len(latencies) / elapsed if elapsed else None}
+
+
+def run_client(app, dataset, tokens, requests):
+    """Drives every scenario through the Flask test client."""
+    client = app.test_client()
+    results = {}
+    for name, method, path, form in scenarios(dataset):
+        latencies, errors = [], 0
+        started = time.perf_counter()
+        for i in range(requests):
+            data = dataset[i % len(dataset)]
+            headers = {'Authorization': 'Bearer ' + tokens[data['number']]}
+            sent = time.perf_counter()
+            res = client.open(path(i, data), method=method, headers=headers,
+                              data=form(i, data) if form else None)
+            latencies.append(time.perf_counter() - sent)
+            errors += res.status_code >= 400
+        results[name] = summarize(latencies, errors,
+                                  time.perf_counter() - started)
+    return results
+
+
+def _http(port, method, path, headers, form):
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    try:
+        body = None
+        if form is not None:
+            body = urlencode(form)
+            headers = dict(headers, **{
+                'Content-Type': 'application/x-www-form-urlencoded'})
+        sent = time.perf_counter()
+        connection.request(method, path, body=body, headers=headers)
+        response = connection.getresponse()
+        response.read()
+        return time.perf_counter() - sent, response.status
+    finally:
+        connection.close()
+
+
+def _wait_for_port(port, process, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError('gunicorn exited with {}'.format(
+                process.returncode))
+        try:
+            socket.create_connection(('127.0.0.1', port), 1).close()
+            return
+        except OSError:
+            time.sleep(.2)
+    raise RuntimeError('gunicorn did not start listening on {}'.format(port))
+
+
+def run_gunicorn(dataset, tokens, requests, workers, concurrency, port):
+    """Drives every scenario over HTTP against a gunicorn process."""
+    process = subprocess.Popen(
+        ['gunicorn', '--workers', str(workers), '--bind',
+         '127.0.0.1:{}'.format(port), '--chdir', ROOT,
+         '--log-level', 'warning', 'benchmarks.wsgi:app'],
+        env=os.environ.copy())
+    results = {}
+    try:
+        _wait_for_port(port, process)
+        for name, method, path, form in scenarios(dataset):
+            def send(i, path=path, form=form, method=method):
+                data = dataset[i % len(dataset)]
+                headers = {'Authorization':
+                           'Bearer ' + tokens[data['number']]}
+                return _http(port, method, path(i, data), headers,
+                             form(i, data) if form else None)
+            # new titles must not collide with the test client run
+            offset = requests
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                timings = list(executor.map(
+                    send, range(offset, offset + requests)))
+            elapsed = time.perf_counter() - started
+            results[name] = summarize(
+                [latency for latency, _ in timings],
+                sum(status >= 400 for _, status in timings), elapsed)
+    finally:
+        process.terminate()
+        process.wait(10)
+    return results
+
+
+def commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+            stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def report(results, previous=None):
+    columns = ('p50_ms', 'p95_ms', 'p99_ms', 'rps')
+    for driver, endpoints in results.items():
+        print('\n{}'.format(driver))
+        print('{:<16} {:>8} {:>6} {:>9} {:>9} {:>9} {:>9}'.format(
+            'endpoint', 'requests', 'errors', *columns))
+        for name, figures in endpoints.items():
+            print('{:<16} {:>8} {:>6} {:>9.2f} {:>9.2f} {:>9.2f} {:>9.1f}'
+                  .format(name, figures['requests'], figures['errors'],
+                          *[figures[column] for column in columns]))
+            before = (previous or {}).get(driver, {}).get(name)
+            if before:
+                print('{:<16} {:>8} {:>6} '.format('  change', '', '') +
+                      ' '.join('{:>+8.0%}'.format(
+                          figures[column] / before[column] - 1)
+                          if before[column] else '{:>9}'.format('-')
+                          for column in columns))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-url')
+    parser.add_argument('--users', type=int, default=5)
+    parser.add_argument('--categories', type=int, default=10)
+    parser.add_argument('--recipes', type=int, default=20,
+                        help='recipes per category')
+    parser.add_argument('--requests', type=int, default=200,
+                        help='requests per endpoint and driver')
+    parser.add_argument('--drivers', default='client,gunicorn')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--no-response-cache', action='store_true')
+    parser.add_argument('--output')
+    parser.add_argument('--compare')
+    args = parser.parse_args()
+
+    # read by BenchmarkConfig, here and in the gunicorn workers
+    if args.database_url:
+        os.environ['BENCHMARK_DATABASE_URL'] = args.database_url
+    os.environ['WEB_CONCURRENCY'] = str(args.workers)
+    if (args.workers > 1 and not args.no_response_cache and
+            os.getenv('RESPONSE_CACHE_BACKEND', 'lru') != 'redis'):
+        print('a per process response cache would serve stale listings '
+              'across {} workers, running without it; set '
+              'RESPONSE_CACHE_BACKEND=redis and RESPONSE_CACHE_URL to '
+              'include it'.format(args.workers))
+        args.no_response_cache = True
+    os.environ['BENCHMARK_RESPONSE_CACHE'] = \
+        '0' if args.no_response_cache else '1'
+    from app import create_app
+    app = create_app(config_name='benchmark')
+
+    dataset = seed(app, args.users, args.categories, args.recipes)
+    client = app.test_client()
+    tokens = {}
+    for data in dataset:
+        res = client.post('/api/v1/auth/login', data=user(data['number']))
+        tokens[data['number']] = json.loads(
+            res.data.decode())['access_token']
+
+    results = {}
+    drivers = args.drivers.split(',')
+    if 'client' in drivers:
+        results['client'] = run_client(app, dataset, tokens, args.requests)
+    if 'gunicorn' in drivers:
+        results['gunicorn'] = run_gunicorn(
+            dataset, tokens, args.requests, args.workers, args.concurrency,
+            args.port)
+
+    previous = None
+    if args.compare:
+        with open(args.compare) as handle:
+            previous = json.load(handle)['results']
+    report(results, previous)
+
+    output = args.output or os.path.join(
+        ROOT, 'benchmarks', 'results', '{}-{}.json'.format(
+            datetime.utcnow().strftime('%Y%m%dT%H%M%S'), commit() or 'local'))
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as handle:
+        json.dump({
+            'commit': commit(),
+            'created': datetime.utcnow().isoformat() + 'Z',
+            'python': platform.python_version(),
+            'database': app.config['SQLALCHEMY_DATABASE_URI'].split(':')[0],
+            'dataset': {'users': args.users, 'categories': args.categories,
+                        'recipes_per_category': args.recipes},
+            'options': {'requests': args.requests, 'workers': args.workers,
+                        'concurrency': args.concurrency,
+                        'response_cache': not args.no_response_cache},
+            'results': results,
+        }, handle, indent=2, sort_keys=True)
+    print('\nsaved {}'.format(output))
+
+
+if __name__ == '__main__':
+    main()
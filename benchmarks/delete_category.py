@@ -0,0 +1,117 @@
+"""Times deleting categories and users that hold many recipes.
+
+Usage: python benchmarks/delete_category.py [--database-url URL]
+       [--sizes 100,10000,100000]
+
+For each size, seeds one user with a category of that many recipes and
+deletes it through the API, then seeds another and deletes the user
+through the ORM. Recipes and categories are removed by ON DELETE
+CASCADE in the database, so the number of statements stays the same
+whatever the size, and only the database's own work grows. The API
+count also takes in any revocation lookup the token check makes, and
+SQLite, without RETURNING, reads the name before deleting.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PASSWORD = 'benchmark-password'
+
+
+def seed(db, recipes, chunk=5000):
+    """Adds a user with one category of recipes, returns their ids."""
+    from app.models import Category, Recipe, User
+    user = User(username='bench', email='bench{}@example.com'.format(
+        time.time()), password=PASSWORD)
+    db.session.add(user)
+    db.session.flush()
+    category = Category(name='Bench', created_by=user.id)
+    db.session.add(category)
+    db.session.flush()
+    rows = [{'title': 'recipe {}'.format(i), 'description': 'cook slowly',
+             'category_identity': category.id} for i in range(recipes)]
+    for start in range(0, len(rows), chunk):
+        db.session.execute(Recipe.__table__.insert(), rows[start:start + chunk])
+    db.session.commit()
+    return user.id, user.email, category.id
+
+
+class StatementCounter(object):
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+
+    def __call__(self, *args):
+        self.count += 1
+
+    def __enter__(self):
+        from sqlalchemy import event
+        event.listen(self.engine, 'before_cursor_execute', self)
+        return self
+
+    def __exit__(self, *exc_info):
+        from sqlalchemy import event
+        event.remove(self.engine, 'before_cursor_execute', self)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-url')
+    parser.add_argument('--sizes', default='100,10000,100000')
+    args = parser.parse_args()
+
+    if args.database_url:
+        os.environ['BENCHMARK_DATABASE_URL'] = args.database_url
+    from app import create_app, db
+    from app.models import Recipe, User
+    app = create_app(config_name='benchmark')
+    client = app.test_client()
+
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+        db.create_all()
+
+    print('{:>8} {:<16} {:>10} {:>10}'.format(
+        'recipes', 'delete', 'statements', 'ms'))
+    for size in [int(size) for size in args.sizes.split(',')]:
+        with app.app_context():
+            user_id, email, category_id = seed(db, size)
+        res = client.post('/api/v1/auth/login',
+                          data={'email': email, 'password': PASSWORD})
+        headers = {'Authorization': 'Bearer ' + json.loads(
+            res.data.decode())['access_token']}
+        with app.app_context():
+            with StatementCounter(db.engine) as counter:
+                started = time.perf_counter()
+                res = client.delete(
+                    '/api/v1/categories/{}'.format(category_id),
+                    headers=headers)
+                elapsed = time.perf_counter() - started
+            assert res.status_code == 200, res.data
+            assert not Recipe.query.filter_by(
+                category_identity=category_id).count()
+        print('{:>8} {:<16} {:>10} {:>10.1f}'.format(
+            size, 'category (api)', counter.count, elapsed * 1000))
+
+        with app.app_context():
+            user_id, email, category_id = seed(db, size)
+            user = User.query.get(user_id)
+            with StatementCounter(db.engine) as counter:
+                started = time.perf_counter()
+                db.session.delete(user)
+                db.session.commit()
+                elapsed = time.perf_counter() - started
+            assert not Recipe.query.filter_by(
+                category_identity=category_id).count()
+        print('{:>8} {:<16} {:>10} {:>10.1f}'.format(
+            size, 'user (orm)', counter.count, elapsed * 1000))
+
+
+if __name__ == '__main__':
+    main()
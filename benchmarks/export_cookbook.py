@@ -0,0 +1,101 @@
+"""Measures the streaming cookbook export against a large cookbook.
+
+Usage: python benchmarks/export_cookbook.py [--recipes 100000]
+       [--categories 100] [--format ndjson]
+
+Seeds one user with the given number of recipes spread over the
+categories in the testing database, streams /api/v1/export and reports
+throughput and how much the peak RSS grew while streaming, which should
+stay flat as --recipes grows. Seeding runs in its own process, so its
+memory is not part of the peak measured here.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app, db  # noqa: E402
+from app.models import Category, Recipe, User  # noqa: E402
+
+USER = {'username': 'bench', 'email': 'bench@example.com',
+        'password': 'benchmark-password'}
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def seed(recipes, categories, chunk=5000):
+    app = create_app(config_name='testing')
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+        db.create_all()
+        user = User(**USER)
+        user.save()
+        db.session.execute(Category.__table__.insert(), [
+            {'name': 'Category {}'.format(i), 'created_by': user.id}
+            for i in range(categories)])
+        category_ids = [c.id for c in Category.query.with_entities(Category.id)]
+        for start in range(0, recipes, chunk):
+            db.session.execute(Recipe.__table__.insert(), [
+                {'title': 'recipe {}'.format(i),
+                 'description': 'mix the ingredients and cook slowly',
+                 'category_identity': category_ids[i % categories]}
+                for i in range(start, min(start + chunk, recipes))])
+        db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--recipes', type=int, default=100000)
+    parser.add_argument('--categories', type=int, default=100)
+    parser.add_argument('--format', default='ndjson')
+    args = parser.parse_args()
+
+    seeding = multiprocessing.Process(target=seed,
+                                      args=(args.recipes, args.categories))
+    seeding.start()
+    seeding.join()
+    if seeding.exitcode:
+        sys.exit('seeding failed')
+
+    app = create_app(config_name='testing')
+    client = app.test_client()
+    login = client.post('/api/v1/auth/login', data=USER)
+    token = json.loads(login.data.decode())['access_token']
+    rss_before = peak_rss_mb()
+
+    started = time.perf_counter()
+    res = client.get('/api/v1/export?format=' + args.format, buffered=False,
+                     headers={'Authorization': 'Bearer ' + token})
+    size = lines = 0
+    for chunk in res.response:
+        size += len(chunk)
+        lines += chunk.count(b'\n') if isinstance(chunk, bytes) \
+            else chunk.count('\n')
+    elapsed = time.perf_counter() - started
+    rss_after = peak_rss_mb()
+    res.close()
+
+    print('recipes exported   {}'.format(args.recipes))
+    print('lines              {}'.format(lines))
+    print('bytes              {}'.format(size))
+    print('seconds            {:.2f}'.format(elapsed))
+    print('recipes/sec        {:.0f}'.format(args.recipes / elapsed))
+    print('peak RSS before MB {:.1f}'.format(rss_before))
+    print('peak RSS after MB  {:.1f}'.format(rss_after))
+    print('export grew RSS MB {:.1f}'.format(rss_after - rss_before))
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+
+
+if __name__ == '__main__':
+    main()
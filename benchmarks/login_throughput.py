@@ -0,0 +1,68 @@
+"""Measures login throughput for different bcrypt pool sizes and costs.
+
+Usage: python benchmarks/login_throughput.py [--logins 64] [--clients 8]
+       [--pool-sizes 1,2,4,8] [--costs 4,8,10,12]
+
+Each combination registers one user and then fires concurrent logins at
+/api/v1/auth/login through the Flask test client, using the testing
+database configured in instance/config.py. The client threads stand in
+for the threads of one gunicorn worker; a sync worker serves one login
+at a time whatever the pool size.
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app, db  # noqa: E402
+from app.passwords import password_hasher  # noqa: E402
+
+USER = {'username': 'bench', 'email': 'bench@example.com',
+        'password': 'benchmark-password'}
+
+
+def run(pool_size, cost, logins, clients):
+    app = create_app(config_name='testing')
+    app.config['BCRYPT_POOL_SIZE'] = pool_size
+    app.config['BCRYPT_LOG_ROUNDS'] = cost
+    password_hasher.init_app(app)
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+        db.create_all()
+    client = app.test_client()
+    client.post('/api/v1/auth/register', data=USER)
+
+    def login(_):
+        res = client.post('/api/v1/auth/login', data=USER)
+        assert res.status_code == 200, res.data
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as executor:
+        list(executor.map(login, range(logins)))
+    elapsed = time.perf_counter() - started
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+    return logins / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--logins', type=int, default=64)
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--pool-sizes', default='1,2,4,8')
+    parser.add_argument('--costs', default='4,8,10,12')
+    args = parser.parse_args()
+    print('{:>9} {:>5} {:>12}'.format('pool_size', 'cost', 'logins/sec'))
+    for cost in [int(c) for c in args.costs.split(',')]:
+        for pool_size in [int(p) for p in args.pool_sizes.split(',')]:
+            rate = run(pool_size, cost, args.logins, args.clients)
+            print('{:>9} {:>5} {:>12.1f}'.format(pool_size, cost, rate))
+
+
+if __name__ == '__main__':
+    main()
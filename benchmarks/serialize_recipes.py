@@ -0,0 +1,81 @@
+"""Compares the cost of serializing recipe listings per 1,000 recipes.
+
+Usage: python benchmarks/serialize_recipes.py [--recipes 1000]
+       [--repeat 50]
+
+Builds unsaved recipes in memory, so no database is needed, and times
+jsonify over raw model dicts, the way the listings used to respond,
+against field plans encoded with every installed json backend.
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import jsonify  # noqa: E402
+from app import create_app  # noqa: E402
+from app.models import Recipe  # noqa: E402
+from app.serializers import BACKENDS, RECIPE_PLAN, dumps  # noqa: E402
+
+FIELDS = ('id', 'title', 'description', 'date_created', 'date_modified',
+          'category_identity')
+
+
+def make_recipes(count):
+    started = datetime(2026, 1, 1)
+    recipes = []
+    for i in range(count):
+        recipe = Recipe(title='recipe {}'.format(i),
+                        description='mix the ingredients and cook slowly',
+                        category_identity=i % 10 + 1)
+        recipe.id = i + 1
+        recipe.date_created = started + timedelta(seconds=i)
+        recipe.date_modified = recipe.date_created
+        recipes.append(recipe)
+    return recipes
+
+
+def timed(func, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--recipes', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    app = create_app(config_name='testing')
+    recipes = make_recipes(args.recipes)
+
+    def baseline():
+        rows = [{'recipe': dict((name, getattr(recipe, name))
+                                for name in FIELDS)} for recipe in recipes]
+        jsonify({'recipes': rows}).get_data()
+
+    cases = [('jsonify + raw dicts', baseline)]
+    for backend in sorted(BACKENDS):
+        def planned(backend=backend):
+            rows = [{'recipe': row} for row in RECIPE_PLAN.dump_many(recipes)]
+            dumps({'recipes': rows}, backend=backend)
+        cases.append(('field plan + ' + backend, planned))
+
+    scale = 1000.0 / args.recipes
+    with app.test_request_context():
+        print('{:<24} {:>14}'.format('serializer', 'ms/1000 rows'))
+        for name, func in cases:
+            print('{:<24} {:>14.2f}'.format(
+                name, timed(func, args.repeat) * 1000 * scale))
+
+
+if __name__ == '__main__':
+    main()
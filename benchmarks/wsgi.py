@@ -0,0 +1,13 @@
+"""WSGI entry point for the gunicorn runs of benchmarks/api_load.py.
+
+Uses the benchmark configuration, see BenchmarkConfig in
+instance/config.py.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app  # noqa: E402
+
+app = create_app(config_name='benchmark')
@@ -1,9 +1,10 @@
 import os
 import unittest
-from flask_script import Manager # class for handling a set of commands
+from flask_script import Command, Manager, Option # class for handling a set of commands
 from flask_migrate import Migrate, MigrateCommand
 from app import db, create_app
-from app import models
+from app import counters, models
+from app.cookbook.importer import IMPORT_FORMATS, CookbookImporter
 
 app = create_app(config_name='development')
 migrate = Migrate(app, db)
@@ -18,5 +19,59 @@ def test():
     if result.wasSuccessful():
         return 0
     return 1
+
+
+@manager.option('-b', '--batch-size', dest='batch_size', default=1000, type=int)
+def prune_tokens(batch_size):
+    """Deletes revoked tokens that have already expired."""
+    deleted = models.RevokedToken.prune_expired(batch_size=batch_size)
+    print('Pruned {} expired revoked tokens'.format(deleted))
+
+
+@manager.command
+def reconcile_counts():
+    """Recounts the recipe and category counters, fixing any that drifted."""
+    categories, users = counters.reconcile()
+    print('Fixed the recipe count of {} categories and the category count '
+          'of {} users'.format(categories, users))
+
+
+class ImportCommand(Command):
+    """Imports an ndjson or csv cookbook for the user with this email."""
+
+    option_list = (
+        Option('-f', '--file', dest='path', required=True),
+        Option('-e', '--email', dest='email', required=True),
+        Option('--format', dest='import_format', default=None),
+        Option('-r', '--resume-from', dest='resume_from', default=0, type=int),
+        Option('-c', '--chunk-size', dest='chunk_size', default=1000, type=int),
+    )
+
+    def run(self, path, email, import_format, resume_from, chunk_size):
+        user = models.User.query.filter_by(email=email).first()
+        if not user:
+            print('No user with the email {}'.format(email))
+            return 1
+        if import_format is None:
+            import_format = 'csv' if path.lower().endswith('.csv') else 'ndjson'
+
+        def progress(report):
+            print('{resume_from} records stored, {created_recipes} recipes '
+                  'created, {failed} failed'.format(**report))
+
+        importer = CookbookImporter(user.id, chunk_size=chunk_size,
+                                    progress=progress)
+        with open(path, 'rb') as upload:
+            report = importer.run(IMPORT_FORMATS[import_format](upload),
+                                  resume_from=resume_from)
+        for error in report['errors']:
+            print('line {line}: {message}'.format(**error))
+        print('Imported {created_categories} categories and {created_recipes} '
+              'recipes, skipped {skipped} duplicates'.format(**report))
+
+
+manager.add_command('import', ImportCommand())
+
+
 if __name__ == '__main__':
     manager.run()
\ No newline at end of file
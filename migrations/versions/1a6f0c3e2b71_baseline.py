@@ -0,0 +1,65 @@
+"""The schema as db.create_all() built it before migrations existed
+
+Revision ID: 1a6f0c3e2b71
+Revises:
+Create Date: 2026-10-18 09:10:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '1a6f0c3e2b71'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # databases of earlier releases already have these tables
+    if 'users' in sa.inspect(op.get_bind()).get_table_names():
+        return
+    # constraints are left unnamed like create_all left them, PostgreSQL
+    # names them <table>_<column>_key and _fkey, SQLite not at all
+    op.create_table(
+        'users',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('username', sa.String(length=120), nullable=False),
+        sa.Column('email', sa.String(length=256), nullable=False),
+        sa.Column('password', sa.String(length=256), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('email'))
+    op.create_table(
+        'revoked_tokens',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('token', sa.String(length=500), nullable=False),
+        sa.Column('revoked_on', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('token'))
+    op.create_table(
+        'categories',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(length=255), nullable=True),
+        sa.Column('date_created', sa.DateTime(), nullable=True),
+        sa.Column('date_modified', sa.DateTime(), nullable=True),
+        sa.Column('created_by', sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(['created_by'], ['users.id']),
+        sa.PrimaryKeyConstraint('id'))
+    op.create_table(
+        'recipes',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('title', sa.String(length=256), nullable=True),
+        sa.Column('description', sa.Text(), nullable=True),
+        sa.Column('date_created', sa.DateTime(), nullable=True),
+        sa.Column('date_modified', sa.DateTime(), nullable=True),
+        sa.Column('category_identity', sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(['category_identity'], ['categories.id']),
+        sa.PrimaryKeyConstraint('id'))
+
+
+def downgrade():
+    op.drop_table('recipes')
+    op.drop_table('categories')
+    op.drop_table('revoked_tokens')
+    op.drop_table('users')
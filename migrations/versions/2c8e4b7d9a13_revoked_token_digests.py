@@ -0,0 +1,70 @@
+"""Key revoked tokens by their sha256 digest and keep their expiry
+
+Revision ID: 2c8e4b7d9a13
+Revises: 1a6f0c3e2b71
+Create Date: 2026-10-18 09:20:00.000000
+
+"""
+import hashlib
+from datetime import datetime
+import jwt
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2c8e4b7d9a13'
+down_revision = '1a6f0c3e2b71'
+branch_labels = None
+depends_on = None
+
+revoked_tokens = sa.table(
+    'revoked_tokens',
+    sa.column('id', sa.Integer),
+    sa.column('token', sa.String),
+    sa.column('token_hash', sa.String),
+    sa.column('expires_at', sa.DateTime))
+
+
+def upgrade():
+    with op.batch_alter_table('revoked_tokens') as batch_op:
+        batch_op.add_column(sa.Column('token_hash', sa.String(length=64),
+                                      nullable=True))
+        batch_op.add_column(sa.Column('expires_at', sa.DateTime(),
+                                      nullable=True))
+
+    # every revoked token keeps working as revoked: its row is keyed by
+    # the digest User.decode_token looks up and expires with the token
+    bind = op.get_bind()
+    undecodable = []
+    for row_id, token in bind.execute(
+            sa.select([revoked_tokens.c.id, revoked_tokens.c.token])):
+        try:
+            expires = jwt.decode(token, verify=False)['exp']
+        except (jwt.InvalidTokenError, KeyError, TypeError):
+            # jwt.decode rejects it before the revocation check anyway
+            undecodable.append(row_id)
+            continue
+        bind.execute(revoked_tokens.update().where(
+            revoked_tokens.c.id == row_id).values(
+                token_hash=hashlib.sha256(token.encode()).hexdigest(),
+                expires_at=datetime.utcfromtimestamp(expires)))
+    if undecodable:
+        bind.execute(revoked_tokens.delete().where(
+            revoked_tokens.c.id.in_(undecodable)))
+
+    with op.batch_alter_table('revoked_tokens') as batch_op:
+        batch_op.alter_column('token_hash', existing_type=sa.String(length=64),
+                              nullable=False)
+        batch_op.alter_column('expires_at', existing_type=sa.DateTime(),
+                              nullable=False)
+        batch_op.create_unique_constraint('revoked_tokens_token_hash_key',
+                                          ['token_hash'])
+        batch_op.create_index('ix_revoked_tokens_expires_at', ['expires_at'])
+        batch_op.drop_column('token')
+
+
+def downgrade():
+    # a digest can't be turned back into its token, and dropping the rows
+    # would let every logged out token in again
+    raise NotImplementedError('revoked tokens are only kept as digests')
@@ -0,0 +1,24 @@
+"""Index revoked_tokens.revoked_on for the revocation cache sync
+
+Revision ID: 3d5a7c1e8f24
+Revises: 2c8e4b7d9a13
+Create Date: 2026-10-18 09:40:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '3d5a7c1e8f24'
+down_revision = '2c8e4b7d9a13'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_revoked_tokens_revoked_on', 'revoked_tokens',
+                    ['revoked_on'])
+
+
+def downgrade():
+    op.drop_index('ix_revoked_tokens_revoked_on', table_name='revoked_tokens')
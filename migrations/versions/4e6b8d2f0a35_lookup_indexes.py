@@ -0,0 +1,76 @@
+"""Unique names per owner and the indexes of the category and recipe lookups
+
+Revision ID: 4e6b8d2f0a35
+Revises: 3d5a7c1e8f24
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+import logging
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4e6b8d2f0a35'
+down_revision = '3d5a7c1e8f24'
+branch_labels = None
+depends_on = None
+
+logger = logging.getLogger('alembic.env')
+
+
+def rename_duplicates(table, owner, name, length):
+    """Earlier releases let a category or recipe share its name with
+    another one of the same owner. Keeps the oldest row of each name and
+    renames the others to "<name> (<id>)", reporting every change, so no
+    row is lost and the unique constraint can be created.
+    """
+    rows = sa.table(table, sa.column('id', sa.Integer),
+                    sa.column(owner, sa.Integer), sa.column(name, sa.String))
+    bind = op.get_bind()
+    duplicates = sa.select([rows.c[owner], rows.c[name]]).group_by(
+        rows.c[owner], rows.c[name]).having(sa.func.count() > 1).alias()
+    clashing = bind.execute(sa.select([rows.c.id, rows.c[owner], rows.c[name]])
+                            .select_from(rows.join(duplicates, sa.and_(
+                                rows.c[owner] == duplicates.c[owner],
+                                rows.c[name] == duplicates.c[name])))
+                            .order_by(rows.c[owner], rows.c[name], rows.c.id))
+    kept = None
+    for row_id, owned_by, value in clashing:
+        if kept == (owned_by, value):
+            suffix = ' ({})'.format(row_id)
+            renamed = value[:length - len(suffix)] + suffix
+            logger.warning('%s %s of %s %s: %r renamed to %r', table, row_id,
+                           owner, owned_by, value, renamed)
+            bind.execute(rows.update().where(rows.c.id == row_id).values(
+                {name: renamed}))
+        kept = (owned_by, value)
+
+
+def upgrade():
+    rename_duplicates('categories', 'created_by', 'name', 255)
+    rename_duplicates('recipes', 'category_identity', 'title', 256)
+    with op.batch_alter_table('categories') as batch_op:
+        batch_op.create_unique_constraint('uq_categories_created_by_name',
+                                          ['created_by', 'name'])
+    with op.batch_alter_table('recipes') as batch_op:
+        batch_op.create_unique_constraint(
+            'uq_recipes_category_identity_title',
+            ['category_identity', 'title'])
+    op.create_index('ix_categories_created_by_date_created', 'categories',
+                    ['created_by', sa.text('date_created DESC'),
+                     sa.text('id DESC')])
+    op.create_index('ix_recipes_category_identity_id', 'recipes',
+                    ['category_identity', 'id'])
+
+
+def downgrade():
+    op.drop_index('ix_recipes_category_identity_id', table_name='recipes')
+    op.drop_index('ix_categories_created_by_date_created',
+                  table_name='categories')
+    with op.batch_alter_table('recipes') as batch_op:
+        batch_op.drop_constraint('uq_recipes_category_identity_title',
+                                 type_='unique')
+    with op.batch_alter_table('categories') as batch_op:
+        batch_op.drop_constraint('uq_categories_created_by_name',
+                                 type_='unique')
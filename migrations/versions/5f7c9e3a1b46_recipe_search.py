@@ -0,0 +1,41 @@
+"""Full text search over recipe titles and descriptions
+
+Revision ID: 5f7c9e3a1b46
+Revises: 4e6b8d2f0a35
+Create Date: 2026-10-18 10:20:00.000000
+
+"""
+from alembic import op
+from app.search import (POSTGRES_BACKFILL, POSTGRES_DDL, SQLITE_BACKFILL,
+                        SQLITE_DDL)
+
+
+# revision identifiers, used by Alembic.
+revision = '5f7c9e3a1b46'
+down_revision = '4e6b8d2f0a35'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        statements = POSTGRES_DDL + [POSTGRES_BACKFILL]
+    elif dialect == 'sqlite':
+        statements = SQLITE_DDL + [SQLITE_BACKFILL]
+    else:
+        # other databases search with LIKE
+        return
+    for statement in statements:
+        op.execute(statement)
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        op.execute('DROP TRIGGER recipes_search_vector_update ON recipes')
+        op.execute('ALTER TABLE recipes DROP COLUMN search_vector')
+    elif dialect == 'sqlite':
+        for operation in ('insert', 'delete', 'update'):
+            op.execute('DROP TRIGGER recipes_fts_{}'.format(operation))
+        op.execute('DROP TABLE recipes_fts')
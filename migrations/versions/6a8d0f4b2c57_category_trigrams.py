@@ -0,0 +1,30 @@
+"""Trigram index for fuzzy category search on PostgreSQL
+
+Revision ID: 6a8d0f4b2c57
+Revises: 5f7c9e3a1b46
+Create Date: 2026-10-18 10:40:00.000000
+
+"""
+from alembic import op
+from app.search import TRIGRAM_DDL, TRIGRAM_EXTENSION
+
+
+# revision identifiers, used by Alembic.
+revision = '6a8d0f4b2c57'
+down_revision = '5f7c9e3a1b46'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    # run the migrations as a role allowed to create extensions
+    op.execute(TRIGRAM_EXTENSION)
+    for statement in TRIGRAM_DDL:
+        op.execute(statement)
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        op.drop_index('ix_categories_name_trgm', table_name='categories')
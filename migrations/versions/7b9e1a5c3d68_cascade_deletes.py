@@ -0,0 +1,48 @@
+"""Delete recipes with their category and categories with their user
+
+Revision ID: 7b9e1a5c3d68
+Revises: 6a8d0f4b2c57
+Create Date: 2026-10-18 11:00:00.000000
+
+"""
+from alembic import op
+from app.search import SQLITE_DDL
+
+
+# revision identifiers, used by Alembic.
+revision = '7b9e1a5c3d68'
+down_revision = '6a8d0f4b2c57'
+branch_labels = None
+depends_on = None
+
+# the names PostgreSQL gave the constraints, and SQLite's unnamed ones
+# get for the batch copy
+NAMING_CONVENTION = {'fk': '%(table_name)s_%(column_0_name)s_fkey'}
+
+FOREIGN_KEYS = [
+    ('categories', 'created_by', 'users'),
+    ('recipes', 'category_identity', 'categories'),
+]
+
+
+def replace_foreign_keys(ondelete):
+    for table, column, referred in FOREIGN_KEYS:
+        name = '{}_{}_fkey'.format(table, column)
+        with op.batch_alter_table(
+                table, naming_convention=NAMING_CONVENTION) as batch_op:
+            batch_op.drop_constraint(name, type_='foreignkey')
+            batch_op.create_foreign_key(name, referred, [column], ['id'],
+                                        ondelete=ondelete)
+    if op.get_bind().dialect.name == 'sqlite':
+        # the copy of recipes lost the triggers of its search index
+        for statement in SQLITE_DDL:
+            if statement.startswith('CREATE TRIGGER'):
+                op.execute(statement)
+
+
+def upgrade():
+    replace_foreign_keys('CASCADE')
+
+
+def downgrade():
+    replace_foreign_keys(None)
@@ -0,0 +1,49 @@
+"""Count the recipes of categories and the categories of users
+
+Revision ID: 8c0f2a6e4d79
+Revises: 7b9e1a5c3d68
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from app.counters import (COUNTERS, POSTGRES_TRIGGERS, reconcile_statements,
+                          trigger_ddl)
+
+
+# revision identifiers, used by Alembic.
+revision = '8c0f2a6e4d79'
+down_revision = '7b9e1a5c3d68'
+branch_labels = None
+depends_on = None
+
+SQLITE_OPERATIONS = ['insert', 'delete', 'update']
+
+
+def upgrade():
+    for table, key, parent, counter, touch in COUNTERS:
+        op.add_column(parent, sa.Column(counter, sa.Integer(), nullable=False,
+                                        server_default='0'))
+    bind = op.get_bind()
+    for statement in trigger_ddl(bind.dialect.name):
+        op.execute(statement)
+    # the triggers only count what changes from now on
+    for statement in reconcile_statements():
+        bind.execute(statement)
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    for table, key, parent, counter, touch in COUNTERS:
+        if dialect == 'postgresql':
+            for operation, transitions, changes in POSTGRES_TRIGGERS:
+                name = 'count_{}_{}'.format(table, operation)
+                op.execute('DROP TRIGGER IF EXISTS {} ON {}'.format(
+                    name, table))
+                op.execute('DROP FUNCTION IF EXISTS {}()'.format(name))
+        elif dialect == 'sqlite':
+            for operation in SQLITE_OPERATIONS:
+                op.execute('DROP TRIGGER IF EXISTS {}_count_{}'.format(
+                    table, operation))
+        with op.batch_alter_table(parent) as batch_op:
+            batch_op.drop_column(counter)
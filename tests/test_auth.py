@@ -1,8 +1,16 @@
 
 import unittest
 import json
+from datetime import datetime, timedelta
+import bcrypt
+from flask import Flask
+from sqlalchemy import event
 from app import create_app, db
 from app.models import User, RevokedToken
+from app.mailer import mailer
+from app.passwords import hash_rounds
+from app.revocation import revocation_cache, token_digest
+from app.token_cache import token_cache
 
 class AuthTestCase(unittest.TestCase):
     """Test case for the authentication blueprint."""
@@ -61,6 +69,23 @@ class AuthTestCase(unittest.TestCase):
         self.assertEqual(login_res.status_code, 200)
         self.assertTrue(result['access_token'])
 
+    def test_login_rehashes_password_with_new_work_factor(self):
+        """Test login upgrades a hash made with another work factor"""
+        self.client().post('/api/v1/auth/register', data=self.user_data)
+        with self.app.app_context():
+            user = User.query.filter_by(email='test@example.com').first()
+            user.password = bcrypt.hashpw(
+                b'test_password', bcrypt.gensalt(5)).decode()
+            user.save()
+        login_res = self.client().post('/api/v1/auth/login',
+                                       data=self.user_data)
+        self.assertEqual(login_res.status_code, 200)
+        with self.app.app_context():
+            user = User.query.filter_by(email='test@example.com').first()
+            self.assertEqual(hash_rounds(user.password),
+                             self.app.config['BCRYPT_LOG_ROUNDS'])
+            self.assertTrue(user.password_is_valid('test_password'))
+
     def test_non_registered_user_login(self):
         """Test non registered users cannot login."""
         # define a dictionary to represent an unregistered user
@@ -113,6 +138,133 @@ class AuthTestCase(unittest.TestCase):
         self.assertTrue(data['message'] == 'Your have been logged out.')
         self.assertEqual(res.status_code, 201)
 
+    def test_revoked_token_is_rejected(self):
+        """Test a token cannot be used after logging out"""
+        self.client().post('/api/v1/auth/register', data=self.user_data)
+        login_res = self.client().post('/api/v1/auth/login',
+                                       data=self.user_data)
+        access_token = json.loads(login_res.data.decode())['access_token']
+        headers = dict(Authorization="Bearer " + access_token)
+        self.client().post('/api/v1/auth/logout', headers=headers)
+        res = self.client().get('/api/v1/categories/', headers=headers)
+        self.assertEqual(res.status_code, 401)
+        self.assertIn('Revoked token', str(res.data))
+
+    def test_live_token_skips_revoked_tokens_table(self):
+        """Test a token that is not revoked is checked without a query"""
+        self.client().post('/api/v1/auth/register', data=self.user_data)
+        login_res = self.client().post('/api/v1/auth/login',
+                                       data=self.user_data)
+        access_token = json.loads(login_res.data.decode())['access_token']
+        statements = []
+        with self.app.app_context():
+            RevokedToken.check_revoked_token(access_token)
+
+            def record(conn, cursor, statement, *args):
+                statements.append(statement)
+            event.listen(db.engine, 'before_cursor_execute', record)
+            try:
+                self.assertEqual(User.decode_token(access_token), 1)
+            finally:
+                event.remove(db.engine, 'before_cursor_execute', record)
+        self.assertFalse([s for s in statements if 'revoked_tokens' in s])
+
+    def test_revocations_of_other_processes_are_synced(self):
+        """Test a process picks up tokens another one revoked, including
+        a row that committed after a newer one was synced"""
+        other = create_app(config_name="testing")
+        # as if it were one of several workers
+        other.extensions['revocation_cache'].sync_interval = 0
+        live = datetime.utcnow() + timedelta(days=1)
+        with other.app_context():
+            RevokedToken.check_revoked_token('warm')
+        with self.app.app_context():
+            RevokedToken('newer', live).save()
+        with other.app_context():
+            self.assertTrue(RevokedToken.check_revoked_token('newer'))
+        with self.app.app_context():
+            late = RevokedToken('late', live)
+            late.revoked_on = datetime.utcnow() - timedelta(seconds=30)
+            late.save()
+        with other.app_context():
+            self.assertTrue(RevokedToken.check_revoked_token('late'))
+            self.assertFalse(RevokedToken.check_revoked_token('live'))
+
+    def test_several_workers_check_revocations_exactly(self):
+        """Test workers sync on every check unless told otherwise, and a
+        single one does not need to"""
+        for workers, interval in ((2, 0), (1, None)):
+            app = Flask(__name__)
+            app.config['WEB_CONCURRENCY'] = workers
+            revocation_cache.init_app(app)
+            self.assertEqual(app.extensions['revocation_cache'].sync_interval,
+                             interval)
+
+    def test_decoded_tokens_are_cached_until_logout(self):
+        """Test repeated decodes hit the token cache and logout evicts"""
+        self.client().post('/api/v1/auth/register', data=self.user_data)
+        login_res = self.client().post('/api/v1/auth/login',
+                                       data=self.user_data)
+        access_token = json.loads(login_res.data.decode())['access_token']
+        headers = dict(Authorization="Bearer " + access_token)
+        for _ in range(3):
+            self.client().get('/api/v1/categories/', headers=headers)
+        with self.app.app_context():
+            stats = token_cache.stats()
+            self.assertEqual(stats['misses'], 1)
+            self.assertEqual(stats['hits'], 2)
+        self.client().post('/api/v1/auth/logout', headers=headers)
+        with self.app.app_context():
+            self.assertIsNone(token_cache.get(token_digest(access_token)))
+
+    def test_prune_expired_revoked_tokens(self):
+        """Test pruning only deletes revoked tokens that have expired"""
+        with self.app.app_context():
+            for i in range(5):
+                RevokedToken('expired-{}'.format(i),
+                             datetime.utcnow() - timedelta(days=1)).save()
+            RevokedToken('live', datetime.utcnow() + timedelta(days=1)).save()
+            deleted = RevokedToken.prune_expired(batch_size=2)
+            self.assertEqual(deleted, 5)
+            self.assertEqual(RevokedToken.query.count(), 1)
+            self.assertTrue(RevokedToken.check_revoked_token('live'))
+
+    def test_reset_email_is_queued_for_its_recipient_only(self):
+        """Test reset emails go out from the worker, one address each."""
+        self.client().post('/api/v1/auth/register', data=self.user_data)
+        self.client().post('/api/v1/auth/register', data={
+            'username': 'other', 'email': 'other@example.com',
+            'password': 'test_password'})
+        for email in ('test@example.com', 'other@example.com'):
+            res = self.client().post('/api/v1/auth/send_email',
+                                     data={'email': email})
+            self.assertEqual(res.status_code, 201)
+        with self.app.app_context():
+            self.assertTrue(mailer.flush(timeout=5))
+            outbox = mailer.backend.outbox
+            self.assertEqual([msg.recipients for msg in outbox],
+                             [['test@example.com'], ['other@example.com']])
+            self.assertEqual(mailer.stats()['sent'], 2)
+            # both went over the same connection
+            self.assertEqual(mailer.backend.connections, 1)
+
+    def test_failed_email_is_retried_then_given_up(self):
+        """Test the worker retries a dropped connection a few times."""
+        self.client().post('/api/v1/auth/register', data=self.user_data)
+        with self.app.app_context():
+            mailer.backend.failures = 2
+            self.client().post('/api/v1/auth/send_email',
+                               data={'email': 'test@example.com'})
+            self.assertTrue(mailer.flush(timeout=5))
+            self.assertEqual(len(mailer.backend.outbox), 1)
+            mailer.backend.failures = 10
+            self.client().post('/api/v1/auth/send_email',
+                               data={'email': 'test@example.com'})
+            self.assertTrue(mailer.flush(timeout=5))
+            self.assertEqual(len(mailer.backend.outbox), 1)
+            self.assertEqual(mailer.stats(), {'queued': 0, 'sent': 1,
+                                              'failed': 1, 'retries': 5})
+
     def test_when_token_expired_or_invalid(self):
         """Test for expired or invalid"""
         response = self.client().post('/api/v1/categories/',
@@ -1,7 +1,9 @@
 import unittest
 import json
 from app import create_app, db
+from app.counters import reconcile
 from app.models import Category, User, Recipe
+from app.search import TRIGRAM_EXTENSION
 
 class CategoryTestCase(unittest.TestCase):
     """This class represents the category test case"""
@@ -107,6 +109,63 @@ class CategoryTestCase(unittest.TestCase):
         )
         self.assertEqual(res.status_code, 200)
         self.assertIn('Supper', str(res.data))
+    def require_fuzzy_search(self):
+        """PostgreSQL needs pg_trgm, installed here when it is available."""
+        with self.app.app_context():
+            if db.engine.dialect.name != 'postgresql':
+                return
+            available = db.session.execute(
+                "SELECT 1 FROM pg_available_extensions "
+                "WHERE name = 'pg_trgm'").first()
+            if not available:
+                self.skipTest('pg_trgm is not available')
+            db.session.execute(TRIGRAM_EXTENSION)
+            db.session.commit()
+
+    def test_category_search_is_fuzzy_and_ranked(self):
+        """Test q finds misspelt and partial names, closest first."""
+        self.require_fuzzy_search()
+        self.register_user()
+        result = self.login_user()
+        access_token = json.loads(result.data.decode())['access_token']
+        headers = dict(Authorization="Bearer " + access_token)
+        for name in ('Desserts', 'Dessert Wines', 'Supper'):
+            self.client().post('/api/v1/categories/', headers=headers,
+                               data={'name': name})
+        res = self.client().get('/api/v1/categories/?q=deserts',
+                                headers=headers)
+        self.assertEqual(res.status_code, 200)
+        self.assertIn('Desserts', str(res.data))
+        res = self.client().get('/api/v1/categories/?q=dessert',
+                                headers=headers)
+        names = [item['cat']['name']
+                 for item in json.loads(res.data.decode())['categories']]
+        self.assertEqual(names, ['Desserts', 'Dessert Wines'])
+        res = self.client().get('/api/v1/categories/?q=upp', headers=headers)
+        self.assertIn('Supper', str(res.data))
+
+    def test_category_search_without_pg_trgm_matches_substrings(self):
+        """Test PostgreSQL without pg_trgm matches names containing q"""
+        with self.app.app_context():
+            if db.engine.dialect.name != 'postgresql':
+                self.skipTest('SQLite ranks names with an n-gram index')
+        self.app.extensions['search'] = {'pg_trgm': False}
+        self.register_user()
+        result = self.login_user()
+        access_token = json.loads(result.data.decode())['access_token']
+        headers = dict(Authorization="Bearer " + access_token)
+        for name in ('Desserts', 'Dessert Wines', 'Supper'):
+            self.client().post('/api/v1/categories/', headers=headers,
+                               data={'name': name})
+        res = self.client().get('/api/v1/categories/?q=dessert',
+                                headers=headers)
+        names = [item['cat']['name']
+                 for item in json.loads(res.data.decode())['categories']]
+        self.assertEqual(sorted(names), ['Dessert Wines', 'Desserts'])
+        res = self.client().get('/api/v1/categories/?q=deserts',
+                                headers=headers)
+        self.assertEqual(res.status_code, 404)
+
     def test_category_can_be_got_using_pagination(self):
         """Test API can get a single category by limiting items per page."""
         self.register_user()
@@ -123,6 +182,161 @@ class CategoryTestCase(unittest.TestCase):
         self.assertEqual(res.status_code, 200)
         self.assertIn('Supper', str(res.data))
 
+    def test_categories_can_be_got_using_a_cursor(self):
+        """Test API can walk all categories with cursor pagination."""
+        self.register_user()
+        result = self.login_user()
+        access_token = json.loads(result.data.decode())['access_token']
+        headers = dict(Authorization="Bearer " + access_token)
+        for name in ('Supper', 'Lunch', 'Breakfast'):
+            self.client().post('/api/v1/categories/', headers=headers,
+                               data={'name': name})
+        names = []
+        cursor = ''
+        while cursor is not None:
+            res = self.client().get(
+                '/api/v1/categories/?limit=2&cursor=' + cursor,
+                headers=headers)
+            self.assertEqual(res.status_code, 200)
+            data = json.loads(res.data.decode())
+            self.assertNotIn('total_Items', data)
+            names.extend(item['cat']['name'] for item in data['categories'])
+            cursor = data['next_cursor']
+        self.assertEqual(sorted(names), ['Breakfast', 'Lunch', 'Supper'])
+        res = self.client().get('/api/v1/categories/?cursor=&count=true',
+                                headers=headers)
+        self.assertEqual(json.loads(res.data.decode())['total_Items'], 3)
+        res = self.client().get('/api/v1/categories/?cursor=bogus',
+                                headers=headers)
+        self.assertEqual(res.status_code, 400)
+
+    def test_unchanged_categories_answer_not_modified(self):
+        """Test conditional GETs get a 304 until the category changes."""
+        self.register_user()
+        result = self.login_user()
+        access_token = json.loads(result.data.decode())['access_token']
+        headers = dict(Authorization="Bearer " + access_token)
+        self.client().post('/api/v1/categories/', headers=headers,
+                           data=self.category)
+        for url in ('/api/v1/categories/', '/api/v1/categories/1'):
+            full = self.client().get(url, headers=headers)
+            res = self.client().get(url, headers=dict(
+                headers, **{'If-None-Match': full.headers['ETag']}))
+            self.assertEqual(res.status_code, 304)
+            self.assertEqual(res.data, b'')
+        res = self.client().get('/api/v1/categories/1', headers=dict(
+            headers, **{'If-Modified-Since': full.headers['Last-Modified']}))
+        self.assertEqual(res.status_code, 304)
+        listing = self.client().get('/api/v1/categories/', headers=headers)
+        self.client().post('/api/v1/categories/', headers=headers,
+                           data={'name': 'Lunch'})
+        res = self.client().get('/api/v1/categories/', headers=dict(
+            headers, **{'If-None-Match': listing.headers['ETag']}))
+        self.assertEqual(res.status_code, 200)
+        self.assertIn('Lunch', str(res.data))
+
+    def test_category_listing_is_cached_until_the_user_writes(self):
+        """Test a repeated listing is served from the response cache."""
+        self.register_user()
+        result = self.login_user()
+        access_token = json.loads(result.data.decode())['access_token']
+        headers = dict(Authorization="Bearer " + access_token)
+        self.client().post('/api/v1/categories/', headers=headers,
+                           data=self.category)
+        res = self.client().get('/api/v1/categories/', headers=headers)
+        self.assertEqual(res.headers['X-Cache'], 'MISS')
+        cached = self.client().get('/api/v1/categories/', headers=headers)
+        self.assertEqual(cached.headers['X-Cache'], 'HIT')
+        self.assertEqual(cached.data, res.data)
+        self.assertEqual(cached.headers['ETag'], res.headers['ETag'])
+        res = self.client().get('/api/v1/categories/', headers=dict(
+            headers, **{'If-None-Match': cached.headers['ETag']}))
+        self.assertEqual(res.status_code, 304)
+        self.client().put('/api/v1/categories/1', headers=headers,
+                          data={'name': 'dinner'})
+        res = self.client().get('/api/v1/categories/', headers=headers)
+        self.assertEqual(res.headers['X-Cache'], 'MISS')
+        self.assertIn('dinner', str(res.data))
+        self.client().delete('/api/v1/categories/1', headers=headers)
+        res = self.client().get('/api/v1/categories/', headers=headers)
+        self.assertEqual(res.status_code, 404)
+        with self.app.app_context():
+            from app.response_cache import response_cache
+            stats = response_cache.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (2, 3))
+        self.assertEqual(stats['hit_rate'], 0.4)
+
+    def test_response_cache_generations_are_shared(self):
+        """Test a write through one app invalidates another's cached pages."""
+        from app.response_cache import LocalSharedBackend
+        LocalSharedBackend.stores.pop('test-shared', None)
+        apps = []
+        for _ in range(2):
+            app = create_app(config_name="testing")
+            app.config.update(RESPONSE_CACHE_BACKEND='local-shared',
+                              RESPONSE_CACHE_URL='test-shared')
+            from app.response_cache import response_cache
+            response_cache.init_app(app)
+            apps.append(app.test_client())
+        first, second = apps
+        self.register_user()
+        result = self.login_user()
+        access_token = json.loads(result.data.decode())['access_token']
+        headers = dict(Authorization="Bearer " + access_token)
+        first.post('/api/v1/categories/', headers=headers, data=self.category)
+        first.get('/api/v1/categories/', headers=headers)
+        res = second.get('/api/v1/categories/', headers=headers)
+        self.assertEqual(res.headers['X-Cache'], 'HIT')
+        second.post('/api/v1/categories/', headers=headers,
+                    data={'name': 'Lunch'})
+        res = first.get('/api/v1/categories/', headers=headers)
+        self.assertEqual(res.headers['X-Cache'], 'MISS')
+        self.assertIn('Lunch', str(res.data))
+        LocalSharedBackend.stores.pop('test-shared', None)
+
+    def test_workers_must_share_the_response_cache(self):
+        """Test several workers refuse a per process response cache"""
+        from app.response_cache import response_cache
+        app = create_app(config_name="testing")
+        app.config['WEB_CONCURRENCY'] = 2
+        with self.assertRaises(ValueError):
+            response_cache.init_app(app)
+        app.config['RESPONSE_CACHE_ENABLED'] = False
+        response_cache.init_app(app)
+        self.assertIn('response_cache', app.extensions)
+
+    def test_category_links_can_be_relative_or_omitted(self):
+        """Test listings build the same Recipes links url_for did."""
+        self.register_user()
+        result = self.login_user()
+        access_token = json.loads(result.data.decode())['access_token']
+        headers = dict(Authorization="Bearer " + access_token)
+        self.client().post('/api/v1/categories/', headers=headers,
+                           data=self.category)
+        links = {}
+        for mode in ('absolute', 'relative', 'none'):
+            res = self.client().get('/api/v1/categories/?links=' + mode,
+                                    headers=headers)
+            row = json.loads(res.data.decode())['categories'][0]
+            links[mode] = row.get('Recipes')
+        self.assertEqual(links['absolute'],
+                         'http://localhost/api/v1/categories/1/recipes')
+        self.assertEqual(links['relative'], '/api/v1/categories/1/recipes')
+        self.assertIsNone(links['none'])
+        res = self.client().get('/api/v1/categories/1', headers=headers)
+        self.assertEqual(json.loads(res.data.decode())['Recipes'],
+                         links['absolute'])
+        # mounted under a prefix, as url_for would see it
+        for mode, link in (
+                ('absolute', 'http://localhost/cookbook/api/v1/categories/1/'
+                             'recipes'),
+                ('relative', '/cookbook/api/v1/categories/1/recipes')):
+            res = self.client().get(
+                '/api/v1/categories/?links=' + mode, headers=headers,
+                environ_overrides={'SCRIPT_NAME': '/cookbook'})
+            self.assertEqual(json.loads(res.data.decode())['categories'][0][
+                'Recipes'], link)
+
     def test_category_can_be_edited(self):
         """Test API can edit an existing category. (PUT request)"""
         self.register_user()
@@ -165,6 +379,119 @@ class CategoryTestCase(unittest.TestCase):
             '/api/v1/categories/1',
             headers=dict(Authorization="Bearer " + access_token))
         self.assertEqual(result.status_code, 404)
+    def test_deletes_cascade_in_the_database(self):
+        """Test recipes go with their category and categories with
+        their user, without the ORM loading them"""
+        self.register_user()
+        result = self.login_user()
+        headers = dict(Authorization="Bearer " + json.loads(
+            result.data.decode())['access_token'])
+        for name in ('lunch', 'supper'):
+            self.client().post('/api/v1/categories/', headers=headers,
+                               data={'name': name})
+        for category_id in (1, 2):
+            self.client().post(
+                '/api/v1/categories/{}/recipes/batch'.format(category_id),
+                headers=headers, content_type='application/json',
+                data=json.dumps({'recipes': [
+                    {'title': 'dish ' + letter} for letter in 'abcde']}))
+        res = self.client().delete('/api/v1/categories/1', headers=headers)
+        self.assertEqual(res.status_code, 200)
+        with self.app.app_context():
+            self.assertEqual(Recipe.query.filter_by(
+                category_identity=1).count(), 0)
+            self.assertEqual(Recipe.query.count(), 5)
+            user = User.query.get(1)
+            statements = []
+            listener = lambda *args: statements.append(args[2])
+            db.event.listen(db.engine, 'before_cursor_execute', listener)
+            try:
+                db.session.delete(user)
+                db.session.commit()
+            finally:
+                db.event.remove(db.engine, 'before_cursor_execute', listener)
+            self.assertEqual(len(statements), 1, statements)
+            self.assertEqual(Category.query.count(), 0)
+            self.assertEqual(Recipe.query.count(), 0)
+
+    def test_counts_follow_every_write(self):
+        """Test the recipe and category counters follow creates, batches,
+        deletes and cascades"""
+        self.register_user()
+        result = self.login_user()
+        headers = dict(Authorization="Bearer " + json.loads(
+            result.data.decode())['access_token'])
+        for name in ('lunch', 'supper', 'brunch'):
+            self.client().post('/api/v1/categories/', headers=headers,
+                               data={'name': name})
+        self.client().post(
+            '/api/v1/categories/1/recipes/batch', headers=headers,
+            content_type='application/json', data=json.dumps({'recipes': [
+                {'title': 'dish ' + letter} for letter in 'abcd']}))
+        res = self.client().post('/api/v1/categories/1/recipes',
+                                 headers=headers, data={
+                                     'title': 'pilau',
+                                     'description': 'boil the rice'})
+        self.assertEqual(res.status_code, 201)
+        self.client().post('/api/v1/categories/2/recipes', headers=headers,
+                           data={'title': 'stew', 'description': 'simmer'})
+        self.client().delete('/api/v1/categories/1/recipes/1',
+                             headers=headers)
+        self.client().delete('/api/v1/categories/3', headers=headers)
+        res = self.client().get('/api/v1/categories/1', headers=headers)
+        self.assertEqual(
+            json.loads(res.data.decode())['category']['recipe_count'], 4)
+        with self.app.app_context():
+            self.assertEqual(User.query.get(1).category_count, 2)
+            db.session.delete(Category.query.get(2))
+            db.session.commit()
+            self.assertEqual(User.query.get(1).category_count, 1)
+
+    def test_listing_total_comes_from_the_counter(self):
+        """Test total_Items is read from the counter without a COUNT, and
+        reconcile fixes a counter that drifted"""
+        self.register_user()
+        result = self.login_user()
+        headers = dict(Authorization="Bearer " + json.loads(
+            result.data.decode())['access_token'])
+        for name in ('lunch', 'supper'):
+            self.client().post('/api/v1/categories/', headers=headers,
+                               data={'name': name})
+        with self.app.app_context():
+            # drift as a database written before the triggers would
+            db.session.execute(User.__table__.update().values(
+                category_count=7))
+            db.session.execute(Category.__table__.update().where(
+                Category.id == 1).values(recipe_count=3))
+            db.session.commit()
+        res = self.client().get('/api/v1/categories/', headers=headers)
+        self.assertEqual(json.loads(res.data.decode())['total_Items'], 7)
+        with self.app.app_context():
+            self.assertEqual(reconcile(), (1, 1))
+            self.assertEqual(reconcile(), (0, 0))
+            self.assertEqual(User.query.get(1).category_count, 2)
+            self.assertEqual(Category.query.get(1).recipe_count, 0)
+
+    def test_listing_tag_changes_with_recipe_counts(self):
+        """Test adding a recipe changes the ETag of the category listing"""
+        self.register_user()
+        result = self.login_user()
+        headers = dict(Authorization="Bearer " + json.loads(
+            result.data.decode())['access_token'])
+        self.client().post('/api/v1/categories/', headers=headers,
+                           data=self.category)
+        res = self.client().get('/api/v1/categories/', headers=headers)
+        etag = res.headers['ETag']
+        self.client().post('/api/v1/categories/1/recipes', headers=headers,
+                           data={'title': 'pilau',
+                                 'description': 'boil the rice'})
+        res = self.client().get('/api/v1/categories/', headers=dict(
+            headers, **{'If-None-Match': etag}))
+        self.assertEqual(res.status_code, 200)
+        self.assertNotEqual(res.headers['ETag'], etag)
+        self.assertEqual(json.loads(res.data.decode())['categories'][0][
+            'cat']['recipe_count'], 1)
+
     def test_if_category_already_exists(self):
         """Test if category exists already"""
         self.register_user()
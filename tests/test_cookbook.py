@@ -0,0 +1,191 @@
+import unittest
+import json
+from io import BytesIO
+from app import create_app, db
+from app.cookbook.importer import CookbookImporter
+from app.models import Category, Recipe
+
+
+class CookbookTestCase(unittest.TestCase):
+    """This class represents the cookbook export and import test case"""
+
+    def setUp(self):
+        """Define test variables and initialize app."""
+        self.app = create_app(config_name="testing")
+        self.client = self.app.test_client
+        with self.app.app_context():
+            db.session.close()
+            db.drop_all()
+            db.create_all()
+
+    def register_user(self, username="haddie", email="user@test.com", password="test1234"):
+        """This helper method helps register a test user."""
+        user_data = {
+            'username':username,
+            'email': email,
+            'password': password
+        }
+        return self.client().post('/api/v1/auth/register', data=user_data)
+
+    def login_user(self, email="user@test.com", password="test1234"):
+        """This helper method helps log in a test user."""
+        user_data = {
+            'email': email,
+            'password': password
+        }
+        return self.client().post('/api/v1/auth/login', data=user_data)
+
+    def auth_headers(self):
+        """Registers and logs in the test user, returning its headers."""
+        self.register_user()
+        result = self.login_user()
+        access_token = json.loads(result.data.decode())['access_token']
+        return dict(Authorization="Bearer " + access_token)
+
+    def create_cookbook(self, headers):
+        for name in ('Supper', 'Lunch'):
+            self.client().post('/api/v1/categories/', headers=headers,
+                               data={'name': name})
+        for title in ('pilau', 'matoke'):
+            self.client().post('/api/v1/categories/1/recipes',
+                               headers=headers,
+                               data={'title': title, 'description': 'cook'})
+
+    def test_cookbook_can_be_exported_as_ndjson(self):
+        """Test API streams categories followed by their recipes"""
+        headers = self.auth_headers()
+        self.create_cookbook(headers)
+        res = self.client().get('/api/v1/export', headers=headers)
+        self.assertEqual(res.status_code, 200)
+        lines = [json.loads(line) for line in res.data.decode().splitlines()]
+        self.assertEqual([(line['type'], line.get('name') or line['title'])
+                          for line in lines],
+                         [('category', 'Supper'), ('recipe', 'pilau'),
+                          ('recipe', 'matoke'), ('category', 'Lunch')])
+
+    def test_cookbook_can_be_exported_as_csv(self):
+        """Test API streams a csv line per recipe"""
+        headers = self.auth_headers()
+        self.create_cookbook(headers)
+        res = self.client().get('/api/v1/export?format=csv', headers=headers)
+        self.assertEqual(res.status_code, 200)
+        lines = res.data.decode().splitlines()
+        self.assertEqual(lines[0], 'category_id,category_name,recipe_id,'
+                         'title,description,date_created,date_modified')
+        self.assertEqual(len(lines), 4)
+        self.assertTrue(lines[1].startswith('1,Supper,1,pilau,cook,'))
+        res = self.client().get('/api/v1/export?format=xml', headers=headers)
+        self.assertEqual(res.status_code, 400)
+
+    def test_exported_cookbook_can_be_imported(self):
+        """Test an export can be loaded into another user's account"""
+        headers = self.auth_headers()
+        self.create_cookbook(headers)
+        exported = self.client().get('/api/v1/export', headers=headers).data
+        self.register_user(username="other", email="other@test.com")
+        result = self.login_user(email="other@test.com")
+        other = dict(Authorization="Bearer " +
+                     json.loads(result.data.decode())['access_token'])
+        res = self.client().post('/api/v1/import', headers=other,
+                                 data=exported,
+                                 content_type='application/x-ndjson')
+        self.assertEqual(res.status_code, 200)
+        report = json.loads(res.data.decode())
+        self.assertEqual(report['created_categories'], 2)
+        self.assertEqual(report['created_recipes'], 2)
+        self.assertEqual(report['resume_from'], 4)
+        # importing again only skips what is already there
+        res = self.client().post('/api/v1/import', headers=other,
+                                 data=exported,
+                                 content_type='application/x-ndjson')
+        report = json.loads(res.data.decode())
+        self.assertEqual(report['created_recipes'], 0)
+        self.assertEqual(report['skipped'], 2)
+
+    def test_csv_upload_can_be_resumed(self):
+        """Test a csv upload reports bad rows and honours resume_from"""
+        headers = self.auth_headers()
+        upload = ('category_name,title,description\n'
+                  'supper,pilau,fry\n'
+                  'supper,m4toke,steam\n'
+                  'lunch,fruit,mix\n').encode()
+        res = self.client().post(
+            '/api/v1/import?format=csv&resume_from=1', headers=headers,
+            data={'file': (BytesIO(upload), 'cookbook.csv')},
+            content_type='multipart/form-data')
+        self.assertEqual(res.status_code, 200)
+        report = json.loads(res.data.decode())
+        self.assertEqual(report['processed'], 2)
+        self.assertEqual(report['created_recipes'], 1)
+        self.assertEqual(report['errors'][0]['line'], 2)
+        res = self.client().get('/api/v1/categories/', headers=headers)
+        self.assertIn('Lunch', str(res.data))
+        self.assertNotIn('Supper', str(res.data))
+
+    def test_import_skips_rows_created_while_it_runs(self):
+        """Test categories and recipes added after the import started are
+        reused and skipped instead of failing the import"""
+        headers = self.auth_headers()
+        with self.app.app_context():
+            importer = CookbookImporter(1, chunk_size=10)
+        self.create_cookbook(headers)
+        records = [(1, 'supper', 'pilau', 'fry'),
+                   (2, 'supper', 'ugali', 'stir'),
+                   (3, 'supper', 'ugali', 'stir again')]
+        with self.app.app_context():
+            report = importer.run(records)
+            self.assertEqual(report['created_categories'], 0)
+            self.assertEqual(report['created_recipes'], 1)
+            self.assertEqual(report['skipped'], 2)
+            self.assertEqual(report['resume_from'], 3)
+            self.assertEqual(Category.query.count(), 2)
+            self.assertEqual(Recipe.query.filter_by(
+                category_identity=1).count(), 3)
+
+    def test_import_reports_values_it_cannot_store(self):
+        """Test a null description imports as empty and a title longer
+        than its column fails its record instead of the request"""
+        headers = self.auth_headers()
+        upload = '\n'.join(json.dumps(item) for item in [
+            {'category': 'supper', 'title': 'pilau', 'description': None},
+            {'category': 'supper', 'title': 'u' * 300, 'description': 'x'},
+        ])
+        res = self.client().post('/api/v1/import', headers=headers,
+                                 data=upload,
+                                 content_type='application/x-ndjson')
+        self.assertEqual(res.status_code, 200)
+        report = json.loads(res.data.decode())
+        self.assertEqual(report['created_recipes'], 1)
+        self.assertEqual(report['errors'][0]['line'], 2)
+        with self.app.app_context():
+            self.assertEqual(Recipe.query.one().description, '')
+
+    def test_import_stops_at_a_chunk_the_database_rejects(self):
+        """Test a failing chunk is rolled back and reported, keeping the
+        chunks stored before it and their resume_from"""
+        headers = self.auth_headers()
+        self.create_cookbook(headers)
+        with self.app.app_context():
+            importer = CookbookImporter(1, chunk_size=1)
+        # supper goes away after the importer looked it up
+        self.client().delete('/api/v1/categories/1', headers=headers)
+        records = [(1, 'breakfast', 'toast', 'grill'),
+                   (2, 'supper', 'ugali', 'stir'),
+                   (3, 'lunch', 'fruit', 'mix')]
+        with self.app.app_context():
+            report = importer.run(records)
+            self.assertEqual(report['created_recipes'], 1)
+            self.assertEqual(report['resume_from'], 1)
+            self.assertEqual(report['failed'], 1)
+            self.assertEqual(report['errors'][0]['line'], 2)
+            self.assertEqual(Recipe.query.one().title, 'toast')
+
+    def tearDown(self):
+        """teardown all initialized variables."""
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,88 @@
+import unittest
+import json
+from app import create_app, db
+from app.database import TimedNullPool, TimedQueuePool
+from app.instrumentation import instrumentation
+
+
+class DatabasePoolTestCase(unittest.TestCase):
+    """Test the connection pool settings of PostgreSQL engines"""
+
+    def make_app(self, **config):
+        app = create_app(config_name="testing")
+        app.config.update(config)
+        return app
+
+    def setUp(self):
+        self.app = self.make_app()
+        with self.app.app_context():
+            if db.engine.dialect.name != 'postgresql':
+                self.skipTest('pool settings only apply to PostgreSQL')
+
+    def test_pool_is_sized_from_config(self):
+        """Test the pool takes its size, overflow and timeout from config"""
+        app = self.make_app(DATABASE_POOL_SIZE=3, DATABASE_MAX_OVERFLOW=2,
+                            DATABASE_POOL_TIMEOUT=7)
+        with app.app_context():
+            pool = db.engine.pool
+            self.assertIsInstance(pool, TimedQueuePool)
+            self.assertEqual(pool.size(), 3)
+            self.assertEqual(pool._max_overflow, 2)
+            self.assertEqual(pool._timeout, 7)
+
+    def test_statement_timeout_is_set_on_connect(self):
+        """Test every new connection carries the statement timeout"""
+        app = self.make_app(DATABASE_STATEMENT_TIMEOUT=1500)
+        with app.app_context():
+            for _ in range(2):
+                value = db.session.execute('SHOW statement_timeout').scalar()
+                self.assertEqual(value, '1500ms')
+                db.session.commit()
+            db.session.remove()
+
+    def test_dropped_connections_are_replaced_on_checkout(self):
+        """Test pre-ping swaps a connection the server terminated"""
+        app = self.make_app(DATABASE_PRE_PING=True, DATABASE_POOL_SIZE=1)
+        with app.app_context():
+            pid = db.session.execute('SELECT pg_backend_pid()').scalar()
+            db.session.commit()
+            other = db.engine.pool._creator()
+            cursor = other.cursor()
+            cursor.execute('SELECT pg_terminate_backend(%s)', (pid,))
+            other.commit()
+            other.close()
+            new_pid = db.session.execute('SELECT pg_backend_pid()').scalar()
+            self.assertNotEqual(new_pid, pid)
+            db.session.remove()
+
+    def test_pgbouncer_mode_sets_the_timeout_per_transaction(self):
+        """Test PgBouncer mode keeps no pool and uses SET LOCAL"""
+        app = self.make_app(DATABASE_PGBOUNCER=True,
+                            DATABASE_STATEMENT_TIMEOUT=2500)
+        with app.app_context():
+            self.assertIsInstance(db.engine.pool, TimedNullPool)
+            value = db.session.execute('SHOW statement_timeout').scalar()
+            self.assertEqual(value, '2500ms')
+            db.session.remove()
+
+    def test_pool_wait_is_reported_in_server_timing(self):
+        """Test instrumentation shows the connection checkout as a stage"""
+        app = self.make_app(INSTRUMENTATION_ENABLED=True)
+        instrumentation.init_app(app)
+        with app.app_context():
+            db.drop_all()
+            db.create_all()
+        user = {'username': 'haddie', 'email': 'user@test.com',
+                'password': 'test1234'}
+        client = app.test_client()
+        client.post('/api/v1/auth/register', data=user)
+        res = client.post('/api/v1/auth/login', data=user)
+        self.assertIn('pool;dur=', res.headers['Server-Timing'])
+        self.assertIn('access_token', json.loads(res.data.decode()))
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+import unittest
+from app import create_app, db
+from app.models import Category, User, Recipe
+
+
+class IndexTestCase(unittest.TestCase):
+    """Test the hot lookups are served by indexes instead of table scans"""
+
+    def setUp(self):
+        self.app = create_app(config_name="testing")
+        with self.app.app_context():
+            db.session.close()
+            db.drop_all()
+            db.create_all()
+
+    def explain(self, query):
+        """Returns the query plan of a query as a single string."""
+        statement = query.statement.compile(
+            dialect=db.engine.dialect, compile_kwargs={'literal_binds': True})
+        if db.engine.dialect.name == 'postgresql':
+            # tiny test tables are cheaper to scan, so make the planner
+            # show whether an index can serve the query at all
+            db.session.execute('SET LOCAL enable_seqscan = off')
+            rows = db.session.execute('EXPLAIN {}'.format(statement))
+        else:
+            rows = db.session.execute('EXPLAIN QUERY PLAN {}'.format(statement))
+        return '\n'.join(str(row[-1]) for row in rows)
+
+    def assertUsesIndex(self, query, index_name):
+        plan = self.explain(query)
+        if db.engine.dialect.name == 'sqlite':
+            # sqlite names the index behind a unique constraint itself
+            self.assertIn('USING INDEX', plan)
+            self.assertNotIn('SCAN', plan)
+        else:
+            self.assertIn(index_name, plan)
+            self.assertNotIn('Seq Scan', plan)
+
+    def test_category_lookups_use_indexes(self):
+        """Test category name, id and listing lookups use indexes"""
+        with self.app.app_context():
+            self.assertUsesIndex(
+                Category.query.filter_by(name='Supper', created_by=1),
+                'uq_categories_created_by_name')
+            self.assertUsesIndex(
+                Category.query.filter(Category.created_by == 1).order_by(
+                    Category.date_created.desc(), Category.id.desc()),
+                'ix_categories_created_by_date_created')
+
+    def test_recipe_lookups_use_indexes(self):
+        """Test recipe title and listing lookups use indexes"""
+        with self.app.app_context():
+            self.assertUsesIndex(
+                Recipe.query.filter_by(title='fruit', category_identity=1),
+                'uq_recipes_category_identity_title')
+            self.assertUsesIndex(
+                Recipe.query.filter(Recipe.category_identity == 1).order_by(
+                    Recipe.id),
+                'ix_recipes_category_identity_id')
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,103 @@
+import unittest
+import json
+import re
+from flask import g
+from sqlalchemy.exc import DBAPIError
+from app import create_app, db
+from app.instrumentation import RequestTimer, instrumentation
+from app.metrics import MetricsRegistry
+
+
+class InstrumentationTestCase(unittest.TestCase):
+    """This class represents the request instrumentation test case"""
+
+    def setUp(self):
+        self.app = create_app(config_name="testing")
+        self.app.config['INSTRUMENTATION_ENABLED'] = True
+        instrumentation.init_app(self.app)
+        self.client = self.app.test_client
+        with self.app.app_context():
+            db.session.close()
+            db.drop_all()
+            db.create_all()
+
+    def auth_headers(self):
+        user = {'username': 'haddie', 'email': 'user@test.com',
+                'password': 'test1234'}
+        self.client().post('/api/v1/auth/register', data=user)
+        result = self.client().post('/api/v1/auth/login', data=user)
+        access_token = json.loads(result.data.decode())['access_token']
+        return dict(Authorization="Bearer " + access_token)
+
+    def test_requests_carry_server_timing(self):
+        """Test a timed request reports its stages and queries"""
+        headers = self.auth_headers()
+        self.client().post('/api/v1/categories/', headers=headers,
+                           data={'name': 'Supper'})
+        res = self.client().get('/api/v1/categories/', headers=headers)
+        timing = res.headers['Server-Timing']
+        for name in ('auth', 'serialize', 'db', 'total'):
+            self.assertRegex(timing, r'\b{};dur=\d+\.\d\d'.format(name))
+        queries = int(re.search(r'desc="(\d+) queries"', timing).group(1))
+        self.assertGreater(queries, 0)
+
+    def test_failed_queries_leave_no_timing_behind(self):
+        """Test a statement that fails leaves nothing behind for the next
+        statement on its connection to be timed from"""
+        with self.app.app_context():
+            g.request_timer = timer = RequestTimer()
+            with db.engine.connect() as connection:
+                with self.assertRaises(DBAPIError):
+                    connection.execute('SELECT * FROM no_such_table')
+                self.assertNotIn('query_started', connection.info)
+                connection.execute('SELECT 1')
+            self.assertEqual(timer.queries, 1)
+
+    def test_metrics_are_exposed_as_prometheus_text(self):
+        """Test /metrics renders the histograms and cache figures"""
+        headers = self.auth_headers()
+        self.client().get('/api/v1/categories/', headers=headers)
+        res = self.client().get('/metrics')
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(res.mimetype.startswith('text/plain'))
+        text = res.data.decode()
+        self.assertIn('# TYPE http_request_duration_seconds histogram', text)
+        self.assertIn('http_request_duration_seconds_count{endpoint='
+                      '"category.get_categories",method="GET",status="404"}'
+                      ' 1.0', text)
+        self.assertIn('http_request_db_queries_bucket{endpoint='
+                      '"category.get_categories",le="+Inf"} 1.0', text)
+        self.assertIn('token_cache_misses_total', text)
+        self.assertIn('response_cache_hit_ratio', text)
+
+    def test_instrumentation_is_opt_in(self):
+        """Test an app without instrumentation has no header or /metrics"""
+        app = create_app(config_name="testing")
+        res = app.test_client().post('/api/v1/auth/login', data={})
+        self.assertNotIn('Server-Timing', res.headers)
+        self.assertEqual(app.test_client().get('/metrics').status_code, 404)
+
+    def test_histogram_buckets_are_cumulative(self):
+        """Test observations land in every bucket at or above them"""
+        registry = MetricsRegistry()
+        histogram = registry.histogram('latency_seconds', 'Latency',
+                                       ('route',), buckets=(0.1, 1))
+        for value in (0.05, 0.1, 0.5, 3):
+            histogram.observe(value, 'home')
+        lines = registry.render().splitlines()
+        self.assertIn('latency_seconds_bucket{route="home",le="0.1"} 2.0',
+                      lines)
+        self.assertIn('latency_seconds_bucket{route="home",le="1.0"} 3.0',
+                      lines)
+        self.assertIn('latency_seconds_bucket{route="home",le="+Inf"} 4.0',
+                      lines)
+        self.assertIn('latency_seconds_sum{route="home"} 3.65', lines)
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+
+if __name__ == "__main__":
+    unittest.main()
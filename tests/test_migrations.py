@@ -0,0 +1,186 @@
+import unittest
+import hashlib
+import os
+from datetime import datetime, timedelta
+import jwt
+import sqlalchemy as sa
+from alembic.autogenerate import compare_metadata
+from alembic.migration import MigrationContext
+from flask_migrate import Migrate, stamp, upgrade
+from app import create_app, db
+from app.models import RevokedToken
+from app.search import include_object
+
+MIGRATIONS = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'migrations')
+BASELINE = '1a6f0c3e2b71'
+TRIGRAMS = '6a8d0f4b2c57'
+
+
+class MigrationTestCase(unittest.TestCase):
+    """Test a database of the release before migrations is upgraded in
+    place, with its rows carried over"""
+
+    def setUp(self):
+        self.app = create_app(config_name="testing")
+        Migrate(self.app, db)
+        with self.app.app_context():
+            self.drop_everything()
+            upgrade(directory=MIGRATIONS, revision=BASELINE)
+
+    def drop_everything(self):
+        db.session.remove()
+        db.drop_all()
+        db.engine.execute('DROP TABLE IF EXISTS alembic_version')
+
+    def table(self, table_name):
+        return sa.Table(table_name, sa.MetaData(), autoload=True,
+                        autoload_with=db.engine)
+
+    def insert(self, table_name, **values):
+        return db.engine.execute(
+            self.table(table_name).insert(), **values).inserted_primary_key[0]
+
+    def upgrade_past_trigrams(self, revision):
+        """Upgrades to a revision after the one installing pg_trgm, which
+        is stamped instead of run where the server lacks the extension.
+        """
+        if db.engine.dialect.name == 'postgresql' and not db.engine.execute(
+                "SELECT 1 FROM pg_available_extensions "
+                "WHERE name = 'pg_trgm'").first():
+            upgrade(directory=MIGRATIONS, revision='5f7c9e3a1b46')
+            stamp(directory=MIGRATIONS, revision=TRIGRAMS)
+        upgrade(directory=MIGRATIONS, revision=revision)
+
+    def token(self, user_id, expires):
+        return jwt.encode({'exp': expires, 'iat': datetime.utcnow(),
+                           'sub': user_id}, self.app.config['SECRET'],
+                          algorithm='HS256').decode()
+
+    def test_revoked_tokens_are_keyed_by_digest(self):
+        """Test stored tokens become digests with their expiry, so they
+        stay revoked"""
+        expires = datetime.utcnow().replace(microsecond=0) + timedelta(days=3)
+        with self.app.app_context():
+            token = self.token(1, expires)
+            self.insert('revoked_tokens', token=token,
+                        revoked_on=datetime.utcnow())
+            self.insert('revoked_tokens', token='not-a-jwt',
+                        revoked_on=datetime.utcnow())
+            upgrade(directory=MIGRATIONS, revision='2c8e4b7d9a13')
+            revoked = RevokedToken.query.one()
+            self.assertEqual(revoked.token_hash,
+                             hashlib.sha256(token.encode()).hexdigest())
+            self.assertEqual(revoked.expires_at, expires)
+            self.assertTrue(RevokedToken.check_revoked_token(token))
+            self.assertNotIn('token', self.table('revoked_tokens').c)
+
+    def test_duplicate_names_are_renamed_before_constraints(self):
+        """Test rows sharing a name with an older one are renamed, so the
+        unique constraints can be created and no row is lost"""
+        with self.app.app_context():
+            user = self.insert('users', username='haddie', password='-',
+                               email='user@test.com')
+            first = self.insert('categories', name='Supper', created_by=user)
+            second = self.insert('categories', name='Supper',
+                                 created_by=user)
+            for description in ('boil', 'fry'):
+                self.insert('recipes', title='Pilau', description=description,
+                            category_identity=first)
+            upgrade(directory=MIGRATIONS, revision='4e6b8d2f0a35')
+            names = db.engine.execute(
+                'SELECT name FROM categories ORDER BY id').fetchall()
+            self.assertEqual([name for name, in names],
+                             ['Supper', 'Supper ({})'.format(second)])
+            titles = db.engine.execute(
+                'SELECT title, description FROM recipes ORDER BY id')
+            self.assertEqual([tuple(row) for row in titles],
+                             [('Pilau', 'boil'), ('Pilau (2)', 'fry')])
+            with self.assertRaises(sa.exc.IntegrityError):
+                self.insert('categories', name='Supper', created_by=user)
+
+    def test_existing_recipes_are_searchable(self):
+        """Test recipes stored before full text search can be found"""
+        with self.app.app_context():
+            user = self.insert('users', username='haddie', password='-',
+                               email='user@test.com')
+            category = self.insert('categories', name='Supper',
+                                   created_by=user)
+            recipe = self.insert('recipes', title='Pilau',
+                                 description='simmer the rice',
+                                 category_identity=category)
+            upgrade(directory=MIGRATIONS, revision='5f7c9e3a1b46')
+            if db.engine.dialect.name == 'postgresql':
+                found = db.engine.execute(
+                    "SELECT id FROM recipes WHERE search_vector @@ "
+                    "to_tsquery('english', 'rice')")
+            else:
+                found = db.engine.execute(
+                    "SELECT rowid FROM recipes_fts "
+                    "WHERE recipes_fts MATCH 'rice'")
+            self.assertEqual([row_id for row_id, in found], [recipe])
+
+    def test_deletes_cascade_after_the_upgrade(self):
+        """Test the replaced foreign keys cascade and still hold, and the
+        search triggers survive SQLite's table copy"""
+        with self.app.app_context():
+            user = self.insert('users', username='haddie', password='-',
+                               email='user@test.com')
+            category = self.insert('categories', name='Supper',
+                                   created_by=user)
+            self.insert('recipes', title='Pilau', description='rice',
+                        category_identity=category)
+            self.upgrade_past_trigrams('7b9e1a5c3d68')
+            if db.engine.dialect.name == 'sqlite':
+                db.engine.execute(
+                    "INSERT INTO recipes (title, description, "
+                    "category_identity) VALUES ('Ugali', 'maize', {})".format(
+                        category))
+                found = db.engine.execute("SELECT count(*) FROM recipes_fts "
+                                          "WHERE recipes_fts MATCH 'maize'")
+                self.assertEqual(found.scalar(), 1)
+            with self.assertRaises(sa.exc.IntegrityError):
+                self.insert('recipes', title='Matoke', description='steam',
+                            category_identity=category + 1)
+            db.engine.execute('DELETE FROM users')
+            self.assertEqual(db.engine.execute(
+                'SELECT count(*) FROM recipes').scalar(), 0)
+
+    def test_counters_start_from_the_existing_rows(self):
+        """Test the counters are reconciled from the rows already stored,
+        and the triggers keep them current from then on"""
+        with self.app.app_context():
+            user = self.insert('users', username='haddie', password='-',
+                               email='user@test.com')
+            category = self.insert('categories', name='Supper',
+                                   created_by=user)
+            for title in ('Pilau', 'Ugali'):
+                self.insert('recipes', title=title, description='-',
+                            category_identity=category)
+            self.upgrade_past_trigrams('8c0f2a6e4d79')
+            self.insert('recipes', title='Matoke', description='-',
+                        category_identity=category)
+            self.insert('categories', name='Breakfast', created_by=user)
+            self.assertEqual(db.engine.execute(
+                'SELECT recipe_count FROM categories WHERE id = {}'.format(
+                    category)).scalar(), 3)
+            self.assertEqual(db.engine.execute(
+                'SELECT category_count FROM users').scalar(), 2)
+
+    def test_upgraded_schema_matches_the_models(self):
+        """Test autogenerate finds nothing to change after the upgrade, so
+        it never drops the search structures the models leave out"""
+        with self.app.app_context():
+            self.upgrade_past_trigrams('head')
+            with db.engine.connect() as connection:
+                context = MigrationContext.configure(
+                    connection, opts={'include_object': include_object})
+                self.assertEqual(compare_metadata(context, db.metadata), [])
+
+    def tearDown(self):
+        with self.app.app_context():
+            self.drop_everything()
+
+
+if __name__ == "__main__":
+    unittest.main()
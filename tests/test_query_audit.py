@@ -0,0 +1,116 @@
+import unittest
+import json
+from app import create_app, db
+from app.query_audit import (QueryBudgetExceeded, QueryReport, normalize,
+                             query_audit)
+
+
+class QueryAuditTestCase(unittest.TestCase):
+    """This class represents the query audit and budget test case"""
+
+    def setUp(self):
+        self.app = create_app(config_name="testing")
+        self.client = self.app.test_client
+        with self.app.app_context():
+            db.session.close()
+            db.drop_all()
+            db.create_all()
+
+    def auth_headers(self):
+        user = {'username': 'haddie', 'email': 'user@test.com',
+                'password': 'test1234'}
+        self.client().post('/api/v1/auth/register', data=user)
+        result = self.client().post('/api/v1/auth/login', data=user)
+        access_token = json.loads(result.data.decode())['access_token']
+        return dict(Authorization="Bearer " + access_token)
+
+    def test_recipe_views_stay_within_budget(self):
+        """Test the recipe views run no more queries than budgeted"""
+        headers = self.auth_headers()
+        self.client().post('/api/v1/categories/', headers=headers,
+                           data={'name': 'Supper'})
+        self.client().post('/api/v1/categories/1/recipes', headers=headers,
+                           data={'title': 'pilau', 'description': 'fry'})
+        budgets = self.app.config['QUERY_BUDGETS']
+        for url in ('/api/v1/categories/1/recipes/1',
+                    '/api/v1/categories/1/recipes', '/api/v1/recipes'):
+            res = self.client().get(url, headers=headers)
+            self.assertEqual(res.status_code, 200)
+            with self.app.app_context():
+                report = query_audit.last_report()
+            self.assertLessEqual(report.count, budgets[report.endpoint])
+            self.assertEqual(report.duplicates, [])
+            self.assertEqual(report.n_plus_one, [])
+        self.assertLessEqual(budgets['recipe.get_recipe_by_id'], 2)
+
+    def test_writes_take_one_statement_on_postgresql(self):
+        """Test RETURNING keeps each write to one or two statements"""
+        with self.app.app_context():
+            if db.engine.dialect.name != 'postgresql':
+                self.skipTest('RETURNING is only used on PostgreSQL')
+        headers = self.auth_headers()
+        requests = [
+            ('post', '/api/v1/categories/', {'name': 'Supper'}, 1),
+            ('put', '/api/v1/categories/1', {'name': 'Dinner'}, 1),
+            ('post', '/api/v1/categories/1/recipes',
+             {'title': 'pilau', 'description': 'fry'}, 1),
+            ('post', '/api/v1/categories/1/recipes',
+             {'title': 'pilau', 'description': 'fry'}, 2),
+            ('put', '/api/v1/categories/1/recipes/1',
+             {'title': 'rice', 'description': 'boil'}, 1),
+            ('delete', '/api/v1/categories/1/recipes/1', None, 1),
+            ('delete', '/api/v1/categories/1', None, 1),
+        ]
+        for method, url, data, statements in requests:
+            getattr(self.client(), method)(url, headers=headers, data=data)
+            with self.app.app_context():
+                report = query_audit.last_report()
+            self.assertEqual(report.count, statements, report.statements)
+
+    def test_exceeding_a_budget_fails_in_strict_mode(self):
+        """Test a query count regression raises instead of passing"""
+        headers = self.auth_headers()
+        self.client().post('/api/v1/categories/', headers=headers,
+                           data={'name': 'Supper'})
+        self.app.config['QUERY_BUDGETS'] = dict(
+            self.app.config['QUERY_BUDGETS'], **{
+                'category.get_category_by_id': 0})
+        with self.assertRaises(QueryBudgetExceeded):
+            self.client().get('/api/v1/categories/1', headers=headers)
+
+    def test_revocation_sync_is_not_counted(self):
+        """Test a revocation sync falling due in a request stays out of
+        its budget"""
+        headers = self.auth_headers()
+        self.client().post('/api/v1/categories/', headers=headers,
+                           data={'name': 'Supper'})
+        self.app.extensions['revocation_cache'].sync_interval = 0
+        res = self.client().get('/api/v1/categories/1', headers=headers)
+        self.assertEqual(res.status_code, 200)
+        with self.app.app_context():
+            report = query_audit.last_report()
+        self.assertEqual(report.count, 1, report.statements)
+
+    def test_duplicate_and_n_plus_one_queries_are_flagged(self):
+        """Test the report spots repeated statements"""
+        by_id = 'SELECT * FROM recipes WHERE id = ?'
+        log = [(by_id, (1,)), (by_id, (2,)), (by_id, (3,)),
+               ('SELECT * FROM users WHERE id = ?', (1,)),
+               ('SELECT * FROM users WHERE id = ?', (1,))]
+        report = QueryReport('recipe.get_recipes', 'GET', log, 3)
+        self.assertEqual(report.count, 5)
+        self.assertEqual(report.duplicates,
+                         ['SELECT * FROM users WHERE id = ?'])
+        self.assertEqual(report.n_plus_one, [by_id])
+        self.assertEqual(
+            normalize('SELECT 1 WHERE id IN (%(id_1)s,\n %(id_2)s)'),
+            normalize('SELECT 1 WHERE id IN (%(id_1)s)'))
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -54,6 +54,37 @@ class RecipeTestCase(unittest.TestCase):
         self.assertEqual(res.status_code, 201)
         self.assertIn('fruit', str(result.data))
 
+    def test_recipes_can_be_created_in_a_batch(self):
+        """Test API can create many recipes and report each one."""
+        self.register_user()
+        result = self.login_user()
+        access_token = json.loads(result.data.decode())['access_token']
+        headers = dict(Authorization="Bearer " + access_token)
+        self.client().post('/api/v1/categories/', headers=headers,
+                           data=self.category)
+        self.client().post('/api/v1/categories/1/recipes', headers=headers,
+                           data=self.recipe)
+        batch = {'recipes': [{'title': 'pilau', 'description': 'fry'},
+                             {'title': 'fruit', 'description': 'again'},
+                             {'title': 'matoke2', 'description': 'steam'},
+                             {'title': 'Pilau', 'description': 'twice'}]}
+        res = self.client().post('/api/v1/categories/1/recipes/batch?mode=atomic',
+                                 headers=headers, data=json.dumps(batch),
+                                 content_type='application/json')
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(json.loads(res.data.decode())['created'], 0)
+        res = self.client().post('/api/v1/categories/1/recipes/batch',
+                                 headers=headers, data=json.dumps(batch),
+                                 content_type='application/json')
+        self.assertEqual(res.status_code, 207)
+        data = json.loads(res.data.decode())
+        self.assertEqual([r['status'] for r in data['results']],
+                         [201, 400, 400, 400])
+        self.assertEqual(data['results'][0]['recipe']['title'], 'pilau')
+        res = self.client().get('/api/v1/categories/1/recipes',
+                                headers=headers)
+        self.assertEqual(json.loads(res.data.decode())['total_Items'], 2)
+
     def test_api_can_get_all_recipes(self):
         """Test API can get a recipe (GET request)."""
         self.register_user()
@@ -98,6 +129,31 @@ class RecipeTestCase(unittest.TestCase):
         self.assertEqual(res.status_code, 200)
         self.assertIn('fruit',str(res.data))
 
+    def test_api_can_get_recipes_by_cursor(self):
+        """Test API can walk all recipes with cursor pagination."""
+        self.register_user()
+        result = self.login_user()
+        access_token = json.loads(result.data.decode())['access_token']
+        headers = dict(Authorization="Bearer " + access_token)
+        self.client().post('/api/v1/categories/', headers=headers,
+                           data=self.category)
+        for title in ('fruit', 'pilau', 'matoke'):
+            self.client().post('/api/v1/categories/1/recipes',
+                               headers=headers,
+                               data={'title': title, 'description': 'mix'})
+        res = self.client().get('/api/v1/categories/1/recipes?limit=2&cursor=',
+                                headers=headers)
+        first = json.loads(res.data.decode())
+        self.assertEqual([r['recipe']['title'] for r in first['recipes']],
+                         ['fruit', 'pilau'])
+        res = self.client().get(
+            '/api/v1/categories/1/recipes?limit=2&cursor=' +
+            first['next_cursor'], headers=headers)
+        second = json.loads(res.data.decode())
+        self.assertEqual([r['recipe']['title'] for r in second['recipes']],
+                         ['matoke'])
+        self.assertIsNone(second['next_cursor'])
+
     def test_api_can_get_arecipe_by_q(self):
         """Test API can get a recipe by q search (GET request)."""
         self.register_user()
@@ -120,6 +176,66 @@ class RecipeTestCase(unittest.TestCase):
         self.assertEqual(res.status_code, 200)
         self.assertIn('fruit',str(res.data))
 
+    def test_recipe_search_is_stemmed_and_ranked(self):
+        """Test q runs a stemmed full text search ordered by relevance."""
+        self.register_user()
+        result = self.login_user()
+        access_token = json.loads(result.data.decode())['access_token']
+        headers = dict(Authorization="Bearer " + access_token)
+        self.client().post('/api/v1/categories/', headers=headers,
+                           data=self.category)
+        recipes = [('pilau', 'fry the onions then add rice'),
+                   ('onion soup', 'boil onions slowly'),
+                   ('fruit salad', 'cut the fruit')]
+        for title, description in recipes:
+            self.client().post('/api/v1/categories/1/recipes',
+                               headers=headers,
+                               data={'title': title,
+                                     'description': description})
+        res = self.client().get(
+            '/api/v1/categories/1/recipes?q=onion&order=relevance',
+            headers=headers)
+        titles = [r['recipe']['title']
+                  for r in json.loads(res.data.decode())['recipes']]
+        self.assertEqual(titles, ['onion soup', 'pilau'])
+        res = self.client().get('/api/v1/categories/1/recipes?q=fruits',
+                                headers=headers)
+        self.assertIn('fruit salad', str(res.data))
+        res = self.client().get('/api/v1/categories/1/recipes?q=sal',
+                                headers=headers)
+        self.assertIn('fruit salad', str(res.data))
+
+    def test_api_can_search_recipes_in_all_categories(self):
+        """Test API can search every category of a user in one request."""
+        self.register_user()
+        result = self.login_user()
+        access_token = json.loads(result.data.decode())['access_token']
+        headers = dict(Authorization="Bearer " + access_token)
+        for name in ('Supper', 'Lunch'):
+            self.client().post('/api/v1/categories/', headers=headers,
+                               data={'name': name})
+        self.client().post('/api/v1/categories/1/recipes', headers=headers,
+                           data={'title': 'onion soup', 'description': 'boil'})
+        self.client().post('/api/v1/categories/2/recipes', headers=headers,
+                           data={'title': 'pilau', 'description': 'fry onions'})
+        self.client().post('/api/v1/categories/2/recipes', headers=headers,
+                           data={'title': 'fruit', 'description': 'mix well'})
+        self.register_user(username="other", email="other@test.com")
+        other = json.loads(self.login_user(email="other@test.com").data.decode())
+        res = self.client().get('/api/v1/recipes?q=onion&facets=true',
+                                headers=headers)
+        self.assertEqual(res.status_code, 200)
+        data = json.loads(res.data.decode())
+        self.assertEqual(sorted(r['recipe']['title'] for r in data['recipes']),
+                         ['onion soup', 'pilau'])
+        self.assertEqual(data['facets'], [
+            {'id': 2, 'name': 'Lunch', 'count': 1},
+            {'id': 1, 'name': 'Supper', 'count': 1}])
+        res = self.client().get(
+            '/api/v1/recipes?q=onion',
+            headers=dict(Authorization="Bearer " + other['access_token']))
+        self.assertEqual(res.status_code, 404)
+
     def test_api_can_get_recipe_by_id(self):
         """Test API can get a single recipe by using it's id."""
         self.register_user()
@@ -142,6 +258,60 @@ class RecipeTestCase(unittest.TestCase):
         self.assertEqual(result.status_code, 200)
         self.assertIn('fruit',str(result.data))
 
+    def test_unchanged_recipe_answers_not_modified(self):
+        """Test a recipe GET with a current ETag gets a 304."""
+        self.register_user()
+        result = self.login_user()
+        access_token = json.loads(result.data.decode())['access_token']
+        headers = dict(Authorization="Bearer " + access_token)
+        self.client().post('/api/v1/categories/', headers=headers,
+                           data=self.category)
+        self.client().post('/api/v1/categories/1/recipes', headers=headers,
+                           data=self.recipe)
+        res = self.client().get('/api/v1/categories/1/recipes/1',
+                                headers=headers)
+        etag = res.headers['ETag']
+        res = self.client().get('/api/v1/categories/1/recipes/1',
+                                headers=dict(headers, **{'If-None-Match': etag}))
+        self.assertEqual(res.status_code, 304)
+        self.client().put('/api/v1/categories/1/recipes/1', headers=headers,
+                          data={'title': 'fruit', 'description': 'stir'})
+        res = self.client().get('/api/v1/categories/1/recipes/1',
+                                headers=dict(headers, **{'If-None-Match': etag}))
+        self.assertEqual(res.status_code, 200)
+        res = self.client().get('/api/v1/categories/1/recipes',
+                                headers=headers)
+        res = self.client().get('/api/v1/categories/1/recipes', headers=dict(
+            headers, **{'If-None-Match': res.headers['ETag']}))
+        self.assertEqual(res.status_code, 304)
+
+    def test_recipe_writes_invalidate_cached_listings(self):
+        """Test adding, editing and deleting recipes refreshes listings."""
+        self.register_user()
+        result = self.login_user()
+        access_token = json.loads(result.data.decode())['access_token']
+        headers = dict(Authorization="Bearer " + access_token)
+        self.client().post('/api/v1/categories/', headers=headers,
+                           data=self.category)
+        self.client().post('/api/v1/categories/1/recipes', headers=headers,
+                           data=self.recipe)
+        url = '/api/v1/categories/1/recipes'
+        self.client().get(url, headers=headers)
+        res = self.client().get(url, headers=headers)
+        self.assertEqual(res.headers['X-Cache'], 'HIT')
+        self.client().post(url, headers=headers,
+                           data={'title': 'matoke', 'description': 'steam'})
+        res = self.client().get(url, headers=headers)
+        self.assertEqual(res.headers['X-Cache'], 'MISS')
+        self.assertIn('matoke', str(res.data))
+        self.client().put(url + '/2', headers=headers,
+                          data={'title': 'githeri', 'description': 'boil'})
+        res = self.client().get(url, headers=headers)
+        self.assertIn('githeri', str(res.data))
+        self.client().delete(url + '/2', headers=headers)
+        res = self.client().get(url, headers=headers)
+        self.assertNotIn('githeri', str(res.data))
+
     def test_recipe_can_be_edited(self):
         """Test API can edit an existing recipe. (PUT request)"""
         self.register_user()
@@ -193,6 +363,36 @@ class RecipeTestCase(unittest.TestCase):
         result = self.client().get('/api/v1/categories/1/recipes/1',
          headers=dict(Authorization="Bearer " + access_token))
         self.assertEqual(result.status_code, 400)
+    def test_recipes_of_other_users_are_left_alone(self):
+        """Test writes to another user's recipe change nothing"""
+        self.register_user()
+        owner = json.loads(self.login_user().data.decode())['access_token']
+        owner = dict(Authorization="Bearer " + owner)
+        self.client().post('/api/v1/categories/', headers=owner,
+                           data=self.category)
+        self.client().post('/api/v1/categories/1/recipes', headers=owner,
+                           data=self.recipe)
+        self.register_user('mallory', 'mallory@test.com')
+        other = json.loads(self.login_user(
+            'mallory@test.com').data.decode())['access_token']
+        other = dict(Authorization="Bearer " + other)
+        res = self.client().put('/api/v1/categories/1/recipes/1',
+                                headers=other,
+                                data={'title': 'salads', 'description': 'x'})
+        self.assertEqual(res.status_code, 400)
+        res = self.client().delete('/api/v1/categories/1/recipes/1',
+                                   headers=other)
+        self.assertEqual(res.status_code, 400)
+        res = self.client().post('/api/v1/categories/1/recipes',
+                                 headers=other, data={'title': 'salads'})
+        self.assertEqual(res.status_code, 400)
+        res = self.client().delete('/api/v1/categories/1', headers=other)
+        self.assertEqual(res.status_code, 404)
+        res = self.client().get('/api/v1/categories/1/recipes/1',
+                                headers=owner)
+        self.assertIn('fruit', str(res.data))
+        self.assertIn('mix well', str(res.data))
+
     def test_deleting_a_recipe_that_doesnot_exist(self):
         self.register_user()
         result = self.login_user()
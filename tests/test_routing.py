@@ -0,0 +1,138 @@
+import unittest
+import json
+import os
+import shutil
+import tempfile
+from flask import Flask
+from app import create_app, db
+from app.models import Category, User
+
+
+class ReplicaRoutingTestCase(unittest.TestCase):
+    """Test read only views are routed to replicas, with two SQLite
+    files standing in for the primary and its replica
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.app = self.make_app(['replica'])
+        self.client = self.app.test_client
+        with self.app.app_context():
+            db.session.remove()
+            db.create_all()
+            # nothing replicates here, so the replica gets its own rows
+            db.Model.metadata.create_all(
+                bind=db.get_engine(self.app, bind='replica'))
+            db.get_engine(self.app, bind='replica').execute(
+                User.__table__.insert(), id=1, username='haddie',
+                email='user@test.com', password='-')
+        self.headers = self.auth_headers()
+
+    def make_app(self, replicas, **config):
+        app = create_app(config_name="testing")
+        app.config.update(dict({
+            'SQLALCHEMY_DATABASE_URI': self.sqlite('primary'),
+            'SQLALCHEMY_BINDS': dict((name, self.sqlite(name))
+                                     for name in replicas),
+            'DATABASE_REPLICAS': replicas,
+            'QUERY_AUDIT_STRICT': False,
+        }, **config))
+        return app
+
+    def sqlite(self, name):
+        return 'sqlite:///' + os.path.join(self.directory, name + '.db')
+
+    def auth_headers(self):
+        user = {'username': 'haddie', 'email': 'user@test.com',
+                'password': 'test1234'}
+        self.client().post('/api/v1/auth/register', data=user)
+        result = self.client().post('/api/v1/auth/login', data=user)
+        access_token = json.loads(result.data.decode())['access_token']
+        return dict(Authorization="Bearer " + access_token)
+
+    def add_to_replica(self, name):
+        with self.app.app_context():
+            engine = db.get_engine(self.app, bind='replica')
+            engine.execute(Category.__table__.insert(),
+                           name=name, created_by=1)
+
+    def category_names(self):
+        res = self.client().get('/api/v1/categories/', headers=self.headers)
+        self.assertEqual(res.status_code, 200)
+        return [item['cat']['name'] for item in
+                json.loads(res.data.decode())['categories']]
+
+    def test_reads_go_to_the_replica(self):
+        """Test a read only view answers from the replica"""
+        self.add_to_replica('replica copy')
+        self.assertEqual(self.category_names(), ['replica copy'])
+
+    def test_writers_read_their_writes_from_the_primary(self):
+        """Test a user who just wrote reads from the primary"""
+        self.add_to_replica('replica copy')
+        res = self.client().post('/api/v1/categories/', headers=self.headers,
+                                 data={'name': 'supper'})
+        self.assertEqual(res.status_code, 201)
+        self.assertEqual(self.category_names(), ['Supper'])
+        with self.app.app_context():
+            self.app.extensions['db_routing'].backend.entries.clear()
+        res = self.client().post('/api/v1/categories/1/recipes/batch',
+                                 headers=self.headers,
+                                 data=json.dumps({'recipes': [
+                                     {'title': 'pilau'}]}),
+                                 content_type='application/json')
+        self.assertEqual(res.status_code, 201)
+        self.assertEqual(self.category_names(), ['Supper'])
+        self.app.config['DATABASE_READ_YOUR_WRITES'] = 0
+        self.client().post('/api/v1/categories/', headers=self.headers,
+                           data={'name': 'lunch'})
+        self.assertEqual(self.category_names(), ['replica copy'])
+
+    def test_replicas_take_turns_and_skip_unhealthy_ones(self):
+        """Test round robin routing leaves out a replica that is down"""
+        app = self.make_app(['replica', 'second', 'broken'])
+        app.config['SQLALCHEMY_BINDS']['broken'] = 'sqlite:///{}'.format(
+            os.path.join(self.directory, 'missing', 'broken.db'))
+        with app.app_context():
+            routing = app.extensions['db_routing']
+            chosen = [routing.choose() for _ in range(4)]
+            self.assertEqual(chosen, ['replica', 'second', 'replica',
+                                      'second'])
+            self.assertFalse(routing.health['broken'][0])
+
+    def test_reads_fall_back_to_the_primary(self):
+        """Test the primary answers when no replica is healthy"""
+        app = self.make_app(['broken'])
+        app.config['SQLALCHEMY_BINDS']['broken'] = 'sqlite:///{}'.format(
+            os.path.join(self.directory, 'missing', 'broken.db'))
+        res = app.test_client().get('/api/v1/categories/',
+                                    headers=self.headers)
+        self.assertEqual(res.status_code, 404)
+        with app.app_context():
+            self.assertFalse(app.extensions['db_routing'].health['broken'][0])
+
+    def test_workers_must_share_the_routing_backend(self):
+        """Test replicas with several workers refuse a per process store"""
+        app = Flask(__name__)
+        app.config.update({
+            'SQLALCHEMY_DATABASE_URI': self.sqlite('primary'),
+            'SQLALCHEMY_BINDS': {'replica': self.sqlite('replica')},
+            'SQLALCHEMY_TRACK_MODIFICATIONS': False,
+            'DATABASE_REPLICAS': ['replica'],
+            'WEB_CONCURRENCY': 2,
+        })
+        with self.assertRaises(ValueError):
+            db.init_app(app)
+        app.config['WEB_CONCURRENCY'] = 1
+        db.init_app(app)
+        self.assertIn('db_routing', app.extensions)
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.session.remove()
+            db.get_engine(self.app).dispose()
+        shutil.rmtree(self.directory)
+
+
+if __name__ == "__main__":
+    unittest.main()
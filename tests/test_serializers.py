@@ -0,0 +1,58 @@
+import unittest
+import json
+from datetime import datetime
+from flask import jsonify
+from app import create_app
+from app.models import Recipe
+from app.serializers import BACKENDS, RECIPE_PLAN, dumps, json_response
+
+
+class SerializerTestCase(unittest.TestCase):
+    """This class represents the fast json serializer test case"""
+
+    def setUp(self):
+        self.app = create_app(config_name="testing")
+        self.recipe = Recipe(title='pilau', description='fry the rice',
+                             category_identity=1)
+        self.recipe.id = 1
+        self.recipe.date_created = datetime(2026, 2, 1, 8, 5, 3, 120)
+        self.recipe.date_modified = datetime(2026, 3, 9, 17, 45, 0)
+
+    def test_field_plan_matches_jsonify(self):
+        """Test a planned row encodes to the same json jsonify produced"""
+        raw = {'id': 1, 'title': 'pilau', 'description': 'fry the rice',
+               'date_created': self.recipe.date_created,
+               'date_modified': self.recipe.date_modified,
+               'category_identity': 1}
+        with self.app.test_request_context():
+            expected = json.loads(jsonify(raw).get_data(as_text=True))
+            for backend in BACKENDS:
+                self.assertEqual(json.loads(dumps(
+                    RECIPE_PLAN.dump(self.recipe), backend=backend)),
+                    expected)
+            res = json_response({'recipe': self.recipe.json()}, status=201)
+        self.assertEqual(res.status_code, 201)
+        self.assertEqual(res.mimetype, 'application/json')
+        self.assertEqual(json.loads(res.get_data(as_text=True))['recipe'],
+                         expected)
+
+    def test_unplanned_dates_are_http_dates(self):
+        """Test a datetime no plan formatted encodes the same way on
+        every backend with a default hook"""
+        payload = {'date_created': self.recipe.date_created}
+        with self.app.test_request_context():
+            expected = json.loads(jsonify(payload).get_data(as_text=True))
+            for backend in BACKENDS:
+                if backend != 'ujson':
+                    self.assertEqual(json.loads(
+                        dumps(payload, backend=backend)), expected)
+
+    def test_unknown_backend_is_rejected(self):
+        """Test asking for a backend that is not installed fails loudly"""
+        with self.app.app_context():
+            with self.assertRaises(ValueError):
+                dumps({}, backend='simdjson')
+
+
+if __name__ == "__main__":
+    unittest.main()